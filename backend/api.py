@@ -1,351 +1,788 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, g, request, jsonify
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
-from werkzeug.utils import secure_filename
 import os
 import json
-from datetime import datetime
-
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+import logging
+import time
+from dataset_store import DatasetStore
+from comparison import (
+    FrameSlots, compare_slots, comparison_records
+)
+from serialization import (
+    ARROW_MIMETYPE, FORMATS, LAYOUTS, NDJSON_MIMETYPE, encode_frame, head, iter_arrow_ipc, iter_ndjson
+)
+from ingest import TRAFFIC, merge_frames, tag_source
+from schema import columnar_roles, compact_frame, infer_schema, parse_counts, schema_timestamps
+from parse_cache import ParseCache, file_digest
+from columnar_store import ColumnarStore, epoch_day
+from rollups import day_positions
+from baselines import (
+    ANOMALY_THRESHOLD, BASELINE_WEEKS, MIN_WEEKS, PERCENTILES, STATS, WEEKDAYS, baseline_stats, score_days,
+    trailing_windows, weekday
+)
+from jobs import JobManager
+from queries import TrafficQuery
+from time_buckets import DEFAULT_BUCKETS, TimeBuckets
+from highlight_rules import build_rules, history_weeks, rule_legend, trailing_history
+from negotiation import compress_response, encode_payload, negotiate_format
+from instrumentation import (
+    METRICS, configure_logging, profile_summary, rss_bytes, server_timing, stage, stage_summary, start_profiler
+)
+from pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor, query_signature, select_positions
+)
 
 # Configuration
-UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'xlsx'}
+MAX_CONTENT_LENGTH = 200 * 1024 * 1024  # 200MB max file size
+
+# All endpoints live on this blueprint; create_app() registers it
+bp = Blueprint('api', __name__)
+
+logger = logging.getLogger(__name__)
+
+# Parsed uploads are kept server-side so /api/compare only needs a dataset ID
+DATASET_TTL_SECONDS = int(os.environ.get('DATASET_TTL_SECONDS', 3600))
+DATASET_MEMORY_BUDGET = int(os.environ.get('DATASET_MEMORY_BUDGET_MB', 1024)) * 1024 * 1024
+
+dataset_store = DatasetStore(max_bytes=DATASET_MEMORY_BUDGET, ttl_seconds=DATASET_TTL_SECONDS)
+
+# Parsed workbooks are cached on disk by content hash so re-uploads skip parsing
+PARSE_CACHE_DIR = os.environ.get('PARSE_CACHE_DIR', 'parse_cache')
+PARSE_CACHE_MAX_BYTES = int(os.environ.get('PARSE_CACHE_MAX_MB', 2048)) * 1024 * 1024
+
+parse_cache = ParseCache(PARSE_CACHE_DIR, max_bytes=PARSE_CACHE_MAX_BYTES)
+
+# Ingested counts are persisted as memory-mapped columns for date lookups; they
+# outlive the in-memory copy but are deleted after a week unused or over budget
+COLUMNAR_STORE_DIR = os.environ.get('COLUMNAR_STORE_DIR', 'traffic_store')
+COLUMNAR_STORE_TTL_SECONDS = int(os.environ.get('COLUMNAR_STORE_TTL_SECONDS', 7 * 24 * 3600))
+COLUMNAR_STORE_MAX_BYTES = int(os.environ.get('COLUMNAR_STORE_MAX_MB', 10240)) * 1024 * 1024
+
+columnar_store = ColumnarStore(COLUMNAR_STORE_DIR, ttl_seconds=COLUMNAR_STORE_TTL_SECONDS,
+                               max_bytes=COLUMNAR_STORE_MAX_BYTES)
+
+# Columns added to parsed frames; rebuilt frames derive them from the timestamp
+DERIVED_COLUMNS = ('Date', 'Time', 'Hour')
+
+# Uploads sent with ?async=1 are parsed on a process pool
+JOBS_DIR = os.environ.get('JOBS_DIR', 'jobs')
+INGEST_WORKERS = int(os.environ['INGEST_WORKERS']) if os.environ.get('INGEST_WORKERS') else None
 
-# Create upload directory if it doesn't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+jobs = JobManager(JOBS_DIR, max_workers=INGEST_WORKERS)
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 200 * 1024 * 1024  # 200MB max file size
+# gzip/brotli JSON, MessagePack, NDJSON and Arrow bodies per Accept-Encoding
+COMPRESS_RESPONSES = os.environ.get('COMPRESS_RESPONSES', '1') != '0'
+
+# Formats /api/datasets/<id>/rows can answer in (JSON first: the default)
+ROW_FORMATS = FORMATS + ('msgpack',)
+
+# Upper bound on dates per /api/compare/batch request
+MAX_BATCH_DATES = 366
+
+# ?profile=1 adds a cProfile summary to JSON responses; off unless ALLOW_PROFILING=1,
+# since any client could otherwise make the server profile its requests
+ALLOW_PROFILING = os.environ.get('ALLOW_PROFILING', '0') != '0'
+# Requests slower than this are logged as warnings with their stage timings
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 5))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def process_excel_data(data):
-    """Process Excel data similar to the original Streamlit logic"""
+def process_excel_data(data, layout='records', traffic_columns=None, include_data=False, append_to=None):
+    """Process Excel data similar to the original Streamlit logic
+
+    data is either a parsed DataFrame (used as-is, without copying) or a
+    list of row dicts from older callers. layout selects how rows are
+    returned: 'records' (list of row objects) or 'columns'
+    ({"columns": [...], "data": {column: [values]}}). traffic_columns is the
+    role -> column mapping found at ingest, kept with the stored dataset.
+    Only metadata and the preview rows are returned unless include_data is
+    set; clients page through rows with /api/datasets/<id>/rows. With
+    append_to, the rows are merged into that stored dataset instead.
+    """
     try:
-        # Convert to DataFrame
-        df = pd.DataFrame(data)
+        # Convert to DataFrame unless the caller already parsed one
+        df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
         
         if df.empty:
             return {"error": "Excel file appears to be empty"}
         
-        # Debug: Print column info
-        print(f"DataFrame shape: {df.shape}")
-        print(f"Columns: {df.columns.tolist()}")
-        print(f"First few rows:")
-        print(df.head())
-        print(f"Data types:")
-        print(df.dtypes)
-        
-        # Use column C (index 2) as the time column if available
-        if len(df.columns) > 2:
-            time_col = df.columns[2]
-            # Convert to datetime with error handling
-            try:
-                df[time_col] = pd.to_datetime(df[time_col], errors='coerce')
-                
-                # Extract date and time components
-                df['Date'] = df[time_col].dt.date
-                df['Time'] = df[time_col].dt.time
-                df['Hour'] = df[time_col].dt.hour
-            except:
-                # If datetime conversion fails, try to find date/time columns
-                date_cols = [col for col in df.columns if any(name in col.lower() for name in ['date', 'day'])]
-                time_cols = [col for col in df.columns if any(name in col.lower() for name in ['time', 'hour'])]
-                
-                if date_cols and time_cols:
-                    try:
-                        df['Date'] = pd.to_datetime(df[date_cols[0]], errors='coerce').dt.date
-                        df['Time'] = pd.to_datetime(df[time_cols[0]], errors='coerce').dt.time
-                        df['Hour'] = pd.to_datetime(df[time_cols[0]], errors='coerce').dt.hour
-                    except:
-                        # Fallback: create dummy date/time columns
-                        df['Date'] = '2024-01-01'
-                        df['Time'] = '08:00:00'
-                        df['Hour'] = 8
-                else:
-                    # Fallback: create dummy date/time columns
-                    df['Date'] = '2024-01-01'
-                    df['Time'] = '08:00:00'
-                    df['Hour'] = 8
-        else:
-            # Try to find date/time columns with common names
-            date_cols = [col for col in df.columns if any(name in col.lower() for name in ['date', 'day'])]
-            time_cols = [col for col in df.columns if any(name in col.lower() for name in ['time', 'hour'])]
+        logger.debug("DataFrame shape: %s, columns: %s", df.shape, df.columns.tolist())
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("First few rows:\n%s\nData types:\n%s", df.head(), df.dtypes)
+        
+        with stage('datetime', rows=len(df)):
+            # Timestamp (or date and time) and count columns, resolved once with explicit formats
+            schema = infer_schema(df, traffic_columns)
+            timestamps = schema_timestamps(df, schema)
+            if timestamps is None:
+                return {"error": "No timestamp column (or Date and Time columns) found in the file"}
+            time_col = schema["timestamp"]
+            if time_col is not None:
+                df[time_col] = timestamps
+            parse_counts(df, schema)
             
-            if date_cols and time_cols:
-                try:
-                    df['Date'] = pd.to_datetime(df[date_cols[0]], errors='coerce').dt.date
-                    df['Time'] = pd.to_datetime(df[time_cols[0]], errors='coerce').dt.time
-                    df['Hour'] = pd.to_datetime(df[time_cols[0]], errors='coerce').dt.hour
-                except:
-                    # Fallback: create dummy date/time columns
-                    df['Date'] = '2024-01-01'
-                    df['Time'] = '08:00:00'
-                    df['Hour'] = 8
-            else:
-                # Fallback: create dummy date/time columns
-                df['Date'] = '2024-01-01'
-                df['Time'] = '08:00:00'
-                df['Hour'] = 8
+            # Extract date and time components
+            df['Date'] = timestamps.dt.date
+            df['Time'] = timestamps.dt.time
+            df['Hour'] = timestamps.dt.hour
+        
+        # Columns persisted to the columnar store, when there is a timestamp and both counts
+        store_columns = columnar_roles(schema)
         
         # Filter for business hours (8am to 8pm)
-        df_filtered = df[(df['Hour'] >= 8) & (df['Hour'] < 20)]
-        
-        # Convert to JSON-serializable format
-        processed_data = []
-        for _, row in df_filtered.iterrows():
-            processed_row = {}
-            for col in df_filtered.columns:
-                value = row[col]
-                # Convert non-serializable types
-                if isinstance(value, pd.Timestamp):
-                    processed_row[col] = value.strftime('%Y-%m-%d %H:%M:%S')
-                elif isinstance(value, datetime):
-                    processed_row[col] = value.strftime('%Y-%m-%d')
-                elif isinstance(value, (np.integer, np.floating)):
-                    processed_row[col] = int(float(value)) if np.isfinite(value) else None
-                elif pd.isna(value):
-                    processed_row[col] = None
-                else:
-                    processed_row[col] = str(value)
-            processed_data.append(processed_row)
+        with stage('filter', rows=len(df)):
+            df_filtered = df[DEFAULT_BUCKETS.in_hours(df['Hour'])]
+            if store_columns is not None and not df_filtered[time_col].is_monotonic_increasing:
+                # Timestamp order, like the columnar store, so frames rebuilt from it page the same
+                df_filtered = df_filtered.sort_values(time_col, kind='stable').reset_index(drop=True)
+        
+        appended_dates = None
+        columns = None
+        if append_to is None:
+            # Codes and narrow integers instead of boxed dates, times and labels
+            with stage('compact', rows=len(df_filtered)):
+                uncompacted_bytes = int(df_filtered.memory_usage(index=True, deep=True).sum())
+                df_filtered = compact_frame(df_filtered, schema)
+            
+            with stage('store', rows=len(df)):
+                # Keep the filtered frame server-side for later comparisons
+                dataset_id = dataset_store.put(df_filtered, {
+                    "traffic_columns": traffic_columns or {},
+                    "schema": schema,
+                    "uncompacted_bytes": uncompacted_bytes,
+                    "store_version": 1 if store_columns is not None else None,
+                })
+                
+                # Persist every parsed row to the columnar store
+                if store_columns is not None:
+                    columnar_store.write(dataset_id, df, store_columns,
+                                         extra_columns=stored_extras(df, store_columns), schema=schema)
+        else:
+            if store_columns is None:
+                return {"error": "Appended file needs a timestamp and Customer In/Out columns"}
+            dataset_id = append_to
+            with stage('store', rows=len(df)):
+                appended_dates = columnar_store.append(dataset_id, df, store_columns,
+                                                       extra_columns=stored_extras(df, store_columns))
+                stored = columnar_store.open(dataset_id)
+                if appended_dates is None or stored is None:
+                    return {"error": "Dataset not found or expired. Please upload the file again."}
+                merged = append_rows(dataset_id, df_filtered, store_columns, stored.version)
+                if merged is not None:
+                    df_filtered = merged
+                elif include_data:
+                    df_filtered = load_dataset(dataset_id).frame
+                elif stored.meta.get('columns'):
+                    # Columns the dataset will have once load_dataset rebuilds it
+                    columns = stored.meta['columns'] + list(DERIVED_COLUMNS)
+        
+        if columns is None:
+            columns = df_filtered.columns
+        
+        # Convert to JSON-serializable format, a whole column at a time
+        with stage('serialize', rows=len(df_filtered) if include_data else 10):
+            processed_data = encode_frame(df_filtered, layout) if include_data else None
+            preview_data = head(processed_data, 10) if include_data else encode_frame(df_filtered.head(10), layout)
         
         # Extract available dates
         available_dates = [str(date) for date in df_filtered['Date'].unique() if pd.notna(date)]
         available_dates.sort()
         
-        return {
+        filtered_records = original_records = None
+        if appended_dates is not None and stored.rollup is not None:
+            # Counts of the whole merged dataset, from the store every worker shares
+            business_rows = stored.rollup["business_rows"]
+            available_dates = [str(day) for day in stored.rollup["days"][business_rows > 0].astype('datetime64[D]')]
+            filtered_records, original_records = int(business_rows.sum()), len(stored)
+        
+        result = {
             "success": True,
-            "data": processed_data,
+            "dataset_id": dataset_id,
+            "expires_in": DATASET_TTL_SECONDS,
+            "layout": layout,
             "available_dates": available_dates,
-            "total_records": len(processed_data),
-            "filtered_records": len(processed_data),
-            "original_records": len(df),
-            "preview_data": processed_data[:10] if len(processed_data) > 10 else processed_data  # Show first 10 rows
+            "total_records": filtered_records if filtered_records is not None else len(df_filtered),
+            "filtered_records": filtered_records if filtered_records is not None else len(df_filtered),
+            "original_records": original_records if original_records is not None else len(df),
+            "columns": [str(col) for col in columns],
+            "rows_url": f"/api/datasets/{dataset_id}/rows",
+            "schema": schema,
         }
+        if appended_dates is not None:
+            result["appended_dates"] = appended_dates
+        if include_data:
+            result["data"] = processed_data
+        result["preview_data"] = preview_data  # Show first 10 rows
+        return result
         
     except Exception as e:
         return {"error": f"Error processing data: {str(e)}"}
 
-@app.route('/api/health', methods=['GET'])
+def stored_extras(df, store_columns):
+    """Upload columns the columnar store keeps besides its role columns, so
+    frames rebuilt from it have every column of the uploaded frame"""
+    roles = set(store_columns.values())
+    return [name for name in df.columns if name not in roles and name not in DERIVED_COLUMNS]
+
+def load_dataset(dataset_id):
+    """The in-memory dataset for an ID, rebuilt from the columnar store when this
+    worker does not hold it (another worker took the upload, or it expired)
+
+    Rebuilt frames hold the uploaded columns plus Date, Time and Hour,
+    business hours only, in timestamp order like uploaded frames. An in-memory copy older than the stored
+    dataset (another worker appended to it) is rebuilt too. Returns None if
+    the dataset is in neither store.
+    """
+    dataset = dataset_store.get(dataset_id)
+    if dataset is not None:
+        version = dataset.meta.get('store_version')
+        if version is None or columnar_store.version(dataset_id) in (None, version):
+            return dataset
+    stored = columnar_store.open(dataset_id)
+    if stored is None:
+        return dataset
+    
+    with stage('rebuild', rows=len(stored)):
+        traffic_columns = stored.meta.get('traffic_columns') or {}
+        frame = stored.frame()
+        schema = stored.meta.get('schema') or infer_schema(frame, traffic_columns)
+        timestamps = frame[schema["timestamp"]]
+        frame['Date'] = timestamps.dt.date
+        frame['Time'] = timestamps.dt.time
+        frame['Hour'] = timestamps.dt.hour
+        frame = frame[DEFAULT_BUCKETS.in_hours(frame['Hour'])].reset_index(drop=True)
+        frame = compact_frame(frame, schema)
+    dataset_store.put(frame, {
+        "traffic_columns": traffic_columns,
+        "schema": schema,
+        "store_version": stored.version,
+    }, dataset_id=dataset_id)
+    return dataset_store.get(dataset_id)
+
+def append_rows(dataset_id, df, store_columns, version):
+    """Merge new business-hours rows into the in-memory copy of a dataset
+
+    version is the stored dataset's version after the append. Only stored
+    rows on the days of the new rows are checked for duplicates: those with
+    the same site, sensor and timestamp as a new row are dropped. The new rows
+    are compacted on their own, with categories unioned into the stored
+    frame's, and placed by timestamp, so the cost follows the new rows and
+    the affected days rather than the whole history. Without an in-memory
+    copy of the version just before it, the copy is dropped and load_dataset
+    rebuilds it from the columnar store on its next use. Returns the merged
+    frame, or None when there was no current copy.
+    """
+    dataset = dataset_store.get(dataset_id)
+    if dataset is None or dataset.meta.get('store_version') != version - 1:
+        dataset_store.delete(dataset_id)
+        return None
+    frame = dataset.frame
+    schema = dataset.meta.get('schema')
+    
+    # Line the new file's role columns up with the stored frame's names
+    roles = dict(dataset.meta.get('traffic_columns') or {})
+    roles.setdefault('timestamp', store_columns['timestamp'])
+    df = df.rename(columns={
+        name: roles[role] for role, name in store_columns.items()
+        if roles.get(role) and name != roles[role] and name in df.columns
+    })
+    time_col = roles['timestamp']
+    keys = [roles[role] for role in ('site', 'sensor', 'timestamp')
+            if roles.get(role) in df.columns and roles.get(role) in frame.columns]
+    
+    # New rows in timestamp order, later duplicates winning
+    df = df[~df.duplicated(subset=keys, keep='last')]
+    if not df[time_col].is_monotonic_increasing:
+        df = df.sort_values(time_col, kind='stable')
+    new_ts = df[time_col].to_numpy(dtype='datetime64[ns]')
+    stored_ts = frame[time_col].to_numpy(dtype='datetime64[ns]')
+    
+    # Stored rows on the new rows' days (the frame is in timestamp order) that a new row replaces
+    new_days = np.unique(new_ts.astype('datetime64[D]'))
+    bounds = np.searchsorted(stored_ts, np.stack([new_days, new_days + np.timedelta64(1, 'D')]))
+    touched = np.concatenate([np.arange(start, stop) for start, stop in bounds.T] + [np.zeros(0, dtype=np.int64)])
+    candidates = pd.concat([frame[keys].iloc[touched], df[keys]], ignore_index=True, sort=False)
+    replaced = touched[candidates.duplicated(keep='last').to_numpy()[:len(touched)]]
+    kept = np.setdiff1d(np.arange(len(frame)), replaced)
+    
+    frame, new = _align_categories(frame, compact_frame(df.reset_index(drop=True), schema))
+    # Derived columns stay last, as in frames rebuilt from the store
+    names = [name for name in frame.columns if name not in DERIVED_COLUMNS]
+    names += [name for name in new.columns if name not in frame.columns and name not in DERIVED_COLUMNS]
+    names += [name for name in DERIVED_COLUMNS if name in frame.columns or name in new.columns]
+    merged = pd.concat([frame.iloc[kept], new], ignore_index=True, sort=False).reindex(columns=names)
+    
+    # Each new row goes after the kept rows with the same or an earlier timestamp
+    kept_ts = stored_ts[kept]
+    if len(kept_ts) and len(new_ts) and new_ts[0] < kept_ts[-1]:
+        position = np.searchsorted(kept_ts, new_ts, side='right') + np.arange(len(new_ts))
+        order = np.empty(len(merged), dtype=np.int64)
+        is_new = np.zeros(len(merged), dtype=bool)
+        is_new[position] = True
+        order[position] = np.arange(len(kept_ts), len(merged))
+        order[~is_new] = np.arange(len(kept_ts))
+        merged = merged.take(order).reset_index(drop=True)
+    
+    # Fresh meta: cached sort orders and filters belong to the old rows
+    dataset_store.update(dataset_id, merged, {
+        "traffic_columns": dataset.meta.get('traffic_columns') or {},
+        "schema": schema,
+        "store_version": version,
+    })
+    return merged
+
+def _align_categories(frame, new):
+    """(frame, new) with frame's categorical columns categoricals in both, on
+    the sorted union of their categories; frame's codes are only rewritten
+    when a new category sorts before an existing one. The inputs are not
+    modified."""
+    frame = frame.copy(deep=False)
+    new = new.copy(deep=False)
+    for name in frame.columns:
+        if not isinstance(frame[name].dtype, pd.CategoricalDtype):
+            continue
+        stored = frame[name].cat.categories
+        values = new[name] if name in new.columns else pd.Series(index=new.index, dtype=object)
+        added = pd.Index(values.dropna().unique()).difference(stored)
+        if len(added):
+            categories = stored.append(added).sort_values()
+            if categories[:len(stored)].equals(stored):
+                frame[name] = frame[name].cat.add_categories(added.sort_values())
+            else:
+                frame[name] = frame[name].cat.set_categories(categories)
+        new[name] = pd.Categorical(values, categories=frame[name].cat.categories)
+    return frame, new
+
+@bp.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({"status": "healthy", "message": "Traffic Analytics API is running"})
 
-@app.route('/api/upload', methods=['POST'])
+def ingest_uploads(sources, usecols, job_id=None):
+    """Parse uploads (reusing cached parses) and merge them into one frame
+
+    sources are dicts with the file name, parse cache key, cached parse (or
+    None) and, for cache misses, the request stream or a spooled path.
+    Spooled files are removed.
+    """
+    start = time.perf_counter()
+    try:
+        missing = [source for source in sources if source["cached"] is None]
+        if missing:
+            with stage('parse') as record:
+                parsed = jobs.parse_files([source["path"] or source["stream"] for source in missing], usecols, job_id)
+                record["rows"] = sum(len(df) for df, _ in parsed)
+            for source, (df, stats) in zip(missing, parsed):
+                parse_cache.put(source["key"], df, stats)
+                source["cached"] = (df, stats)
+    finally:
+        for source in sources:
+            if source["path"]:
+                os.remove(source["path"])
+                source["path"] = None
+    
+    df, ingest_stats = merge_frames(
+        [tag_source(*source["cached"], source["name"]) for source in sources],
+        seconds=time.perf_counter() - start
+    )
+    if not missing:
+        ingest_stats["cache"] = "hit"
+    else:
+        ingest_stats["cache"] = "miss" if len(missing) == len(sources) else "partial"
+    return df, ingest_stats
+
+def finish_upload(df, ingest_stats, layout, include_data=False, raise_errors=False, append_to=None):
+    """Process a parsed upload into the upload response"""
+    logger.info("Ingested %s rows from %s sheet(s) in %ss (%s rows/sec, %s, cache %s)",
+                ingest_stats['rows'], len(ingest_stats['sources']), ingest_stats['seconds'],
+                ingest_stats['rows_per_sec'], ingest_stats['engine'], ingest_stats['cache'])
+    
+    # Hand the typed frame to processing without a records round-trip
+    result = process_excel_data(df, layout, ingest_stats['traffic_columns'], include_data, append_to)
+    if "error" in result:
+        if raise_errors:
+            raise ValueError(result["error"])
+        return result
+    
+    result["ingest"] = ingest_stats
+    return result
+
+@bp.route('/api/upload', methods=['POST'])
 def upload_file():
-    """Upload and process Excel file"""
+    """Upload and process one or more Excel files (every sheet) as one dataset"""
     if 'file' not in request.files:
         return jsonify({"error": "No file provided"}), 400
     
-    file = request.files['file']
+    files = request.files.getlist('file')
+    layout = request.args.get('layout', 'records')
+    run_async = request.args.get('async', '').lower() in ('1', 'true', 'yes')
+    # Full rows in the response only on request (?include=data); otherwise use the rows endpoint
+    include_data = request.args.get('include') == 'data'
+    # ...as one JSON document, or streamed as NDJSON / Arrow IPC
+    fmt = request.args.get('format', 'json')
+    # Column projection: 'traffic' (timestamp, Customer In/Out, site/sensor) or a comma-separated list
+    usecols = request.args.get('columns')
+    if usecols and usecols != TRAFFIC:
+        usecols = [col.strip() for col in usecols.split(',') if col.strip()]
+    # Merge into an existing dataset (?append=<dataset_id>) instead of creating one
+    append_to = request.args.get('append') or None
+    
+    if layout not in LAYOUTS:
+        return jsonify({"error": f"Invalid layout. Use one of: {', '.join(LAYOUTS)}"}), 400
+    if fmt not in FORMATS:
+        return jsonify({"error": f"Invalid format. Use one of: {', '.join(FORMATS)}"}), 400
     
-    if file.filename == '':
+    if any(file.filename == '' for file in files):
         return jsonify({"error": "No file selected"}), 400
+    if append_to and columnar_store.open(append_to) is None:
+        return jsonify({"error": "Dataset not found or expired. Please upload the file again."}), 404
     
-    if file and allowed_file(file.filename):
+    if all(allowed_file(file.filename) for file in files):
+        sources = []
+        handed_off = False
         try:
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            # Read Excel file
-            df = pd.read_excel(filepath, engine='openpyxl')
+            # Reuse earlier parses of the same bytes; the rest are parsed from the request
+            # stream, or spooled to disk when the request ends before they are parsed
+            with stage('save'):
+                for file in files:
+                    key = ParseCache.key(file_digest(file.stream), usecols or None)
+                    source = {"name": file.filename, "key": key, "cached": parse_cache.get(key),
+                              "path": None, "stream": file.stream}
+                    if source["cached"] is None and run_async:
+                        source["path"] = jobs.spool_path()
+                        file.save(source["path"])
+                    sources.append(source)
             
-            # Convert to JSON for processing
-            json_data = df.to_dict('records')
+            if run_async:
+                # Parse in the background; the client polls /api/jobs/<job_id>
+                job_id = jobs.create(filename=", ".join(file.filename for file in files))
+                jobs.run(job_id, lambda: finish_upload(
+                    *ingest_uploads(sources, usecols or None, job_id), layout,
+                    include_data=False, raise_errors=True, append_to=append_to
+                ))
+                handed_off = True
+                return jsonify(jobs.get(job_id)), 202
             
-            # Process the data
-            result = process_excel_data(json_data)
+            if include_data and fmt != 'json':
+                # Metadata first, then the stored rows encoded batch by batch
+                result = finish_upload(*ingest_uploads(sources, usecols or None), layout, append_to=append_to)
+                dataset = load_dataset(result["dataset_id"]) if "error" not in result else None
+                if dataset is None:
+                    return jsonify(result)
+                return stream_rows(dataset.frame, fmt, result)
             
-            # Clean up uploaded file
-            os.remove(filepath)
-            
-            return jsonify(result)
+            result = finish_upload(*ingest_uploads(sources, usecols or None), layout, include_data, append_to=append_to)
+            with stage('encode'):
+                return jsonify(result)
             
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": f"Error processing file: {str(e)}"}), 500
+        finally:
+            # Spooled files not yet handed to ingest_uploads (which removes its own)
+            if not handed_off:
+                for source in sources:
+                    if source["path"] and os.path.exists(source["path"]):
+                        os.remove(source["path"])
     else:
         return jsonify({"error": "Invalid file type. Please upload a .xlsx file"}), 400
 
-@app.route('/api/compare', methods=['POST'])
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """State and progress of a background upload started with ?async=1"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@bp.route('/api/datasets/<dataset_id>', methods=['DELETE'])
+def delete_dataset(dataset_id):
+    """Release a stored dataset before its TTL expires"""
+    in_memory = dataset_store.delete(dataset_id)
+    on_disk = columnar_store.delete(dataset_id)
+    if not (in_memory or on_disk):
+        return jsonify({"error": "Dataset not found"}), 404
+    return jsonify({"success": True})
+
+@bp.route('/api/datasets/<dataset_id>/memory', methods=['GET'])
+def dataset_memory(dataset_id):
+    """Bytes held by a dataset: the in-memory frame per column and the columnar store arrays"""
+    dataset = load_dataset(dataset_id)
+    stored = columnar_store.open(dataset_id)
+    if dataset is None and stored is None:
+        return jsonify({"error": "Dataset not found or expired. Please upload the file again."}), 404
+    
+    in_memory = None
+    if dataset is not None:
+        in_memory = dataset.memory_report()
+        in_memory["uncompacted_bytes"] = dataset.meta.get('uncompacted_bytes')
+        # Day numbers and sort orders kept for the rows endpoint
+        in_memory["row_cache_bytes"] = sum(
+            int(values.nbytes) for values in dataset.meta.get('row_cache', {}).values() if hasattr(values, 'nbytes')
+        )
+    return jsonify({
+        "success": True,
+        "dataset_id": dataset_id,
+        "in_memory": in_memory,
+        "columnar_store": stored.memory_report() if stored is not None else None,
+    })
+
+@bp.route('/api/datasets/<dataset_id>/summary', methods=['GET'])
+def dataset_summary(dataset_id):
+    """Per-day totals looked up from the rollup built at upload time"""
+    stored = columnar_store.open(dataset_id)
+    if stored is None or stored.rollup is None:
+        return jsonify({"error": "Dataset not found or expired. Please upload the file again."}), 404
+    
+    rollup = stored.rollup
+    dates = request.args.getlist('date') or stored.dates
+    try:
+        positions = day_positions(rollup, [epoch_day(date) for date in dates])
+    except ValueError:
+        return jsonify({"error": "Dates must be in YYYY-MM-DD format"}), 400
+    
+    missing = [date for date, pos in zip(dates, positions) if pos < 0]
+    if missing:
+        return jsonify({"error": f"No data found for date: {missing[0]}"}), 400
+    
+    days = [
+        {
+            "date": date,
+            "customerIn": int(rollup["daily_in"][pos]),
+            "customerOut": int(rollup["daily_out"][pos]),
+            "businessHours": {
+                "customerIn": int(rollup["business_in"][pos]),
+                "customerOut": int(rollup["business_out"][pos])
+            },
+            "hourly": {
+                "customerIn": rollup["hourly_in"][pos].tolist(),
+                "customerOut": rollup["hourly_out"][pos].tolist()
+            }
+        }
+        for date, pos in zip(dates, positions)
+    ]
+    
+    return negotiated({"success": True, "days": days}, table_key="days")
+
+def _int_arg(name, default=None):
+    """Integer query parameter, ValueError with a readable message if malformed"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+@bp.route('/api/datasets/<dataset_id>/rows', methods=['GET'])
+def dataset_rows(dataset_id):
+    """Page through the stored business-hours rows of a dataset
+
+    Query: offset/limit or cursor, columns (comma list), date (repeatable),
+    date_from/date_to (inclusive), hour_from/hour_to (end exclusive),
+    sort and order (asc/desc), layout (records/columns)
+    """
+    dataset = load_dataset(dataset_id)
+    if dataset is None:
+        return jsonify({"error": "Dataset not found or expired. Please upload the file again."}), 404
+    df = dataset.frame
+    
+    layout = request.args.get('layout', 'records')
+    if layout not in LAYOUTS:
+        return jsonify({"error": f"Invalid layout. Use one of: {', '.join(LAYOUTS)}"}), 400
+    # Explicit ?format= wins over the Accept header
+    fmt = request.args.get('format') or negotiate_format(request.accept_mimetypes, ROW_FORMATS)
+    if fmt not in ROW_FORMATS:
+        return jsonify({"error": f"Invalid format. Use one of: {', '.join(ROW_FORMATS)}"}), 400
+    streaming = fmt in ('ndjson', 'arrow')
+    
+    try:
+        # Streams are encoded in bounded batches, so they may return every row at once
+        limit = _int_arg('limit', None if streaming else DEFAULT_PAGE_SIZE)
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be at least 1")
+        if not streaming and limit > MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be at most {MAX_PAGE_SIZE} (use format=ndjson for more)")
+        
+        # Column names as sent by the client map back to the frame's labels
+        by_name = {str(col): col for col in df.columns}
+        requested = [col.strip() for col in request.args.get('columns', '').split(',') if col.strip()]
+        sort = request.args.get('sort') or None
+        unknown = [col for col in requested + ([sort] if sort else []) if col not in by_name]
+        if unknown:
+            raise ValueError(f"Unknown column: {unknown[0]}")
+        columns = [by_name[col] for col in requested] or None
+        sort = by_name[sort] if sort else None
+        descending = request.args.get('order', 'asc').lower() == 'desc'
+        
+        filters = {
+            "dates": request.args.getlist('date') or None,
+            "date_from": request.args.get('date_from') or None,
+            "date_to": request.args.get('date_to') or None,
+            "hour_from": _int_arg('hour_from'),
+            "hour_to": _int_arg('hour_to'),
+        }
+        signature = query_signature(columns=requested, sort=sort, descending=descending, **filters)
+        if request.args.get('cursor'):
+            offset = decode_cursor(request.args['cursor'], signature)
+        else:
+            offset = _int_arg('offset', 0)
+            if offset < 0:
+                raise ValueError("offset must not be negative")
+        
+        # Derived arrays (day numbers, sort orders) are kept with the dataset
+        cache = dataset.meta.setdefault('row_cache', {})
+        with stage('select', rows=len(df)):
+            positions = select_positions(df, cache, sort, descending, **filters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    total = len(positions)
+    positions = positions[offset:] if limit is None else positions[offset:offset + limit]
+    next_offset = offset + len(positions)
+    has_more = next_offset < total
+    meta = {
+        "success": True,
+        "dataset_id": dataset_id,
+        "layout": layout,
+        "columns": [str(col) for col in (columns or df.columns)],
+        "offset": offset,
+        "limit": limit,
+        "total": total,
+        "next_offset": next_offset if has_more else None,
+        "next_cursor": encode_cursor(next_offset, signature) if has_more else None,
+    }
+    
+    if streaming:
+        try:
+            return stream_rows(df, fmt, meta, positions, columns)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    
+    with stage('serialize', rows=len(positions)):
+        page = df.iloc[positions]
+        if columns:
+            page = page[columns]
+        meta["rows"] = encode_frame(page, layout)
+    return negotiated(meta, fmt=fmt)
+
+def negotiated(payload, table_key=None, fmt=None):
+    """Response with payload as JSON, MessagePack or, when it has a table of
+    row objects under table_key, Arrow IPC, as preferred by the Accept header"""
+    if fmt is None:
+        formats = ('json', 'msgpack', 'arrow') if table_key else ('json', 'msgpack')
+        fmt = negotiate_format(request.accept_mimetypes, formats)
+    with stage('encode'):
+        if fmt == 'json':
+            return jsonify(payload)
+        try:
+            body, mimetype = encode_payload(payload, fmt, table_key)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return Response(body, mimetype=mimetype)
+
+def stream_rows(frame, fmt, header, rows=None, columns=None):
+    """Chunked response with the rows of frame (at positions rows, limited to
+    columns) as NDJSON with the header object on the first line, or as an
+    Arrow IPC stream"""
+    if fmt == 'arrow':
+        return Response(iter_arrow_ipc(frame, header, rows, columns), mimetype=ARROW_MIMETYPE)
+    return Response(iter_ndjson(frame, header, rows, columns), mimetype=NDJSON_MIMETYPE)
+
+def load_slot_source(data):
+    """Slot source for a compare request body: the memory-mapped columnar store,
+    the frame held in memory since upload, or rows posted by older clients
+
+    Returns (source, None) or (None, error response).
+    """
+    dataset_id = data.get('dataset_id')
+    if dataset_id:
+        # Zero-copy day slices from the memory-mapped columnar store
+        stored = columnar_store.open(dataset_id)
+        if stored is not None:
+            return stored, None
+        
+        dataset = dataset_store.get(dataset_id)
+        if dataset is None:
+            return None, (jsonify({"error": "Dataset not found or expired. Please upload the file again."}), 404)
+        # Typed columns named by the schema resolved at upload
+        schema = dataset.meta.get('schema') or infer_schema(dataset.frame, dataset.meta.get('traffic_columns'))
+        return FrameSlots(dataset.frame, schema), None
+    
+    # Legacy path: the client posts every row back
+    excel_data = data.get('excel_data', [])
+    if not excel_data:
+        return None, (jsonify({"error": "No Excel data provided"}), 400)
+    df = pd.DataFrame(excel_data)
+    logger.debug("Posted rows: %s, columns: %s", len(df), df.columns.tolist())
+    return FrameSlots(df), None
+
+@bp.route('/api/compare', methods=['POST'])
 def compare_dates():
     """Compare traffic data between two dates - simplified version"""
     try:
         data = request.json
         
-        if not data or 'excel_data' not in data or 'date1' not in data or 'date2' not in data:
+        if not data or 'date1' not in data or 'date2' not in data:
+            return jsonify({"error": "Missing required data"}), 400
+        if 'dataset_id' not in data and 'excel_data' not in data:
             return jsonify({"error": "Missing required data"}), 400
 
-        # Get the original Excel data
-        excel_data = data.get('excel_data', [])
         date1 = data['date1']
         date2 = data['date2']
         show_highlighted_only = data.get('show_highlighted_only', False)
         min_ratio_threshold = data.get('min_ratio_threshold', 4)
         
-        print(f"Received min_ratio_threshold: {min_ratio_threshold} (type: {type(min_ratio_threshold)})")
-        print(f"Received show_highlighted_only: {show_highlighted_only}")
-        print(f"Full request data keys: {list(data.keys())}")
-        
-        if not excel_data:
-            return jsonify({"error": "No Excel data provided"}), 400
+        logger.debug("Comparing %s vs %s (min_ratio_threshold=%r, show_highlighted_only=%r, keys=%s)",
+                     date1, date2, min_ratio_threshold, show_highlighted_only, list(data.keys()))
         
-        # Convert to DataFrame
-        df = pd.DataFrame(excel_data)
+        # Slot width, window and timezone default to 15 minutes, 8am-8pm, stored wall clock
+        buckets = TimeBuckets.from_params(data)
         
-        if df.empty:
-            return jsonify({"error": "No data in Excel file"}), 400
+        source, error = load_slot_source(data)
+        if error:
+            return error
         
-        print(f"\n=== Comparing {date1} vs {date2} ===")
-        print(f"Total rows in DataFrame: {len(df)}")
-        print(f"Columns: {df.columns.tolist()}")
+        # Bucket both dates into the slot grid in one pass
+        with stage('bucket') as record:
+            (date_in, date_out), rows_per_date = source.slot_grids([date1, date2], buckets)
+            record["rows"] = int(rows_per_date.sum())
         
-        # Filter data by date
-        # Try different column name variations
-        date_col = None
-        for col in ['Date', 'date', 'DATE']:
-            if col in df.columns:
-                date_col = col
-                break
+        logger.debug("Rows for %s: %s, rows for %s: %s", date1, rows_per_date[0], date2, rows_per_date[1])
         
-        if date_col is None:
-            return jsonify({"error": "No Date column found in data"}), 400
+        if rows_per_date[0] == 0:
+            return jsonify({"error": f"No data found for date: {date1}"}), 400
+        if rows_per_date[1] == 0:
+            return jsonify({"error": f"No data found for date: {date2}"}), 400
         
-        # Convert date column to string for comparison
-        df[date_col] = df[date_col].astype(str)
+        # Highlight rules: zero / ratio >= min_ratio_threshold unless the request lists its own
+        rules = build_rules(data.get('rules'), float(min_ratio_threshold))
+        weeks = history_weeks(rules)
+        history = (None, None)
+        if weeks:
+            history_in, history_out = trailing_history(source, [date2], weeks, buckets)
+            history = (history_in[0], history_out[0])
         
-        # Filter for each date
-        date1_data = df[df[date_col] == date1].copy()
-        date2_data = df[df[date_col] == date2].copy()
+        with stage('compare', rows=len(date_in[0])):
+            compared = compare_slots(date_in[0], date_in[1], date_out[0], date_out[1], rules=rules, history=history)
         
-        print(f"Rows for {date1}: {len(date1_data)}")
-        print(f"Rows for {date2}: {len(date2_data)}")
+        # Filter for highlighted only if requested: one boolean index over the slots
+        rows = np.flatnonzero(compared["should_highlight"]) if show_highlighted_only else np.arange(len(date_in[0]))
+        with stage('serialize', rows=len(rows)):
+            comparison_results = comparison_records(
+                buckets.labels(), date_in[0], date_in[1], date_out[0], date_out[1], compared, rows
+            )
         
-        if len(date1_data) == 0:
-            return jsonify({"error": f"No data found for date: {date1}"}), 400
-        if len(date2_data) == 0:
-            return jsonify({"error": f"No data found for date: {date2}"}), 400
-        
-        # Find Customer In/Out columns
-        customer_in_col = None
-        customer_out_col = None
-        
-        for col in df.columns:
-            col_lower = col.lower()
-            if 'customer' in col_lower and 'in' in col_lower:
-                customer_in_col = col
-            elif 'customer' in col_lower and 'out' in col_lower:
-                customer_out_col = col
-        
-        if customer_in_col is None or customer_out_col is None:
-            # Fallback to column indices if names not found
-            try:
-                customer_in_col = df.columns[4]  # Column E
-                customer_out_col = df.columns[5]  # Column F
-                print(f"Using column indices - In: {customer_in_col}, Out: {customer_out_col}")
-            except:
-                return jsonify({"error": "Cannot find Customer In/Out columns"}), 400
-        else:
-            print(f"Found columns - In: {customer_in_col}, Out: {customer_out_col}")
-        
-        # Find Time column
-        time_col = None
-        for col in ['Time', 'time', 'TIME', 'Time Slot']:
-            if col in df.columns:
-                time_col = col
-                break
-        
-        if time_col is None:
-            return jsonify({"error": "No Time column found in data"}), 400
-        
-        # Convert time to string for matching
-        date1_data[time_col] = date1_data[time_col].astype(str)
-        date2_data[time_col] = date2_data[time_col].astype(str)
-        
-        # Generate 15-minute time slots from 8:00 AM to 8:00 PM
-        time_slots = []
-        for hour in range(8, 20):  # 8 AM to 8 PM
-            for minute in [0, 15, 30, 45]:
-                time_str = f"{hour:02d}:{minute:02d}:00"
-                time_slots.append(time_str)
-        
-        print(f"Generated {len(time_slots)} time slots")
-        
-        # Create comparison results
-        comparison_results = []
-        
-        for time_str in time_slots:
-            # Format time slot for display
-            hour = int(time_str[:2])
-            minute = int(time_str[3:5])
-            end_minute = minute + 15
-            end_hour = hour
-            if end_minute >= 60:
-                end_hour += 1
-                end_minute -= 60
-            
-            ampm = "pm" if end_hour >= 12 else "am"
-            display_time = f"{hour:02d}:{minute:02d}-{end_hour:02d}:{end_minute:02d}{ampm}"
-            
-            # Find matching rows for this time slot (match by hour:minute)
-            time_pattern = time_str[:5]  # Just HH:MM part
-            
-            date1_rows = date1_data[date1_data[time_col].str.contains(time_pattern, na=False)]
-            date2_rows = date2_data[date2_data[time_col].str.contains(time_pattern, na=False)]
-            
-            # Get values (use first match if multiple)
-            if len(date1_rows) > 0:
-                date1_in = int(float(date1_rows.iloc[0][customer_in_col]) if pd.notna(date1_rows.iloc[0][customer_in_col]) else 0)
-                date1_out = int(float(date1_rows.iloc[0][customer_out_col]) if pd.notna(date1_rows.iloc[0][customer_out_col]) else 0)
-            else:
-                date1_in = date1_out = 0
-            
-            if len(date2_rows) > 0:
-                date2_in = int(float(date2_rows.iloc[0][customer_in_col]) if pd.notna(date2_rows.iloc[0][customer_in_col]) else 0)
-                date2_out = int(float(date2_rows.iloc[0][customer_out_col]) if pd.notna(date2_rows.iloc[0][customer_out_col]) else 0)
-            else:
-                date2_in = date2_out = 0
-            
-            diff_in = date2_in - date1_in
-            diff_out = date2_out - date1_out
-            
-            # Calculate ratios exactly like app.py
-            # Ratio = max(value1, value2) / min(value1, value2)
-            ratio_in = max(date1_in, date2_in) / min(date1_in, date2_in) if min(date1_in, date2_in) > 0 else 999999
-            ratio_out = max(date1_out, date2_out) / min(date1_out, date2_out) if min(date1_out, date2_out) > 0 else 999999
-            
-            # Determine if should be highlighted - exactly like app.py
-            should_highlight = (date1_in == 0 or date2_in == 0 or 
-                             date1_out == 0 or date2_out == 0 or
-                             ratio_in >= min_ratio_threshold or ratio_out >= min_ratio_threshold)
-            
-            comparison_results.append({
-                "timeSlot": display_time,
-                "date1Value": date1_in,
-                "date2Value": date2_in,
-                "difference": diff_in,
-                "date1OutValue": date1_out,
-                "date2OutValue": date2_out,
-                "differenceOut": diff_out,
-                "ratioIn": ratio_in,
-                "ratioOut": ratio_out,
-                "should_highlight": should_highlight
-            })
-        
-        # Filter for highlighted only if requested
-        if show_highlighted_only:
-            comparison_results = [r for r in comparison_results if r["should_highlight"]]
-        
-        # Calculate summary totals
-        date1_total_in = sum(r["date1Value"] for r in comparison_results)
-        date1_total_out = sum(r["date1OutValue"] for r in comparison_results)
-        date2_total_in = sum(r["date2Value"] for r in comparison_results)
-        date2_total_out = sum(r["date2OutValue"] for r in comparison_results)
+        # Calculate summary totals over the returned slots
+        date1_total_in = int(date_in[0][rows].sum())
+        date1_total_out = int(date_out[0][rows].sum())
+        date2_total_in = int(date_in[1][rows].sum())
+        date2_total_out = int(date_out[1][rows].sum())
         
         summary = {
             "date1": {
@@ -364,15 +801,319 @@ def compare_dates():
             }
         }
         
-        return jsonify({
+        return negotiated({
             "success": True,
             "comparison_data": comparison_results,
             "summary": summary,
-            "total_slots": len(comparison_results)
+            "total_slots": len(comparison_results),
+            "rules": rule_legend(rules)
+        }, table_key="comparison_data")
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Error comparing dates: {str(e)}"}), 500
+
+@bp.route('/api/compare/batch', methods=['POST'])
+def compare_batch():
+    """Compare a baseline date against many dates in one vectorized pass"""
+    try:
+        data = request.json
+        
+        if not data or 'baseline' not in data:
+            return jsonify({"error": "Missing required data"}), 400
+        if 'dates' not in data and 'date_from' not in data:
+            return jsonify({"error": "Provide either dates or date_from/date_to"}), 400
+        
+        baseline = data['baseline']
+        min_ratio_threshold = float(data.get('min_ratio_threshold', 4))
+        buckets = TimeBuckets.from_params(data)
+        
+        source, error = load_slot_source(data)
+        if error:
+            return error
+        
+        if 'dates' in data:
+            dates = [date for date in data['dates'] if date != baseline]
+        else:
+            # Every stored date inside the range
+            date_from = data['date_from']
+            date_to = data.get('date_to', date_from)
+            dates = [date for date in source.dates if date_from <= date <= date_to and date != baseline]
+        
+        if not dates:
+            return jsonify({"error": "No dates to compare against the baseline"}), 400
+        if len(dates) > MAX_BATCH_DATES:
+            return jsonify({"error": f"At most {MAX_BATCH_DATES} dates can be compared at once"}), 400
+        
+        with stage('bucket') as record:
+            (grid_in, grid_out), rows_per_date = source.slot_grids([baseline] + dates, buckets)
+            record["rows"] = int(rows_per_date.sum())
+        
+        missing = [date for date, rows in zip([baseline] + dates, rows_per_date) if rows == 0]
+        if missing:
+            return jsonify({"error": f"No data found for date: {missing[0]}"}), 400
+        
+        rules = build_rules(data.get('rules'), min_ratio_threshold)
+        weeks = history_weeks(rules)
+        history = trailing_history(source, dates, weeks, buckets) if weeks else (None, None)
+        
+        # Baseline row broadcasts against the (dates x slots) matrix
+        with stage('compare', rows=grid_in[1:].size):
+            compared = compare_slots(grid_in[:1], grid_in[1:], grid_out[:1], grid_out[1:], rules=rules, history=history)
+        highlight = compared["should_highlight"]
+        
+        # Matrices are returned slots x dates
+        return negotiated({
+            "success": True,
+            "baseline": baseline,
+            "dates": dates,
+            "time_slots": buckets.labels(),
+            "buckets": buckets.params(),
+            "baseline_values": {
+                "customerIn": grid_in[0].tolist(),
+                "customerOut": grid_out[0].tolist()
+            },
+            "values": {
+                "customerIn": grid_in[1:].T.tolist(),
+                "customerOut": grid_out[1:].T.tolist()
+            },
+            "differences": {
+                "customerIn": compared["difference"].T.tolist(),
+                "customerOut": compared["differenceOut"].T.tolist()
+            },
+            "ratios": {
+                "customerIn": compared["ratioIn"].T.tolist(),
+                "customerOut": compared["ratioOut"].T.tolist()
+            },
+            "should_highlight": highlight.T.tolist(),
+            "highlight_bits": {
+                "customerIn": compared["highlight_in"].T.tolist(),
+                "customerOut": compared["highlight_out"].T.tolist()
+            },
+            "rules": rule_legend(rules),
+            "summary": [
+                {
+                    "date": date,
+                    "customerIn": int(grid_in[i + 1].sum()),
+                    "customerOut": int(grid_out[i + 1].sum()),
+                    "differenceIn": int(grid_in[i + 1].sum() - grid_in[0].sum()),
+                    "differenceOut": int(grid_out[i + 1].sum() - grid_out[0].sum()),
+                    "highlightedSlots": int(highlight[i].sum())
+                }
+                for i, date in enumerate(dates)
+            ]
         })
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Error comparing dates: {str(e)}"}), 500
 
+@bp.route('/api/anomalies', methods=['POST'])
+def score_anomalies():
+    """Score every slot of the requested dates against their trailing same-weekday baselines"""
+    try:
+        data = request.json or {}
+        
+        stored = columnar_store.open(data.get('dataset_id'))
+        if stored is None or stored.rollup is None:
+            return jsonify({"error": "Dataset not found or expired. Please upload the file again."}), 404
+        
+        if 'dates' in data:
+            dates = data['dates']
+        elif 'date_from' in data:
+            date_from = data['date_from']
+            date_to = data.get('date_to', date_from)
+            dates = [date for date in stored.dates if date_from <= date <= date_to]
+        else:
+            dates = stored.dates
+        
+        if not dates:
+            return jsonify({"error": "No dates to score"}), 400
+        if len(dates) > MAX_BATCH_DATES:
+            return jsonify({"error": f"At most {MAX_BATCH_DATES} dates can be scored at once"}), 400
+        
+        threshold = float(data.get('threshold', ANOMALY_THRESHOLD))
+        min_weeks = int(data.get('min_weeks', MIN_WEEKS))
+        
+        rollup = stored.rollup
+        days = np.array([epoch_day(date) for date in dates], dtype=np.int64)
+        positions = day_positions(rollup, days)
+        missing = [date for date, pos in zip(dates, positions) if pos < 0]
+        if missing:
+            return jsonify({"error": f"No data found for date: {missing[0]}"}), 400
+        
+        slots_in = rollup["slots_in"][positions]
+        slots_out = rollup["slots_out"][positions]
+        with stage('score', rows=slots_in.size):
+            # Each date against the same weekday's latest days before it, as
+            # kept up to date with the rollup (computed here for older datasets)
+            if all(f"baseline_{stat}" in rollup for stat in STATS):
+                stats = {stat: np.asarray(rollup[f"baseline_{stat}"][positions]) for stat in STATS}
+            else:
+                stats = baseline_stats(rollup, trailing_windows(rollup, days))
+            scored = score_days(stats, slots_in, slots_out, threshold, min_weeks)
+        
+        labels = DEFAULT_BUCKETS.labels()
+        weekdays = weekday(days)
+        weeks = stats["window_sizes"]
+        
+        # Flagged cells, most anomalous first
+        flagged = []
+        for name, metric, values in (("in", "customerIn", slots_in), ("out", "customerOut", slots_out)):
+            for i, slot in zip(*np.nonzero(scored[f"anomaly_{name}"])):
+                flagged.append({
+                    "date": dates[i],
+                    "time": labels[slot],
+                    "metric": metric,
+                    "value": int(values[i, slot]),
+                    "median": float(scored[f"median_{name}"][i, slot]),
+                    **{f"p{q}": float(stats[f"p{q}_{name}"][i, slot]) for q in PERCENTILES},
+                    "score": round(float(scored[f"score_{name}"][i, slot]), 2)
+                })
+        flagged.sort(key=lambda cell: -abs(cell["score"]))
+        
+        # Matrices are returned slots x dates, like /api/compare/batch
+        return negotiated({
+            "success": True,
+            "dates": dates,
+            "time_slots": labels,
+            "threshold": threshold,
+            "baseline_weeks": BASELINE_WEEKS,
+            "scores": {
+                "customerIn": np.round(scored["score_in"], 2).T.tolist(),
+                "customerOut": np.round(scored["score_out"], 2).T.tolist()
+            },
+            "baseline": {
+                metric: {stat: _slot_matrix(stats[f"{stat}_{name}"])
+                         for stat in ("median",) + tuple(f"p{q}" for q in PERCENTILES)}
+                for name, metric in (("in", "customerIn"), ("out", "customerOut"))
+            },
+            "anomalies": flagged,
+            "summary": [
+                {
+                    "date": date,
+                    "weekday": WEEKDAYS[weekdays[i]],
+                    "baselineDays": int(weeks[i]),
+                    "scored": bool(weeks[i] >= min_weeks),
+                    "customerIn": int(slots_in[i].sum()),
+                    "expectedIn": float(np.nansum(scored["median_in"][i])),
+                    "customerOut": int(slots_out[i].sum()),
+                    "expectedOut": float(np.nansum(scored["median_out"][i])),
+                    "anomalousSlots": int((scored["anomaly_in"][i] | scored["anomaly_out"][i]).sum())
+                }
+                for i, date in enumerate(dates)
+            ]
+        }, table_key="anomalies")
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Error scoring anomalies: {str(e)}"}), 500
+
+def _slot_matrix(values):
+    """(dates, slots) statistics as slots x dates lists, None where a date has no baseline"""
+    values = np.round(values, 2).T
+    return np.where(np.isnan(values), None, values).tolist()
+
+@bp.route('/api/query', methods=['POST'])
+def query_dataset():
+    """Grouped aggregation over a stored dataset (see queries.TrafficQuery)"""
+    try:
+        data = request.json or {}
+        
+        stored = columnar_store.open(data.get('dataset_id'))
+        if stored is None:
+            return jsonify({"error": "Dataset not found or expired. Please upload the file again."}), 404
+        
+        query = TrafficQuery.from_params(data)
+        with stage('query') as record:
+            result = query.run(stored)
+            record["rows"] = result["rows_scanned"]
+        return negotiated(dict(result, success=True), table_key="rows")
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Error running query: {str(e)}"}), 500
+
+def create_app(config=None):
+    """Application factory used by the dev server, serve.py and WSGI servers"""
+    configure_logging()
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+    if config:
+        app.config.update(config)
+    
+    CORS(app)  # Enable CORS for all routes
+    app.register_blueprint(bp)
+    return app
+
+@bp.after_app_request
+def compress(response):
+    """gzip/brotli data responses for clients that accept it"""
+    if COMPRESS_RESPONSES:
+        compress_response(response, request.accept_encodings)
+    return response
+
+@bp.before_app_request
+def start_timing():
+    g.request_start = time.perf_counter()
+    g.request_rss = rss_bytes()
+    if ALLOW_PROFILING and request.args.get('profile') == '1':
+        g.profiler = start_profiler()
+
+# Registered after compress, so it runs before it (after-request hooks run in reverse)
+@bp.after_app_request
+def record_timing(response):
+    """Request metrics, a Server-Timing header and the ?profile=1 summary"""
+    if 'request_start' not in g:
+        return response
+    seconds = time.perf_counter() - g.request_start
+    stages = g.get('stages', [])
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    METRICS.record_request(endpoint, request.method, response.status_code, seconds)
+    response.headers['Server-Timing'] = server_timing(stages, seconds)
+    
+    if seconds >= SLOW_REQUEST_SECONDS:
+        logger.warning("Slow request %s %s: %.2fs (%s)", request.method, request.path, seconds,
+                       ', '.join(f"{record['stage']} {record['seconds']:.2f}s" for record in stages))
+    
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        profile = profile_summary(profiler)
+        rss = rss_bytes()
+        summary = {
+            "seconds": round(seconds, 6),
+            "memory_delta_bytes": rss - g.request_rss if rss is not None and g.request_rss is not None else None,
+            "stages": stage_summary(stages),
+            "functions": profile["functions"],
+        }
+        if response.is_json and not response.is_streamed:
+            payload = response.get_json()
+            if isinstance(payload, dict):
+                payload["profile"] = summary
+                response.set_data(json.dumps(payload, default=str))
+        else:
+            logger.info("Profile of %s %s:\n%s", request.method, request.path, profile["report"])
+    return response
+
+@bp.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Request, stage and memory metrics of this worker in the Prometheus text format"""
+    stats = dataset_store.stats()
+    body = METRICS.render({
+        "traffic_api_datasets": ("Datasets held in memory", stats["datasets"]),
+        "traffic_api_dataset_bytes": ("Memory used by in-memory datasets", stats["total_bytes"]),
+        "process_resident_memory_bytes": ("Resident memory of this worker", rss_bytes()),
+    })
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Module-level app for `gunicorn api:app` and other WSGI servers
+app = create_app()
+
 if __name__ == '__main__':
+    # Development server only - use serve.py in production
     app.run(debug=True, host='0.0.0.0', port=5000)
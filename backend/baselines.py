@@ -0,0 +1,151 @@
+"""
+Per-weekday, per-slot traffic baselines for anomaly scoring
+Each scored day gets its own baseline: the slot totals of the latest
+BASELINE_WEEKS same-weekday days before it in the daily rollup, with robust
+statistics over them (median, MAD, percentiles), so a day is judged only
+against data that existed at the time and never against itself. The
+columnar store keeps every day's statistics with its rollup and updates
+only the days an append can change
+"""
+
+import warnings
+
+import numpy as np
+
+# Same-weekday days in each baseline window
+BASELINE_WEEKS = 8
+
+# MAD -> standard deviation for normally distributed counts
+MAD_SCALE = 1.4826
+# Floor on the robust spread so slots that never change do not divide by zero
+MIN_SPREAD = 1.0
+# |robust z| at or above this is an anomaly (Iglewicz and Hoaglin's cut-off)
+ANOMALY_THRESHOLD = 3.5
+# Days with fewer than this many days in their window are not scored
+MIN_WEEKS = 3
+
+# Percentiles of each window reported next to the median
+PERCENTILES = (10, 90)
+
+# Statistics baseline_stats returns, per day (window_sizes) or per day and slot
+STATS = ("window_sizes",) + tuple(
+    f"{stat}_{name}" for stat in ("median", "mad") + tuple(f"p{q}" for q in PERCENTILES) for name in ("in", "out")
+)
+
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+
+def weekday(epoch_days):
+    """Weekday of epoch days, Monday = 0 (1970-01-01 was a Thursday)"""
+    return (np.asarray(epoch_days, dtype=np.int64) + 3) % 7
+
+
+def trailing_windows(rollup, days, weeks=BASELINE_WEEKS):
+    """Rollup rows of the latest weeks same-weekday days before each of days
+
+    Only rollup days with rows inside the business-hours window count, and a
+    day is never part of its own window. Returns a (len(days), weeks) array of
+    rollup positions, oldest first, padded with -1 at the start when fewer
+    earlier days are stored.
+    """
+    days = np.asarray(days, dtype=np.int64)
+    windows = np.full((len(days), weeks), -1, dtype=np.int64)
+    usable = np.flatnonzero(rollup["business_rows"] > 0)
+
+    for wd in np.unique(weekday(days)):
+        candidates = usable[weekday(rollup["days"][usable]) == wd]
+        if len(candidates) == 0:
+            continue
+        targets = np.flatnonzero(weekday(days) == wd)
+        # Candidates are in day order; side='left' leaves the target day out
+        end = np.searchsorted(rollup["days"][candidates], days[targets])
+        index = end[:, None] - np.arange(weeks, 0, -1)
+        windows[targets] = np.where(index >= 0, candidates[np.maximum(index, 0)], -1)
+    return windows
+
+
+def baseline_stats(rollup, windows):
+    """Per-slot median, MAD and PERCENTILES of each window's slot totals
+
+    windows comes from trailing_windows. Returns the STATS: window_sizes
+    (days per window) and (len(windows), n_slots) median_in/out, mad_in/out
+    and p10_in/out, p90_in/out arrays, NaN for empty windows.
+    """
+    filled = windows >= 0
+    stats = {"window_sizes": filled.sum(axis=1)}
+    for name in ("in", "out"):
+        values = np.where(filled[..., None], rollup[f"slots_{name}"][np.maximum(windows, 0)], np.nan)
+        with warnings.catch_warnings():
+            # Empty windows are all-NaN slices; their statistics stay NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            median = np.nanmedian(values, axis=1)
+            stats[f"median_{name}"] = median
+            stats[f"mad_{name}"] = np.nanmedian(np.abs(values - median[:, None, :]), axis=1)
+            for q, percentile in zip(PERCENTILES, np.nanpercentile(values, PERCENTILES, axis=1)):
+                stats[f"p{q}_{name}"] = percentile
+    return stats
+
+
+def affected_days(rollup, changed_days, weeks=BASELINE_WEEKS):
+    """Rollup positions whose baseline window may hold one of changed_days:
+    the changed days and the next weeks usable same-weekday days after each"""
+    changed_days = np.asarray(changed_days, dtype=np.int64)
+    affected = [np.flatnonzero(np.isin(rollup["days"], changed_days))]
+    usable = np.flatnonzero(rollup["business_rows"] > 0)
+    for wd in np.unique(weekday(changed_days)):
+        candidates = usable[weekday(rollup["days"][usable]) == wd]
+        starts = np.searchsorted(rollup["days"][candidates], changed_days[weekday(changed_days) == wd], side='right')
+        affected += [candidates[start:start + weeks] for start in starts]
+    return np.unique(np.concatenate(affected))
+
+
+def window_stats(rollup, previous=None, changed_days=None, weeks=BASELINE_WEEKS):
+    """baseline_stats of every rollup day against its trailing window
+
+    With the previous rollup of the same dataset (holding its own stats
+    under "baseline_<stat>") and the days changed since, only the days whose
+    window may have changed are recomputed; the rest are copied. Returns a
+    dict of "baseline_<stat>" arrays with one row per rollup day.
+    """
+    days = rollup["days"]
+    if previous is None or changed_days is None or any(f"baseline_{stat}" not in previous for stat in STATS):
+        return {f"baseline_{stat}": values
+                for stat, values in baseline_stats(rollup, trailing_windows(rollup, days, weeks)).items()}
+
+    # Days new since previous count as changed, so every other day has a previous row
+    changed_days = np.union1d(changed_days, days[~np.isin(days, previous["days"])])
+    recompute = affected_days(rollup, changed_days, weeks)
+    kept = np.setdiff1d(np.arange(len(days)), recompute)
+    kept_from = np.searchsorted(previous["days"], days[kept])
+    update = baseline_stats(rollup, trailing_windows(rollup, days[recompute], weeks))
+
+    result = {}
+    for stat in STATS:
+        old = previous[f"baseline_{stat}"]
+        values = np.empty((len(days),) + old.shape[1:], dtype=update[stat].dtype)
+        values[kept] = old[kept_from]
+        values[recompute] = update[stat]
+        result[f"baseline_{stat}"] = values
+    return result
+
+
+def score_days(stats, slots_in, slots_out, threshold=ANOMALY_THRESHOLD, min_weeks=MIN_WEEKS):
+    """Robust z-scores of (days, n_slots) slot totals against their own baselines
+
+    stats comes from baseline_stats for the same days. score = (value -
+    median) / max(MAD_SCALE * MAD, MIN_SPREAD), computed for every day and
+    slot at once. Returns a dict of (days, n_slots) arrays: score_in/out,
+    anomaly_in/out (False for days with fewer than min_weeks days in their
+    window) and the median_in/out used.
+    """
+    scored = stats["window_sizes"] >= min_weeks
+
+    result = {}
+    for name, values in (("in", slots_in), ("out", slots_out)):
+        median = stats[f"median_{name}"]
+        spread = np.maximum(np.nan_to_num(stats[f"mad_{name}"]) * MAD_SCALE, MIN_SPREAD)
+        score = np.where(scored[:, None], (np.asarray(values, dtype=np.float64) - np.nan_to_num(median)) / spread, 0.0)
+        result[f"score_{name}"] = score
+        result[f"anomaly_{name}"] = np.abs(score) >= threshold
+        result[f"median_{name}"] = median
+    return result
@@ -0,0 +1,693 @@
+"""
+Memory-mapped columnar store for ingested traffic data
+Each dataset is a directory of segments of .npy columns sorted by timestamp
+plus a per-day index, so date lookups are zero-copy slices of the mapped files
+and appends write only the days they touch
+"""
+
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within one process
+    fcntl = None
+
+from baselines import window_stats
+from rollups import build_rollup, day_positions, load_rollup, merge_rollup, save_rollup
+from time_buckets import DEFAULT_BUCKETS, MINUTES_PER_DAY
+
+# Column files written for every dataset
+COLUMNS = {
+    "ts": np.int64,            # minutes since the Unix epoch (wall-clock time)
+    "customer_in": np.int32,
+    "customer_out": np.int32,
+    "site": np.int32,          # code into meta["sites"]
+    "sensor": np.int32,        # code into meta["sensors"]
+}
+
+# Optional masks of counts missing in the upload, written only when a
+# segment has any; the count columns hold 0 there, so sums, grids and
+# rollups are unaffected, and frame() restores them as NaN
+MISSING = {"customer_in": "customer_in_missing", "customer_out": "customer_out_missing"}
+MASKS = tuple(MISSING.values())
+
+# Prefix of the files holding other upload columns, numbered by their
+# position in meta["extra_columns"]; text is stored as codes plus labels
+EXTRA = "extra_"
+
+# Segments a dataset may have before an append compacts it into one
+MAX_SEGMENTS = 16
+
+
+def epoch_day(date):
+    """Days since the Unix epoch for a 'YYYY-MM-DD' string or date"""
+    return int(np.datetime64(str(date), 'D').astype(np.int64))
+
+
+class SegmentedColumn:
+    """One column of a dataset stored in several segments, in day order
+
+    Supports len(), slices and np.asarray(); a slice inside one run of
+    adjacent rows of a segment is a zero-copy view of the mapped file.
+    """
+
+    def __init__(self, owner, parts):
+        self._owner = owner
+        self._parts = parts
+        self.dtype = parts[0].dtype
+
+    def __len__(self):
+        return int(self._owner.day_offsets[-1])
+
+    @property
+    def nbytes(self):
+        return len(self) * self.dtype.itemsize
+
+    def __getitem__(self, rows):
+        if not isinstance(rows, slice):
+            raise TypeError("Segmented columns only support slices")
+        if rows.indices(len(self))[2] != 1:
+            raise ValueError("Segmented columns only support contiguous slices")
+        pieces = self._owner._pieces(rows, lambda segment, start, stop: self._parts[segment][start:stop])
+        if len(pieces) == 1:
+            return pieces[0]
+        return np.concatenate(pieces) if pieces else self._parts[0][:0]
+
+    def __array__(self, dtype=None, copy=None):
+        values = np.asarray(self[:])
+        return values if dtype is None else values.astype(dtype)
+
+
+class TrafficColumns:
+    """Read-only, memory-mapped view of one stored dataset
+
+    A dataset is a list of segments, each a directory of sorted .npy columns
+    with a per-day index. A day is read from the last segment holding it, so
+    an append writes only the days it touches; a single segment maps its
+    columns directly.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        # Datasets written before segments keep one at the top of the directory
+        self.segment_names = self.meta.get("segments", ["."])
+        self._segment_paths = [os.path.join(directory, name) for name in self.segment_names]
+        segments = [_load_segment(path) for path in self._segment_paths]
+        self._segment_rows = [len(segment["ts"]) for segment in segments]
+        self.stored_rows = sum(self._segment_rows)
+        self.rollup = load_rollup(os.path.join(directory, self.meta.get("rollup", ".")))
+        # (segment, extra column index) -> decoded values, loaded on first use
+        self._extras = {}
+
+        # Each day from the latest segment holding it
+        days = np.concatenate([segment["days"] for segment in segments])
+        owner = np.concatenate([np.full(len(segment["days"]), i) for i, segment in enumerate(segments)])
+        starts = np.concatenate([segment["day_offsets"][:-1] for segment in segments])
+        stops = np.concatenate([segment["day_offsets"][1:] for segment in segments])
+        order = np.lexsort((-owner, days))
+        first = np.append(True, days[order][1:] != days[order][:-1])
+        live = order[first]
+        self.days = days[live]
+        owner, starts, stops = owner[live], starts[live], stops[live]
+        self.day_offsets = np.append(0, np.cumsum(stops - starts)).astype(np.int64)
+
+        # Runs of consecutive days that are also adjacent rows of one segment
+        breaks = np.flatnonzero(np.append(len(owner) > 0, (owner[1:] != owner[:-1]) | (starts[1:] != stops[:-1])))
+        self._run_starts = np.append(self.day_offsets[breaks], self.day_offsets[-1])
+        self._run_segments = owner[breaks]
+        self._run_offsets = starts[breaks]
+        if len(segments) == 1:
+            for name in tuple(COLUMNS) + MASKS:
+                setattr(self, name, segments[0][name])
+            return
+        for name in COLUMNS:
+            setattr(self, name, SegmentedColumn(self, [segment[name] for segment in segments]))
+        for name in MASKS:
+            parts = [segment[name] for segment in segments]
+            if all(part is None for part in parts):
+                setattr(self, name, None)
+            else:
+                setattr(self, name, SegmentedColumn(self, [
+                    part if part is not None else np.zeros(len(segment["ts"]), dtype=bool)
+                    for part, segment in zip(parts, segments)
+                ]))
+
+    def __len__(self):
+        return int(self.day_offsets[-1]) if len(self.day_offsets) else 0
+
+    def _pieces(self, rows, part):
+        """part(segment, start, stop) for each run of a row slice, in order"""
+        start, stop, _ = rows.indices(len(self))
+        run = np.searchsorted(self._run_starts, start, side='right') - 1
+        pieces = []
+        while start < stop:
+            shift = self._run_offsets[run] - self._run_starts[run]
+            end = min(stop, self._run_starts[run + 1])
+            pieces.append(part(self._run_segments[run], start + shift, end + shift))
+            start, run = end, run + 1
+        return pieces
+
+    def extra_values(self, index, rows):
+        """Rows of the extra column meta["extra_columns"][index] (text as an
+        object array); None in segments written before the column existed"""
+        def part(segment, start, stop):
+            key = (segment, index)
+            if key not in self._extras:
+                self._extras[key] = _load_extra(self._segment_paths[segment], index, self._segment_rows[segment])
+            return self._extras[key][start:stop]
+        return _concat(self._pieces(rows, part) or [np.zeros(0, dtype=object)])
+
+    @property
+    def version(self):
+        """Incremented by every append"""
+        return self.meta.get("version", 1)
+
+    def memory_report(self):
+        """Bytes per stored array; the row columns are memory-mapped, so they
+        are only resident while the page cache holds them"""
+        arrays = {name: getattr(self, name) for name in tuple(COLUMNS) + MASKS if getattr(self, name) is not None}
+        arrays.update(days=self.days, day_offsets=self.day_offsets)
+        arrays.update({f"rollup_{name}": values for name, values in (self.rollup or {}).items()})
+        columns = [{"name": name, "dtype": str(values.dtype), "bytes": int(values.nbytes)}
+                   for name, values in arrays.items()]
+        return {"rows": len(self), "segments": len(self.segment_names),
+                "bytes": sum(column["bytes"] for column in columns), "columns": columns}
+
+    def frame(self):
+        """Every stored row as a DataFrame with the upload's columns, in upload
+        order: the timestamp, Customer In/Out (float with NaN where counts
+        were missing), site/sensor (categoricals of their labels) and the
+        extra columns"""
+        roles = self.meta["traffic_columns"]
+        columns = {}
+        for role, labels_key in (("site", "sites"), ("sensor", "sensors")):
+            if roles.get(role):
+                columns[roles[role]] = pd.Categorical.from_codes(np.asarray(getattr(self, role)),
+                                                                 categories=self.meta[labels_key])
+        columns[roles["timestamp"]] = pd.to_datetime(np.asarray(self.ts).astype('datetime64[m]'))
+        for role, mask in MISSING.items():
+            counts = np.asarray(getattr(self, role))
+            if getattr(self, mask) is not None and np.asarray(getattr(self, mask)).any():
+                counts = np.where(getattr(self, mask), np.nan, counts)
+            columns[roles[role]] = counts
+        for index, name in enumerate(self.meta.get("extra_columns", [])):
+            values = self.extra_values(index, slice(0, len(self)))
+            columns[name] = pd.Series(values).infer_objects() if values.dtype == object else values
+        names = list(self.meta.get("columns", []))
+        names += [name for name in columns if name not in names]
+        return pd.DataFrame({name: columns[name] for name in names})
+
+    @property
+    def dates(self):
+        """Stored dates as 'YYYY-MM-DD' strings"""
+        return [str(day) for day in self.days.astype('datetime64[D]')]
+
+    def day_slice(self, date):
+        """Row slice holding one date (empty if the date is not stored)"""
+        return self._day_rows(epoch_day(date))
+
+    def _day_rows(self, day):
+        i = np.searchsorted(self.days, day)
+        if i >= len(self.days) or self.days[i] != day:
+            return slice(0, 0)
+        return slice(int(self.day_offsets[i]), int(self.day_offsets[i + 1]))
+
+    def day(self, date):
+        """Zero-copy views of every column for one date, plus minute-of-day"""
+        rows = self.day_slice(date)
+        view = {name: getattr(self, name)[rows] for name in COLUMNS}
+        view["minute"] = view["ts"] % MINUTES_PER_DAY
+        return view
+
+    def slot_grids(self, dates, buckets=DEFAULT_BUCKETS):
+        """Customer In/Out slot grids for dates, matching comparison.slot_matrix
+
+        Returns ([in_grid, out_grid], rows_per_date) where rows_per_date counts
+        rows inside the bucket window. The rollup answers the default grid and
+        coarser slots over the same window; anything else is bucketed from the
+        raw timestamps.
+        """
+        if self.rollup is not None and buckets.can_rebucket(DEFAULT_BUCKETS):
+            # Precomputed at ingest: pick the rows for the requested days
+            pos = day_positions(self.rollup, [epoch_day(date) for date in dates])
+            found = pos >= 0
+            grids = []
+            for name in ("slots_in", "slots_out"):
+                grid = np.zeros((len(dates), self.rollup[name].shape[1]), dtype=np.int64)
+                grid[found] = self.rollup[name][pos[found]]
+                grids.append(buckets.rebucket(grid, DEFAULT_BUCKETS))
+            rows_per_date = np.where(found, self.rollup["business_rows"][pos], 0)
+            return grids, rows_per_date
+
+        grid_in = np.zeros((len(dates), buckets.n_slots), dtype=np.int64)
+        grid_out = np.zeros_like(grid_in)
+        rows_per_date = np.zeros(len(dates), dtype=np.int64)
+
+        for i, date in enumerate(dates):
+            minute, customer_in, customer_out = self.local_day(date, buckets)
+            grid_in[i], grid_out[i] = buckets.day_grid(minute, [customer_in, customer_out])
+            rows_per_date[i] = np.count_nonzero(buckets.in_window(minute))
+
+        return [grid_in, grid_out], rows_per_date
+
+    def local_day(self, date, buckets=DEFAULT_BUCKETS):
+        """Minute-of-day and Customer In/Out of the rows on a date of the
+        buckets' wall clock; with a timezone the neighbouring stored days are
+        converted too, since rows can shift across midnight"""
+        if buckets.timezone is None:
+            view = self.day(date)
+            return view["minute"], view["customer_in"], view["customer_out"]
+
+        day = epoch_day(date)
+        slices = [self.day_slice(str(np.datetime64(d, 'D'))) for d in (day - 1, day, day + 1)]
+        ts = np.concatenate([self.ts[rows] for rows in slices])
+        local = buckets.local_minutes(ts)
+        keep = local // MINUTES_PER_DAY == day
+        counts = [np.concatenate([getattr(self, name)[rows] for rows in slices])[keep]
+                  for name in ("customer_in", "customer_out")]
+        return local[keep] % MINUTES_PER_DAY, counts[0], counts[1]
+
+
+class ColumnarStore:
+    """Directory of datasets read through memory maps
+
+    A dataset's meta.json names its segments; writes build a new dataset in
+    a temporary directory renamed into place, and appends add a segment
+    before atomically replacing meta.json, so readers always see a complete
+    dataset. Writers hold an exclusive lock on the store's .lock file, which
+    serializes them across server workers.
+
+    Datasets not opened for ttl_seconds are deleted, and least recently used
+    ones once the store exceeds max_bytes. Recency is the dataset directory's
+    modification time, refreshed on every open, so it is shared by all server
+    workers and survives restarts.
+    """
+
+    def __init__(self, directory, ttl_seconds=None, max_bytes=None):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # flock locks belong to open files, not threads, so threads also take this
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, dataset_id):
+        # Dataset IDs are hex UUIDs; refuse anything that could escape the directory
+        if not dataset_id or not dataset_id.isalnum():
+            raise ValueError("Invalid dataset ID")
+        return os.path.join(self.directory, dataset_id)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Exclusive access to the store for one writer in any process"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def write(self, dataset_id, frame, traffic_columns, extra_columns=(), schema=None):
+        """Persist the timestamp, counts and site/sensor labels of a parsed frame
+
+        traffic_columns maps the roles timestamp, customer_in, customer_out and
+        optionally site and sensor to column names in frame. extra_columns
+        are other columns of frame to keep so frame() can rebuild it; schema
+        is kept with the dataset as given.
+        """
+        extras = _extra_columns(frame, traffic_columns, extra_columns)
+        columns, labels = _frame_columns(frame, traffic_columns, extras=extras)
+        order = np.argsort(columns["ts"], kind='stable')
+        columns = {name: values[order] for name, values in columns.items()}
+
+        rollup = build_rollup(columns["ts"], columns["customer_in"], columns["customer_out"])
+        rollup.update(window_stats(rollup))
+        meta = dict(labels, rows=len(columns["ts"]), traffic_columns=traffic_columns, version=1,
+                    columns=[name for name in frame.columns if name in traffic_columns.values() or name in extras],
+                    extra_columns=extras, schema=schema)
+        path = self._path(dataset_id)
+        with self._locked():
+            if os.path.isdir(path):
+                # Rewriting a stored dataset: swap its segments like an append does
+                segments = [_write_segment(path, columns, rollup)]
+                meta.update(segments=segments, rollup=segments[0])
+                _write_meta(path, meta)
+                _prune(path, segments)
+            else:
+                tmp_path = tempfile.mkdtemp(prefix=f".{dataset_id}-", dir=self.directory)
+                try:
+                    segments = [_write_segment(tmp_path, columns, rollup)]
+                    meta.update(segments=segments, rollup=segments[0])
+                    _write_meta(tmp_path, meta)
+                    os.rename(tmp_path, path)
+                except BaseException:
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+                    raise
+        self.evict(keep=dataset_id)
+
+    def append(self, dataset_id, frame, traffic_columns, extra_columns=()):
+        """Merge a parsed frame into a stored dataset
+
+        Rows are deduplicated on (site, sensor, timestamp), appended rows
+        replacing stored ones. Extra columns match stored ones by name; new
+        ones are added, empty for the stored rows. The merged rows of the days the new rows fall
+        on become a new segment that supersedes those days, so an append costs
+        the days it touches rather than the whole dataset. With MAX_SEGMENTS
+        segments, or more superseded rows than live ones, the dataset is
+        compacted into one segment instead. Returns the affected dates, or
+        None if the dataset is not stored.
+        """
+        with self._locked():
+            path = self._path(dataset_id)
+            stored = self._load(path)
+            if stored is None:
+                return None
+
+            stored_extras = stored.meta.get("extra_columns", [])
+            added = [name for name in _extra_columns(frame, traffic_columns, extra_columns)
+                     if name not in stored_extras]
+            extras = stored_extras + added
+            new, labels = _frame_columns(frame, traffic_columns, stored.meta, extras)
+            if len(new["ts"]) == 0:
+                return []
+            new_days = np.unique(new["ts"] // MINUTES_PER_DAY)
+
+            # Stored rows of the affected days followed by the new rows, which win on duplicates
+            old_rows = [stored._day_rows(day) for day in new_days]
+            segment = {name: _concat([_stored_values(stored, name, rows) for rows in old_rows] + [values])
+                       for name, values in new.items()}
+            keys = pd.DataFrame({name: segment[name] for name in ("site", "sensor", "ts")})
+            unique = ~keys.duplicated(keep='last').to_numpy()
+            order = np.argsort(segment["ts"][unique], kind='stable')
+            segment = {name: values[unique][order] for name, values in segment.items()}
+            segment_days = np.unique(segment["ts"] // MINUTES_PER_DAY)
+
+            rows = len(stored) - sum(rows.stop - rows.start for rows in old_rows) + len(segment["ts"])
+            superseded = stored.stored_rows + len(segment["ts"]) - rows
+            if (stored.rollup is None or len(stored.segment_names) >= MAX_SEGMENTS
+                    or superseded > rows):
+                columns = _splice(stored, segment, segment_days)
+                rollup = build_rollup(columns["ts"], columns["customer_in"], columns["customer_out"])
+                rollup.update(window_stats(rollup, stored.rollup, segment_days))
+                segments = [_write_segment(path, columns, rollup)]
+            else:
+                update = build_rollup(segment["ts"], segment["customer_in"], segment["customer_out"])
+                rollup = merge_rollup(stored.rollup, update)
+                # Baselines of the days whose trailing window holds an appended day
+                rollup.update(window_stats(rollup, stored.rollup, segment_days))
+                segments = stored.segment_names + [_write_segment(path, segment, rollup)]
+
+            meta = dict(stored.meta, rows=rows, segments=segments, rollup=segments[-1],
+                        version=stored.version + 1, extra_columns=extras,
+                        columns=stored.meta.get("columns", []) + added, **labels)
+            _write_meta(path, meta)
+            _prune(path, segments)
+        self.evict(keep=dataset_id)
+        return [str(day) for day in segment_days.astype('datetime64[D]')]
+
+    def _load(self, path):
+        # A compaction can remove segments between reading meta.json and
+        # mapping them; the second read sees the new meta.json
+        for _ in range(2):
+            try:
+                return TrafficColumns(path)
+            except FileNotFoundError:
+                continue
+        return None
+
+    def open(self, dataset_id):
+        """Memory-map a stored dataset, or return None if it does not exist or has expired"""
+        try:
+            path = self._path(dataset_id)
+        except ValueError:
+            return None
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            return None
+        if self._is_expired(path, time.time()):
+            self.delete(dataset_id)
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return self._load(path)
+
+    def version(self, dataset_id):
+        """Version of a stored dataset (see TrafficColumns.version), or None if
+        it is not stored; reads only meta.json"""
+        try:
+            with open(os.path.join(self._path(dataset_id), 'meta.json'), 'r') as f:
+                return json.load(f).get("version", 1)
+        except (ValueError, OSError):
+            return None
+
+    def delete(self, dataset_id):
+        with self._locked():
+            return self._delete(dataset_id)
+
+    def _delete(self, dataset_id):
+        try:
+            path = self._path(dataset_id)
+        except ValueError:
+            return False
+        if not os.path.isdir(path):
+            return False
+        shutil.rmtree(path, ignore_errors=True)
+        return True
+
+    def evict(self, keep=None):
+        """Delete expired datasets, then least recently used ones until the
+        store is within max_bytes (the dataset keep is never evicted)"""
+        with self._locked():
+            now = time.time()
+            entries = []
+            for dataset_id, size, mtime in self._entries():
+                if dataset_id != keep and self._is_expired(self._path(dataset_id), now, mtime):
+                    self._delete(dataset_id)
+                else:
+                    entries.append((dataset_id, size, mtime))
+
+            if self.max_bytes is None:
+                return
+            total = sum(size for _, size, _ in entries)
+            for dataset_id, size, _ in sorted(entries, key=lambda entry: entry[2]):
+                if total <= self.max_bytes:
+                    break
+                if dataset_id != keep:
+                    self._delete(dataset_id)
+                    total -= size
+
+    def _is_expired(self, path, now, mtime=None):
+        if self.ttl_seconds is None:
+            return False
+        if mtime is None:
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                return False
+        return now - mtime > self.ttl_seconds
+
+    def _entries(self):
+        """(dataset_id, bytes on disk, last use) for every stored dataset"""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            # Skips temporary directories of writes in progress
+            if not name.isalnum() or not os.path.isdir(path):
+                continue
+            try:
+                mtime = os.stat(path).st_mtime
+                size = sum(os.path.getsize(os.path.join(root, file))
+                           for root, _, files in os.walk(path) for file in files)
+            except FileNotFoundError:
+                continue
+            entries.append((name, size, mtime))
+        return entries
+
+
+def _load_segment(directory):
+    segment = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r') for name in COLUMNS}
+    for name in MASKS:
+        path = os.path.join(directory, f"{name}.npy")
+        segment[name] = np.load(path, mmap_mode='r') if os.path.exists(path) else None
+    segment["days"] = np.load(os.path.join(directory, 'days.npy'))
+    segment["day_offsets"] = np.load(os.path.join(directory, 'day_offsets.npy'))
+    return segment
+
+
+def _write_segment(path, columns, rollup):
+    """Write sorted columns with their day index and rollup as a new segment
+    of the dataset directory path; returns the segment's name"""
+    columns = dict(
+        {name: values.astype(COLUMNS[name]) for name, values in columns.items() if name in COLUMNS},
+        **{name: values for name, values in columns.items() if name not in COLUMNS and name not in MASKS},
+        **{name: columns[name].astype(bool) for name in MASKS if columns[name].any()},
+    )
+
+    # Per-day index: sorted unique days and the row offset where each starts
+    day_of_row = columns["ts"] // MINUTES_PER_DAY
+    days, starts = np.unique(day_of_row, return_index=True)
+    day_offsets = np.append(starts, len(day_of_row)).astype(np.int64)
+
+    # Hidden until complete, then renamed without the leading dot
+    tmp_path = tempfile.mkdtemp(prefix='.segment-', dir=path)
+    for name, values in columns.items():
+        if values.dtype == object:
+            # Text and other Python objects: codes into a pickled label array (-1 for missing)
+            values, labels = pd.factorize(values)
+            values = values.astype(np.int32)
+            np.save(os.path.join(tmp_path, f"{name}_labels.npy"), np.asarray(labels, dtype=object))
+        np.save(os.path.join(tmp_path, f"{name}.npy"), values)
+    np.save(os.path.join(tmp_path, 'days.npy'), days)
+    np.save(os.path.join(tmp_path, 'day_offsets.npy'), day_offsets)
+    save_rollup(tmp_path, rollup)
+    name = os.path.basename(tmp_path)[1:]
+    os.rename(tmp_path, os.path.join(path, name))
+    return name
+
+
+def _write_meta(path, meta):
+    """Replace a dataset's meta.json atomically"""
+    fd, tmp_path = tempfile.mkstemp(prefix='.meta-', dir=path)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+
+def _prune(path, segments):
+    """Remove what meta.json no longer references: replaced segments and the
+    top-level files of a compacted pre-segment dataset"""
+    for name in os.listdir(path):
+        target = os.path.join(path, name)
+        if name == 'meta.json' or name in segments or ('.' in segments and name.endswith('.npy')):
+            continue
+        if os.path.isdir(target):
+            shutil.rmtree(target, ignore_errors=True)
+        else:
+            os.remove(target)
+
+
+def _splice(stored, segment, segment_days):
+    """Every live row of a stored dataset with the days of segment replaced,
+    as sorted columns"""
+    offsets = np.append(np.searchsorted(segment["ts"] // MINUTES_PER_DAY, segment_days),
+                        len(segment["ts"]))
+    stored_columns = {name: np.asarray(_stored_values(stored, name, slice(0, len(stored)))) for name in segment}
+    untouched = np.flatnonzero(~np.isin(stored.days, segment_days))
+    pieces = sorted(
+        [(stored.days[i], stored_columns, stored.day_offsets[i], stored.day_offsets[i + 1]) for i in untouched]
+        + [(day, segment, offsets[i], offsets[i + 1]) for i, day in enumerate(segment_days)],
+        key=lambda piece: piece[0]
+    )
+    return {
+        name: _concat([source[name][start:stop] for _, source, start, stop in pieces] or [segment[name][:0]])
+        for name in segment
+    }
+
+
+def _stored_values(stored, name, rows):
+    """Rows of a stored column; an absent missing-count mask reads as all
+    False and an extra column the dataset lacks as all None"""
+    if name.startswith(EXTRA):
+        index = int(name[len(EXTRA):])
+        if index < len(stored.meta.get("extra_columns", [])):
+            return stored.extra_values(index, rows)
+        return np.full(rows.stop - rows.start, None, dtype=object)
+    column = getattr(stored, name)
+    if column is None:
+        return np.zeros(rows.stop - rows.start, dtype=bool)
+    return column[rows]
+
+
+def _load_extra(path, index, rows):
+    """Decoded values of one extra column of a segment (None if it has none)"""
+    values_path = os.path.join(path, f"{EXTRA}{index}.npy")
+    if not os.path.exists(values_path):
+        return np.full(rows, None, dtype=object)
+    values = np.load(values_path, mmap_mode='r')
+    labels_path = os.path.join(path, f"{EXTRA}{index}_labels.npy")
+    if not os.path.exists(labels_path):
+        return values
+    # Written by this store only, so unpickling the labels is safe
+    labels = np.load(labels_path, allow_pickle=True)
+    decoded = np.full(len(values), None, dtype=object)
+    present = values >= 0
+    decoded[present] = labels[values[present]]
+    return decoded
+
+
+def _concat(pieces):
+    """np.concatenate, falling back to objects when the pieces' dtypes differ"""
+    filled = [piece for piece in pieces if len(piece)] or pieces[:1]
+    if len({piece.dtype for piece in filled}) > 1:
+        filled = [piece if piece.dtype == object else pd.Series(piece).to_numpy(dtype=object) for piece in filled]
+    return np.concatenate(filled)
+
+
+def _extra_columns(frame, traffic_columns, extra_columns):
+    """Columns of frame stored as extras: extra_columns, plus site/sensor
+    columns that do not hold text (their codes would turn numbers into labels)"""
+    extras = [name for name in extra_columns if name in frame.columns]
+    for role in ("site", "sensor"):
+        name = traffic_columns.get(role)
+        if (name in frame.columns and name not in extras
+                and not pd.api.types.is_object_dtype(frame[name])
+                and not pd.api.types.is_string_dtype(frame[name])
+                and not isinstance(frame[name].dtype, pd.CategoricalDtype)):
+            extras.append(name)
+    return extras
+
+
+def _counts(series):
+    """Counts as int32 with missing values as 0, and the missing-value mask"""
+    counts = pd.to_numeric(series, errors='coerce')
+    return counts.fillna(0).to_numpy(dtype=np.int64).astype(np.int32), counts.isna().to_numpy()
+
+
+def _frame_columns(frame, traffic_columns, known_labels=None, extras=()):
+    """Unsorted store columns for the rows of frame with a valid timestamp,
+    plus the site/sensor label lists (extending known_labels' lists); the
+    extras columns become extra_<i> (all None when frame lacks one)"""
+    ts = pd.to_datetime(frame[traffic_columns["timestamp"]], errors='coerce')
+    valid = ts.notna().to_numpy()
+
+    columns = {"ts": ts.to_numpy()[valid].astype('datetime64[m]').astype(np.int64)}
+    for role, mask in MISSING.items():
+        counts, missing = _counts(frame[traffic_columns[role]])
+        columns[role], columns[mask] = counts[valid], missing[valid]
+    for index, name in enumerate(extras):
+        key = f"{EXTRA}{index}"
+        columns[key] = frame[name].to_numpy()[valid] if name in frame.columns else np.full(valid.sum(), None, dtype=object)
+    labels = {}
+    for role, labels_key in (("site", "sites"), ("sensor", "sensors")):
+        known = (known_labels or {}).get(labels_key, [])
+        codes, labels[labels_key] = _encode_labels(frame, traffic_columns.get(role), known)
+        columns[role] = codes[valid]
+    return columns, labels
+
+
+def _encode_labels(frame, column, known=()):
+    """Integer codes and label list for a site/sensor column (all zeros if absent)
+
+    Labels in known keep their codes; new labels are appended in sorted order.
+    """
+    if column is None or column not in frame.columns:
+        return np.zeros(len(frame), dtype=np.int32), list(known)
+    values = frame[column].astype(str)
+    labels = list(known) + sorted(set(values.unique()) - set(known))
+    codes = pd.Index(labels).get_indexer(values)
+    return codes.astype(np.int32), [str(label) for label in labels]
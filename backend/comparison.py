@@ -0,0 +1,232 @@
+"""
+Vectorized comparison engine for the Traffic Analytics API
+Buckets each day's rows into a slot grid (time_buckets) once and computes
+differences, ratios and highlight flags as NumPy arrays
+"""
+
+import numpy as np
+import pandas as pd
+
+from columnar_store import epoch_day
+from highlight_rules import RuleContext, default_rules, evaluate_rules, history_weeks, trailing_history
+from rollups import build_rollup, day_positions
+from schema import infer_schema, schema_timestamps
+from time_buckets import DEFAULT_BUCKETS, DAY_END_HOUR, DAY_START_HOUR, MINUTES_PER_DAY
+
+# Ratio reported when one side of a slot is zero
+NO_RATIO = 999999
+
+
+def slot_matrix(date_keys, minutes, values, dates, buckets=DEFAULT_BUCKETS):
+    """Sum values into a (len(dates), n_slots) grid
+
+    date_keys and minutes are per-row arrays; rows whose date is not in
+    dates or whose minute falls outside the bucket window are ignored.
+    Returns the grid and the number of rows inside the window for each date.
+    """
+    date_idx = pd.Index(dates).get_indexer(date_keys)
+    return buckets.grid(date_idx, minutes, values, len(dates))
+
+
+def frame_slot_grids(df, schema, dates, buckets=DEFAULT_BUCKETS):
+    """Customer In/Out slot grids for dates from a processed DataFrame
+
+    schema is the frame's schema.infer_schema result; its timestamp (or date
+    and time) and count columns are read directly. Raises ValueError when a
+    needed column is missing or when buckets need rows the frame does not
+    hold: processed frames keep business hours only, on the stored wall clock.
+    """
+    if buckets.timezone or buckets.open_hour < DAY_START_HOUR or buckets.close_hour > DAY_END_HOUR:
+        raise ValueError("Timezones and hours outside 8am-8pm need a dataset_id from a recent upload")
+
+    customer_in_col, customer_out_col = schema.get('customer_in'), schema.get('customer_out')
+    if customer_in_col not in df.columns or customer_out_col not in df.columns:
+        raise ValueError("Cannot find Customer In/Out columns")
+
+    timestamps = schema_timestamps(df, schema)
+    if timestamps is None:
+        raise ValueError("No timestamp or Date/Time columns found in data")
+
+    # Epoch minutes; NaT becomes the smallest int64, a day no date matches
+    ts = timestamps.to_numpy().astype('datetime64[m]').astype(np.int64)
+    return slot_matrix(
+        ts // MINUTES_PER_DAY,
+        ts % MINUTES_PER_DAY,
+        [pd.to_numeric(df[customer_in_col], errors='coerce'),
+         pd.to_numeric(df[customer_out_col], errors='coerce')],
+        [epoch_day(date) for date in dates],
+        buckets
+    )
+
+
+class FrameSlots:
+    """Slot lookups over a processed DataFrame, mirroring columnar_store.TrafficColumns"""
+
+    def __init__(self, df, schema=None):
+        self.df = df
+        # Resolved at upload for stored frames; posted rows are inferred here
+        self.schema = schema or infer_schema(df)
+
+    @property
+    def dates(self):
+        """Dates present in the frame as sorted 'YYYY-MM-DD' strings"""
+        date_col = next((col for col in ['Date', 'date', 'DATE'] if col in self.df.columns), None)
+        if date_col is None:
+            return []
+        return sorted(str(date) for date in self.df[date_col].dropna().unique())
+
+    def slot_grids(self, dates, buckets=DEFAULT_BUCKETS):
+        return frame_slot_grids(self.df, self.schema, dates, buckets)
+
+
+class UploadSlots:
+    """Slot lookups over rows read straight from a workbook (the Streamlit
+    app), on the buckets' wall clock; mirrors columnar_store.TrafficColumns
+
+    Timestamps are parsed through schema.infer_schema (ValueError when there
+    are none). data holds the rows with a timestamp plus their local Date,
+    Time and Hour. The rollup (None unless buckets use the recorded clock and
+    the default window) answers business-hours totals.
+    """
+
+    def __init__(self, df, traffic_columns, buckets=DEFAULT_BUCKETS):
+        timestamps = schema_timestamps(df, infer_schema(df, traffic_columns))
+        if timestamps is None:
+            raise ValueError("No timestamp column (or Date and Time columns) found in the file")
+        data = df[timestamps.notna()].copy()
+        timestamps = timestamps[timestamps.notna()]
+        # Epoch minutes on the chosen wall clock; date and time components follow from them
+        local_minutes = buckets.local_minutes(timestamps.to_numpy().astype('datetime64[m]').astype(np.int64))
+        self.day_of_row = local_minutes // MINUTES_PER_DAY
+        self.minute_of_day = local_minutes % MINUTES_PER_DAY
+        local = pd.to_datetime(local_minutes.astype('datetime64[m]'))
+        data['Date'] = local.date
+        data['Time'] = local.time
+        data['Hour'] = self.minute_of_day // 60
+        self.data = data
+        self.counts = [data[traffic_columns['customer_in']].fillna(0).to_numpy(),
+                       data[traffic_columns['customer_out']].fillna(0).to_numpy()]
+
+        # Per-day totals, computed once per upload; the rollup covers the
+        # default window on the recorded clock, whatever the slot width
+        self.rollup = None
+        if buckets.timezone is None and (buckets.open_hour, buckets.close_hour) == (DEFAULT_BUCKETS.open_hour, DEFAULT_BUCKETS.close_hour):
+            self.rollup = build_rollup(local_minutes, *self.counts)
+
+    @property
+    def dates(self):
+        """Dates with rows on the buckets' wall clock as sorted 'YYYY-MM-DD' strings"""
+        return [str(day) for day in np.unique(self.day_of_row).astype('datetime64[D]')]
+
+    def slot_grids(self, dates, buckets=DEFAULT_BUCKETS, with_rows=False):
+        day_idx = pd.Index(np.array(dates, dtype='datetime64[D]').astype(np.int64)).get_indexer(self.day_of_row)
+        values = self.counts + ([np.ones(len(self.data))] if with_rows else [])
+        return buckets.grid(day_idx, self.minute_of_day, values, len(dates))
+
+
+def compare_days(slots, date1, date2, rules, buckets=DEFAULT_BUCKETS):
+    """The Streamlit app's comparison of two dates of an UploadSlots source
+
+    Returns (table, bits_in, bits_out, totals): the slots with data on both
+    dates with Customer In/Out per date and their increase/decrease, the
+    rules' bitmasks per table row, and the business-hours [in, out] totals of
+    each date (from the rollup when there is one, else from the grids).
+    """
+    # Bucket both dates into the slot grid in one pass (row counts mark slots with data)
+    (grid_in, grid_out, grid_rows), _ = slots.slot_grids([date1, date2], buckets, with_rows=True)
+    if slots.rollup is not None:
+        pos = day_positions(slots.rollup, [epoch_day(date1), epoch_day(date2)])
+        totals = np.stack([slots.rollup['business_in'][pos], slots.rollup['business_out'][pos]], axis=1)
+    else:
+        totals = np.stack([grid_in.sum(axis=1), grid_out.sum(axis=1)], axis=1)
+
+    # Only time slots with data on both dates (no extra 0000)
+    common = (grid_rows[0] > 0) & (grid_rows[1] > 0)
+    table = pd.DataFrame({
+        'Time': np.array(buckets.labels(), dtype=object)[common],
+        f'{date1}-Customer In': grid_in[0][common],
+        f'{date2}-Customer In': grid_in[1][common],
+        'Customer In Increase/Decrease': grid_in[1][common] - grid_in[0][common],
+        f'{date1}-Customer Out': grid_out[0][common],
+        f'{date2}-Customer Out': grid_out[1][common],
+        'Customer Out Increase/Decrease': grid_out[1][common] - grid_out[0][common],
+    })
+
+    # Evaluate the highlight rules over every slot at once
+    history = (None, None)
+    weeks = history_weeks(rules)
+    if weeks:
+        history_in, history_out = trailing_history(slots, [str(date2)], weeks, buckets)
+        history = (history_in[0][:, common], history_out[0][:, common])
+    bits_in, bits_out = evaluate_rules(rules, RuleContext(
+        grid_in[0][common], grid_in[1][common], grid_out[0][common], grid_out[1][common], *history
+    ))
+    return table, bits_in, bits_out, totals
+
+
+def ratio(a, b):
+    """Element-wise max/min ratio, NO_RATIO where either side is zero"""
+    low = np.minimum(a, b)
+    high = np.maximum(a, b)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(low > 0, high / np.where(low > 0, low, 1), NO_RATIO)
+
+
+def compare_slots(date1_in, date2_in, date1_out, date2_out, min_ratio_threshold=4, rules=None,
+                  history=(None, None)):
+    """Differences, ratios and highlight bitmasks for aligned slot arrays
+
+    rules=None means the zero / ratio >= min_ratio_threshold rules (an empty
+    list highlights nothing); history is the (history_in, history_out) pair
+    from highlight_rules.trailing_history.
+    """
+    ratio_in = ratio(date1_in, date2_in)
+    ratio_out = ratio(date1_out, date2_out)
+
+    if rules is None:
+        rules = default_rules(min_ratio_threshold)
+    highlight_in, highlight_out = evaluate_rules(
+        rules, RuleContext(date1_in, date2_in, date1_out, date2_out, *history)
+    )
+
+    return {
+        "difference": date2_in - date1_in,
+        "differenceOut": date2_out - date1_out,
+        "ratioIn": ratio_in,
+        "ratioOut": ratio_out,
+        "highlight_in": highlight_in,
+        "highlight_out": highlight_out,
+        "should_highlight": (highlight_in | highlight_out) != 0,
+    }
+
+
+def comparison_records(labels, date1_in, date2_in, date1_out, date2_out, compared, rows=None):
+    """Build the JSON rows returned by /api/compare, optionally only for slot positions rows"""
+    arrays = [
+        np.asarray(labels, dtype=object),
+        date1_in, date2_in, compared["difference"],
+        date1_out, date2_out, compared["differenceOut"],
+        compared["ratioIn"], compared["ratioOut"],
+        compared["should_highlight"], compared["highlight_in"], compared["highlight_out"],
+    ]
+    if rows is not None:
+        arrays = [array[rows] for array in arrays]
+    columns = zip(*(array.tolist() for array in arrays))
+    return [
+        {
+            "timeSlot": label,
+            "date1Value": d1_in,
+            "date2Value": d2_in,
+            "difference": diff_in,
+            "date1OutValue": d1_out,
+            "date2OutValue": d2_out,
+            "differenceOut": diff_out,
+            "ratioIn": ratio_in,
+            "ratioOut": ratio_out,
+            "should_highlight": highlight,
+            "highlightIn": bits_in,
+            "highlightOut": bits_out,
+        }
+        for (label, d1_in, d2_in, diff_in, d1_out, d2_out, diff_out,
+             ratio_in, ratio_out, highlight, bits_in, bits_out) in columns
+    ]
@@ -0,0 +1,126 @@
+"""
+Server-side dataset store for the Traffic Analytics API
+Keeps parsed uploads in memory under a dataset ID so clients can refer to
+them instead of posting every row back on each request
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class Dataset:
+    """A parsed upload held by the store"""
+
+    def __init__(self, dataset_id, frame, meta=None):
+        self.id = dataset_id
+        self.frame = frame
+        self.meta = meta or {}
+        self.nbytes = int(frame.memory_usage(index=True, deep=True).sum())
+        self.created_at = time.time()
+        self.last_access = self.created_at
+
+    def memory_report(self):
+        """Bytes held per column (with dtypes) and in total"""
+        usage = self.frame.memory_usage(index=True, deep=True)
+        return {
+            "rows": len(self.frame),
+            "bytes": self.nbytes,
+            "index_bytes": int(usage.iloc[0]),
+            "columns": [
+                {"name": str(name), "dtype": str(self.frame[name].dtype), "bytes": int(nbytes)}
+                for name, nbytes in zip(self.frame.columns, usage.iloc[1:])
+            ],
+        }
+
+
+class DatasetStore:
+    """Thread-safe in-memory store with TTL, LRU eviction and a memory budget"""
+
+    def __init__(self, max_bytes=1024 * 1024 * 1024, ttl_seconds=3600, max_entries=64):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, frame, meta=None, dataset_id=None):
+        """Store a DataFrame and return its dataset ID (a new one unless given)"""
+        dataset_id = dataset_id or uuid.uuid4().hex
+        dataset = Dataset(dataset_id, frame, meta)
+
+        with self._lock:
+            if dataset_id in self._entries:
+                self._remove(dataset_id)
+            self._entries[dataset_id] = dataset
+            self._total_bytes += dataset.nbytes
+            self._evict()
+
+        return dataset_id
+
+    def get(self, dataset_id):
+        """Return the Dataset for an ID, or None if unknown or expired"""
+        with self._lock:
+            dataset = self._entries.get(dataset_id)
+            if dataset is None:
+                return None
+
+            if self._is_expired(dataset, time.time()):
+                self._remove(dataset_id)
+                return None
+
+            dataset.last_access = time.time()
+            self._entries.move_to_end(dataset_id)
+            return dataset
+
+    def update(self, dataset_id, frame, meta=None):
+        """Replace the frame (and meta) of a stored dataset, keeping its ID.
+        Returns False if the dataset is unknown or expired."""
+        with self._lock:
+            dataset = self._entries.get(dataset_id)
+            if dataset is None or self._is_expired(dataset, time.time()):
+                return False
+            self._remove(dataset_id)
+            self._entries[dataset_id] = Dataset(dataset_id, frame, meta if meta is not None else dataset.meta)
+            self._total_bytes += self._entries[dataset_id].nbytes
+            self._evict()
+            return True
+
+    def delete(self, dataset_id):
+        """Remove a dataset, returning True if it existed"""
+        with self._lock:
+            if dataset_id not in self._entries:
+                return False
+            self._remove(dataset_id)
+            return True
+
+    def stats(self):
+        """Summary of current store usage"""
+        with self._lock:
+            return {
+                "datasets": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+    def _is_expired(self, dataset, now):
+        return self.ttl_seconds is not None and now - dataset.last_access > self.ttl_seconds
+
+    def _remove(self, dataset_id):
+        dataset = self._entries.pop(dataset_id)
+        self._total_bytes -= dataset.nbytes
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones until within budget"""
+        now = time.time()
+        for dataset_id in [key for key, ds in self._entries.items() if self._is_expired(ds, now)]:
+            self._remove(dataset_id)
+
+        # Always keep the most recent entry, even if it alone exceeds the budget
+        while len(self._entries) > 1 and (
+            self._total_bytes > self.max_bytes or len(self._entries) > self.max_entries
+        ):
+            self._remove(next(iter(self._entries)))
@@ -0,0 +1,234 @@
+"""
+Highlight rule engine for slot comparisons
+Each rule is evaluated as a NumPy mask over whole comparison matrices and
+sets its own bit in per-cell uint8 masks, one for Customer In and one for
+Customer Out, so "highlighted only" is a single boolean index
+"""
+
+import numpy as np
+
+from baselines import trailing_windows, weekday
+
+# Rule name -> rule class, filled by @register_rule
+RULES = {}
+
+
+def register_rule(cls):
+    """Class decorator adding a rule under its name; bits are assigned in order"""
+    if len(RULES) >= 8:
+        raise ValueError("At most 8 highlight rules fit in a uint8 mask")
+    cls.bit = 1 << len(RULES)
+    RULES[cls.name] = cls
+    return cls
+
+
+class Rule:
+    """Base class: evaluate() returns boolean (in_mask, out_mask) arrays
+    broadcast to the shape of the compared values"""
+
+    name = None
+    bit = 0
+    # True if the rule needs trailing same-weekday history (see trailing_history)
+    needs_history = False
+
+    def __init__(self, threshold=None):
+        if threshold is not None:
+            self.threshold = float(threshold)
+
+    def params(self):
+        return {"rule": self.name, "bit": self.bit, "threshold": getattr(self, 'threshold', None)}
+
+    def evaluate(self, ctx):
+        raise NotImplementedError
+
+
+@register_rule
+class ZeroRule(Rule):
+    """Either date has no traffic in the slot"""
+
+    name = 'zero'
+
+    def evaluate(self, ctx):
+        return (ctx.base_in == 0) | (ctx.cur_in == 0), (ctx.base_out == 0) | (ctx.cur_out == 0)
+
+
+@register_rule
+class RatioRule(Rule):
+    """max/min of the two dates at or above threshold (both sides non-zero)"""
+
+    name = 'ratio'
+    threshold = 4.0
+
+    def evaluate(self, ctx):
+        def check(a, b):
+            low = np.minimum(a, b)
+            high = np.maximum(a, b)
+            return (low > 0) & (high / np.where(low > 0, low, 1) >= self.threshold)
+        return check(ctx.base_in, ctx.cur_in), check(ctx.base_out, ctx.cur_out)
+
+
+@register_rule
+class AbsDeltaRule(Rule):
+    """Absolute change between the dates at or above threshold"""
+
+    name = 'abs_delta'
+    threshold = 50.0
+
+    def evaluate(self, ctx):
+        return (np.abs(ctx.cur_in - ctx.base_in) >= self.threshold,
+                np.abs(ctx.cur_out - ctx.base_out) >= self.threshold)
+
+
+@register_rule
+class ZScoreRule(Rule):
+    """Compared value more than threshold standard deviations from the mean of
+    the same slot over the latest weeks stored same-weekday days (the days
+    /api/anomalies would take as its baseline window)"""
+
+    name = 'zscore'
+    threshold = 3.0
+    needs_history = True
+    weeks = 4
+    min_weeks = 2
+
+    def __init__(self, threshold=None, weeks=None, min_weeks=None):
+        super().__init__(threshold)
+        if weeks is not None:
+            self.weeks = int(weeks)
+        if min_weeks is not None:
+            self.min_weeks = int(min_weeks)
+        if not 1 <= self.min_weeks <= self.weeks:
+            raise ValueError("zscore needs 1 <= min_weeks <= weeks")
+
+    def params(self):
+        return dict(super().params(), weeks=self.weeks, min_weeks=self.min_weeks)
+
+    def evaluate(self, ctx):
+        if ctx.history_in is None:
+            no_flags = np.zeros(np.broadcast(ctx.cur_in, ctx.base_in).shape, dtype=bool)
+            return no_flags, no_flags
+
+        def check(current, history):
+            # history: (..., weeks, slots) with NaN for weeks without data
+            valid = ~np.isnan(history)
+            weeks = valid.sum(axis=-2)
+            n = np.maximum(weeks, 1)
+            mean = np.where(valid, history, 0).sum(axis=-2) / n
+            std = np.sqrt(np.where(valid, (history - mean[..., None, :]) ** 2, 0).sum(axis=-2) / n)
+            deviation = np.abs(current - mean)
+            return (weeks >= self.min_weeks) & (std > 0) & (deviation >= self.threshold * std)
+        return check(ctx.cur_in, ctx.history_in), check(ctx.cur_out, ctx.history_out)
+
+
+@register_rule
+class ImbalanceRule(Rule):
+    """In and Out on the compared date differ by at least threshold of their
+    total (0.5: one side is 3x the other), ignoring slots under min_total"""
+
+    name = 'imbalance'
+    threshold = 0.5
+    min_total = 10
+
+    def __init__(self, threshold=None, min_total=None):
+        super().__init__(threshold)
+        if min_total is not None:
+            self.min_total = int(min_total)
+
+    def params(self):
+        return dict(super().params(), min_total=self.min_total)
+
+    def evaluate(self, ctx):
+        total = ctx.cur_in + ctx.cur_out
+        mask = (total >= self.min_total) & (np.abs(ctx.cur_in - ctx.cur_out) >= self.threshold * total)
+        return mask, mask
+
+
+class RuleContext:
+    """Arrays a rule can look at: the baseline and compared values, and
+    optionally trailing same-weekday history of the compared dates"""
+
+    def __init__(self, base_in, cur_in, base_out, cur_out, history_in=None, history_out=None):
+        self.base_in = np.asarray(base_in, dtype=np.float64)
+        self.cur_in = np.asarray(cur_in, dtype=np.float64)
+        self.base_out = np.asarray(base_out, dtype=np.float64)
+        self.cur_out = np.asarray(cur_out, dtype=np.float64)
+        self.history_in = history_in
+        self.history_out = history_out
+
+
+def default_rules(min_ratio_threshold=4):
+    """The original red-highlight rule: a zero value or a ratio >= threshold"""
+    return [ZeroRule(), RatioRule(min_ratio_threshold)]
+
+
+def build_rules(specs, min_ratio_threshold=4):
+    """Rules from request specs like [{"rule": "ratio", "threshold": 4}, ...]
+
+    None gives default_rules(min_ratio_threshold). Raises ValueError for
+    unknown rules or parameters.
+    """
+    if specs is None:
+        return default_rules(min_ratio_threshold)
+    if not isinstance(specs, list):
+        raise ValueError("rules must be a list of {\"rule\": name, ...} objects")
+
+    rules = []
+    for spec in specs:
+        if not isinstance(spec, (str, dict)):
+            raise ValueError("Each highlight rule must be a rule name or a {\"rule\": name, ...} object")
+        spec = {"rule": spec} if isinstance(spec, str) else dict(spec)
+        cls = RULES.get(spec.pop("rule", None))
+        if cls is None:
+            raise ValueError(f"Unknown highlight rule. Use one of: {', '.join(RULES)}")
+        try:
+            rules.append(cls(**spec))
+        except TypeError:
+            raise ValueError(f"Invalid parameters for highlight rule '{cls.name}': {', '.join(spec)}")
+    return rules
+
+
+def history_weeks(rules):
+    """Largest number of trailing weeks any rule needs (0 if none)"""
+    return max((rule.weeks for rule in rules if rule.needs_history), default=0)
+
+
+def trailing_history(source, dates, weeks, buckets):
+    """(history_in, history_out) for RuleContext: (len(dates), weeks, n_slots)
+    slot grids of the latest weeks stored same-weekday days before each date
+    with rows in the buckets' window, oldest first, NaN where fewer are stored
+
+    The days are picked by baselines.trailing_windows, as for anomaly
+    baselines. source is any slot source (columnar store, FrameSlots or
+    UploadSlots).
+    """
+    days = np.array(dates, dtype='datetime64[D]').astype(np.int64)
+    stored = np.array(source.dates, dtype='datetime64[D]').astype(np.int64)
+    # Every earlier stored day on a weekday being compared; only those with rows in the window count
+    candidates = stored[np.isin(weekday(stored), weekday(days)) & (stored < days.max(initial=0))]
+    (grid_in, grid_out), rows_per_date = source.slot_grids([str(day) for day in candidates.astype('datetime64[D]')],
+                                                           buckets)
+
+    windows = trailing_windows({"days": candidates, "business_rows": rows_per_date}, days, weeks)
+    history = []
+    for grid in (grid_in, grid_out):
+        # Position -1 (no day) picks a row of NaN appended to the grid
+        padded = np.vstack([grid.astype(np.float64), np.full((1, grid.shape[1]), np.nan)])
+        history.append(padded[windows])
+    return history[0], history[1]
+
+
+def evaluate_rules(rules, ctx):
+    """Per-cell uint8 bitmasks (in_bits, out_bits) with each firing rule's bit set"""
+    shape = np.broadcast(ctx.base_in, ctx.cur_in).shape
+    in_bits = np.zeros(shape, dtype=np.uint8)
+    out_bits = np.zeros(shape, dtype=np.uint8)
+    for rule in rules:
+        in_mask, out_mask = rule.evaluate(ctx)
+        in_bits |= np.where(in_mask, rule.bit, 0).astype(np.uint8)
+        out_bits |= np.where(out_mask, rule.bit, 0).astype(np.uint8)
+    return in_bits, out_bits
+
+
+def rule_legend(rules):
+    """Rule names, bits and parameters for API responses"""
+    return [rule.params() for rule in rules]
@@ -0,0 +1,310 @@
+"""
+Read-only xlsx ingestion for traffic counter exports
+Streams rows from the workbook, keeps only the requested columns and
+parses counts and datetime cells while reading; text timestamps are left
+for schema.infer_schema to parse with a detected format. Sheets can be read
+one at a time, tagged with where they came from and merged into one frame
+"""
+
+import time
+from operator import itemgetter
+
+import openpyxl
+import pandas as pd
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # optional, much faster Rust-based reader
+    CalamineWorkbook = None
+
+# Source positions of the columns the analysis uses (C, E, F)
+TIMESTAMP_INDEX = 2
+CUSTOMER_IN_INDEX = 4
+CUSTOMER_OUT_INDEX = 5
+
+# usecols preset selecting just the timestamp, Customer In/Out and site/sensor columns
+TRAFFIC = 'traffic'
+
+# Columns added to every ingested row to record where it came from
+SOURCE_FILE = 'Source File'
+SOURCE_SHEET = 'Source Sheet'
+# Site column added from the sheet name when a sheet has none of its own
+SITE = 'Site'
+
+# How often (in rows) read_xlsx reports progress
+PROGRESS_EVERY = 10000
+
+
+def detect_traffic_columns(header):
+    """Map the timestamp / Customer In / Customer Out / site / sensor roles to header names
+
+    Count columns are matched by name first and fall back to columns E and F;
+    the timestamp is column C. Site and sensor are matched by name only.
+    Roles that cannot be resolved are None.
+    """
+    def at(index):
+        return header[index] if len(header) > index else None
+
+    customer_in = customer_out = site = sensor = None
+    for name in header:
+        name_lower = str(name).lower()
+        if 'customer' in name_lower and 'in' in name_lower:
+            customer_in = name
+        elif 'customer' in name_lower and 'out' in name_lower:
+            customer_out = name
+        elif 'site' in name_lower and site is None:
+            site = name
+        elif 'sensor' in name_lower and sensor is None:
+            sensor = name
+
+    if customer_in is None or customer_out is None:
+        customer_in, customer_out = at(CUSTOMER_IN_INDEX), at(CUSTOMER_OUT_INDEX)
+
+    return {
+        "timestamp": at(TIMESTAMP_INDEX),
+        "customer_in": customer_in,
+        "customer_out": customer_out,
+        "site": site,
+        "sensor": sensor,
+    }
+
+
+def _clean_header(raw):
+    """Header names as pandas.read_excel would produce them"""
+    header = []
+    seen = {}
+    for i, name in enumerate(raw):
+        name = f"Unnamed: {i}" if name is None or name == '' else name
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        header.append(name)
+    return header
+
+
+def _resolve_usecols(usecols, header, roles):
+    """Turn usecols (None, 'traffic', indices or header names) into column indices"""
+    if usecols is None:
+        return list(range(len(header)))
+
+    if usecols == TRAFFIC:
+        usecols = [roles["timestamp"], roles["customer_in"], roles["customer_out"]]
+        if None in usecols:
+            raise ValueError("Workbook does not have timestamp and Customer In/Out columns")
+        usecols += [roles[role] for role in ("site", "sensor") if roles[role] is not None]
+
+    indices = []
+    for col in usecols:
+        if isinstance(col, int) or (isinstance(col, str) and col.isdigit() and col not in header):
+            index = int(col)
+            if not 0 <= index < len(header):
+                raise ValueError(f"Column index {index} is out of range")
+        elif col in header:
+            index = header.index(col)
+        else:
+            raise ValueError(f"Column '{col}' not found in workbook")
+        indices.append(index)
+    return indices
+
+
+def _open_workbook(source):
+    """Engine name and workbook object for a path or file-like source"""
+    if CalamineWorkbook is not None:
+        if hasattr(source, 'read'):
+            return 'calamine', CalamineWorkbook.from_filelike(source)
+        return 'calamine', CalamineWorkbook.from_path(source)
+    return 'openpyxl', openpyxl.load_workbook(source, read_only=True, data_only=True)
+
+
+def sheet_names(source):
+    """Names of the worksheets in a workbook, in workbook order"""
+    engine, workbook = _open_workbook(source)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return list(workbook.sheet_names if engine == 'calamine' else workbook.sheetnames)
+
+
+def _iter_rows(source, sheet=0):
+    """Engine used, the sheet's name, an iterator of its raw row tuples and
+    its row count (None if the workbook does not record it)
+
+    sheet is a zero-based index or a sheet name.
+    """
+    engine, workbook = _open_workbook(source)
+    if engine == 'calamine':
+        if isinstance(sheet, int):
+            worksheet = workbook.get_sheet_by_index(sheet)
+        else:
+            worksheet = workbook.get_sheet_by_name(sheet)
+        return engine, worksheet.name, worksheet.iter_rows(), worksheet.height
+
+    worksheet = workbook.worksheets[sheet] if isinstance(sheet, int) else workbook[sheet]
+    return engine, worksheet.title, worksheet.iter_rows(values_only=True), worksheet.max_row
+
+
+def _normalize_calamine(df):
+    """Match openpyxl typing: calamine reports empty cells as '', midnight
+    datetimes as dates and every number as a float"""
+    df = df.replace('', None).infer_objects()
+    for name in df.columns:
+        series = df[name]
+        kind = pd.api.types.infer_dtype(series, skipna=True)
+        if kind in ('date', 'datetime'):
+            df[name] = pd.to_datetime(series, errors='coerce')
+        elif kind == 'floating' and series.notna().all() and (series % 1 == 0).all():
+            df[name] = series.astype('int64')
+    return df
+
+
+def read_xlsx(source, usecols=None, progress=None, sheet=0):
+    """Read one sheet of an xlsx file (path or file-like) into a DataFrame
+
+    usecols limits parsing to some columns: 'traffic' for the timestamp,
+    Customer In/Out and site/sensor columns, or a list of zero-based indices /
+    header names. sheet is a zero-based index or name (default: the first).
+    progress, if given, is called as progress(rows_read, total_rows) every
+    PROGRESS_EVERY rows and once at the end; total_rows may be None.
+    Timestamp cells become datetime64 and counts numbers; a text timestamp
+    column is returned as read. Returns the frame and a dict of ingest
+    statistics.
+    """
+    start = time.perf_counter()
+    engine, sheet_name, rows, total_rows = _iter_rows(source, sheet)
+    total_rows = total_rows - 1 if total_rows else None  # minus the header
+
+    try:
+        header = _clean_header(next(rows))
+    except StopIteration:
+        return pd.DataFrame(), {
+            "engine": engine, "sheet": sheet_name, "rows": 0, "columns": [],
+            "traffic_columns": detect_traffic_columns([]), "seconds": 0.0, "rows_per_sec": 0.0,
+        }
+
+    roles = detect_traffic_columns(header)
+    indices = _resolve_usecols(usecols, header, roles)
+    names = [header[i] for i in indices]
+    width = max(indices) + 1 if indices else 0
+
+    pick = itemgetter(*indices) if len(indices) > 1 else (lambda row: (row[indices[0]],))
+    columns = [[] for _ in indices]
+    appends = [column.append for column in columns]
+    rows_read = 0
+    for rows_read, row in enumerate(rows, 1):
+        if progress is not None and rows_read % PROGRESS_EVERY == 0:
+            progress(rows_read, total_rows)
+        if len(row) < width:
+            row = tuple(row) + (None,) * (width - len(row))
+        values = pick(row)
+        if all(value is None or value == '' for value in values):
+            continue
+        for append, value in zip(appends, values):
+            append(value)
+
+    if progress is not None:
+        progress(rows_read, total_rows)
+
+    df = pd.DataFrame(dict(zip(names, columns)), columns=names)
+    if engine == 'calamine':
+        df = _normalize_calamine(df)
+
+    # Parse the analysis columns into typed columns up front. Only datetime
+    # cells are converted here: text is left for schema.infer_schema, which
+    # tells day-first from month-first using the whole column
+    timestamp = roles["timestamp"]
+    if timestamp in df.columns and pd.api.types.infer_dtype(df[timestamp], skipna=True) in ('datetime', 'date'):
+        df[timestamp] = pd.to_datetime(df[timestamp], errors='coerce')
+    for role in ("customer_in", "customer_out"):
+        name = roles[role]
+        if name in df.columns:
+            counts = pd.to_numeric(df[name], errors='coerce')
+            df[name] = counts.astype('int64') if counts.notna().all() else counts
+
+    seconds = time.perf_counter() - start
+    stats = {
+        "engine": engine,
+        "sheet": sheet_name,
+        "rows": len(df),
+        "columns": names,
+        "traffic_columns": roles,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(len(df) / seconds, 1) if seconds > 0 else 0.0,
+    }
+    return df, stats
+
+
+def read_sheet(source, sheet=0, usecols=None, progress=None):
+    """read_xlsx plus a Source Sheet column; sheets without a site column get
+    a Site column holding the sheet name (one sheet per entrance)"""
+    df, stats = read_xlsx(source, usecols, progress, sheet)
+    df[SOURCE_SHEET] = stats["sheet"]
+
+    roles = dict(stats["traffic_columns"])
+    if roles["site"] is None:
+        df[SITE] = stats["sheet"]
+        roles["site"] = SITE
+    stats = dict(stats, columns=list(df.columns), traffic_columns=roles)
+    return df, stats
+
+
+def tag_source(df, stats, file_name):
+    """Add a Source File column to a parsed workbook"""
+    df = df.copy()
+    df[SOURCE_FILE] = file_name
+    sources = [dict(source, file=file_name) for source in _sources(stats)]
+    return df, dict(stats, columns=list(df.columns), sources=sources)
+
+
+def _sources(stats):
+    """Per-sheet source entries of a (possibly already merged) stats dict"""
+    if "sources" in stats:
+        return stats["sources"]
+    return [{"sheet": stats.get("sheet"), "rows": stats["rows"]}]
+
+
+def merge_frames(parts, seconds=None):
+    """Concatenate parsed (DataFrame, stats) parts into one frame
+
+    Role columns (timestamp, counts, site, sensor) are renamed to the first
+    part's names so differently titled exports line up, and the source tag
+    columns are moved to the end. seconds is the wall time to report; by
+    default the parts' parse times are added up.
+    """
+    if not parts:
+        raise ValueError("Workbook has no sheets")
+
+    roles = {}
+    for _, stats in parts:
+        for role, name in stats["traffic_columns"].items():
+            if roles.get(role) is None:
+                roles[role] = name
+
+    frames = []
+    for df, stats in parts:
+        rename = {
+            name: roles[role] for role, name in stats["traffic_columns"].items()
+            if name is not None and name != roles[role] and name in df.columns
+        }
+        frames.append(df.rename(columns=rename) if rename else df)
+
+    non_empty = [df for df in frames if len(df)]
+    if len(non_empty) == 1:
+        df = non_empty[0]
+    else:
+        df = pd.concat(non_empty or frames[:1], ignore_index=True, sort=False)
+    tags = [name for name in (SOURCE_FILE, SOURCE_SHEET) if name in df.columns]
+    df = df[[name for name in df.columns if name not in tags] + tags]
+
+    if seconds is None:
+        seconds = sum(stats["seconds"] for _, stats in parts)
+    stats = {
+        "engine": parts[0][1]["engine"],
+        "rows": len(df),
+        "columns": list(df.columns),
+        "traffic_columns": roles,
+        "sources": [source for _, stats in parts for source in _sources(stats)],
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(len(df) / seconds, 1) if seconds > 0 else 0.0,
+    }
+    return df, stats
@@ -0,0 +1,225 @@
+"""
+Request instrumentation for the Traffic Analytics API
+Per-stage timings, row counts and memory deltas for each request, kept in
+an in-process metrics registry rendered in the Prometheus text format, plus
+an optional cProfile summary and the API's logging setup
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = tuple(mb * 1024 * 1024 for mb in (1, 4, 16, 64, 256, 1024))
+
+# Functions listed in a ?profile=1 summary
+PROFILE_TOP_FUNCTIONS = 25
+
+try:
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):  # not available on Windows
+    PAGE_SIZE = 4096
+
+
+def configure_logging(level=None):
+    """Leveled logging for the API (LOG_LEVEL, default INFO); leaves an
+    already configured root logger alone"""
+    level = (level or os.environ.get('LOG_LEVEL', 'INFO')).upper()
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
+
+def rss_bytes():
+    """Resident memory of this process, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self.series.setdefault(label_values, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self.series.items()):
+                for bound, count in zip(self.buckets + ('+Inf',), series[:len(self.buckets)] + [series[-1]]):
+                    le = _labels(self.labels + ('le',), label_values + (bound,))
+                    lines.append(f"{self.name}_bucket{le} {count}")
+                labels = _labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Metrics:
+    """Metrics of this process (each server worker keeps its own)"""
+
+    def __init__(self):
+        self.requests = Counter(
+            'traffic_api_requests_total', "Requests handled", ('endpoint', 'method', 'status'))
+        self.request_seconds = Histogram(
+            'traffic_api_request_seconds', "Request handling time", ('endpoint',))
+        self.stage_seconds = Histogram(
+            'traffic_api_stage_seconds', "Time spent per processing stage", ('stage',))
+        self.stage_rows = Counter(
+            'traffic_api_stage_rows_total', "Rows handled per processing stage", ('stage',))
+        self.stage_memory = Histogram(
+            'traffic_api_stage_memory_delta_bytes', "Resident memory growth per processing stage",
+            ('stage',), BYTES_BUCKETS)
+
+    def record_stage(self, record):
+        self.stage_seconds.observe(record["seconds"], record["stage"])
+        if record.get("rows") is not None:
+            self.stage_rows.inc(record["stage"], amount=int(record["rows"]))
+        if record.get("memory_delta") is not None:
+            self.stage_memory.observe(max(record["memory_delta"], 0), record["stage"])
+
+    def record_request(self, endpoint, method, status, seconds):
+        self.requests.inc(endpoint, method, str(status))
+        self.request_seconds.observe(seconds, endpoint)
+
+    def render(self, gauges=None):
+        """Prometheus text exposition; gauges maps name -> (help, value) sampled at scrape time"""
+        lines = []
+        for metric in (self.requests, self.request_seconds, self.stage_seconds, self.stage_rows, self.stage_memory):
+            lines.extend(metric.render())
+        for name, (help_text, value) in (gauges or {}).items():
+            if value is not None:
+                lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"])
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def stage(name, rows=None):
+    """Time a block as a named processing stage
+
+    Yields the stage record; set record["rows"] inside the block when the
+    row count is only known there. Records go to METRICS and, during a
+    request, to the request's stage list (g.stages).
+    """
+    record = {"stage": name, "rows": rows}
+    memory_before = rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        memory_after = rss_bytes()
+        record["memory_delta"] = (memory_after - memory_before
+                                  if memory_before is not None and memory_after is not None else None)
+        METRICS.record_stage(record)
+        if has_request_context():
+            g.setdefault('stages', []).append(record)
+        logger.debug("stage %s: %.4fs, rows=%s, memory delta=%s",
+                     name, record["seconds"], record["rows"], record["memory_delta"])
+
+
+def stage_summary(stages):
+    """Request stage records as JSON-friendly dicts"""
+    return [
+        {
+            "stage": record["stage"],
+            "seconds": round(record["seconds"], 6),
+            "rows": record.get("rows"),
+            "memory_delta_bytes": record.get("memory_delta"),
+        }
+        for record in stages
+    ]
+
+
+def server_timing(stages, total_seconds):
+    """Server-Timing header value (shown by browser dev tools)"""
+    entries = [f"{record['stage']};dur={record['seconds'] * 1000:.1f}" for record in stages]
+    entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ', '.join(entries)
+
+
+def profile_summary(profiler, limit=PROFILE_TOP_FUNCTIONS):
+    """Top functions of a cProfile run by cumulative time, plus the pstats text report"""
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream).sort_stats('cumulative')
+    stats.print_stats(limit)
+
+    functions = []
+    for (path, line, function), (calls, _, total, cumulative, _) in sorted(
+            stats.stats.items(), key=lambda item: -item[1][3])[:limit]:
+        functions.append({
+            "function": f"{os.path.basename(path)}:{line}({function})",
+            "calls": calls,
+            "total_seconds": round(total, 6),
+            "cumulative_seconds": round(cumulative, 6),
+        })
+    return {"functions": functions, "report": stream.getvalue()}
+
+
+def start_profiler():
+    """Enabled cProfile profiler for the current thread, or None when another
+    profiler is already active (Python 3.12+ allows only one at a time)"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
@@ -0,0 +1,195 @@
+"""
+Background ingestion jobs for the Traffic Analytics API
+Every sheet of every uploaded workbook is parsed as its own task in a
+process pool; job state is kept as small JSON files so any server worker
+can answer status polls
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from ingest import merge_frames, read_sheet, sheet_names
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def _job_path(directory, job_id):
+    if not job_id or not job_id.isalnum():
+        raise ValueError("Invalid job ID")
+    return os.path.join(directory, f"{job_id}.json")
+
+
+def _read_job(directory, job_id):
+    try:
+        with open(_job_path(directory, job_id), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_job(directory, job_id, job):
+    """Atomically replace a job's state file"""
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp_path, _job_path(directory, job_id))
+
+
+def parse_sheet(directory, task_id, path, sheet, usecols):
+    """Process-pool entry point: parse one sheet, reporting progress to the
+    task's state file when a task_id is given. Returns (DataFrame, stats)."""
+    progress = None
+    if task_id is not None:
+        def progress(rows_read, total_rows):
+            _write_job(directory, task_id, {"rows_parsed": rows_read, "total_rows": total_rows})
+
+    return read_sheet(path, sheet, usecols, progress)
+
+
+class JobManager:
+    """Creates jobs, runs them on a lazily started process pool and tracks their state"""
+
+    def __init__(self, directory, max_workers=None, ttl_seconds=24 * 3600):
+        self.directory = directory
+        self.max_workers = max_workers
+        self.ttl_seconds = ttl_seconds
+        self._executor = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a threaded server process is not safe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return self._executor
+
+    def spool_path(self):
+        """Temporary file path for an upload waiting to be parsed"""
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix='.xlsx')
+        os.close(fd)
+        return path
+
+    def create(self, **info):
+        """Register a new queued job and return its ID"""
+        self._prune()
+        job_id = uuid.uuid4().hex
+        job = dict(info, job_id=job_id, state=QUEUED, progress=0.0, created_at=time.time())
+        _write_job(self.directory, job_id, job)
+        return job_id
+
+    def get(self, job_id):
+        """Job state, with row progress summed over its parse tasks while running"""
+        job = _read_job(self.directory, job_id)
+        if job and job.get('state') in (QUEUED, RUNNING) and job.get('tasks'):
+            parts = [_read_job(self.directory, f"{job_id}t{n}") or {} for n in range(job['tasks'])]
+            rows_parsed = sum(part.get('rows_parsed', 0) for part in parts)
+            total_rows = sum(part.get('total_rows') or 0 for part in parts)
+            job.update(rows_parsed=rows_parsed, total_rows=total_rows,
+                       progress=round(100.0 * rows_parsed / total_rows, 1) if total_rows else 0.0)
+        return job
+
+    def update(self, job_id, **fields):
+        job = _read_job(self.directory, job_id) or {"job_id": job_id}
+        job.update(fields)
+        _write_job(self.directory, job_id, job)
+
+    def finish(self, job_id, **result):
+        self.update(job_id, state=DONE, progress=100.0, finished_at=time.time(), **result)
+
+    def fail(self, job_id, error):
+        self.update(job_id, state=FAILED, error=error, finished_at=time.time())
+
+    def run(self, job_id, work):
+        """Run work() on a background thread; the dict it returns becomes the
+        job result and any exception marks the job as failed"""
+        def target():
+            self.update(job_id, state=RUNNING, started_at=time.time())
+            try:
+                self.finish(job_id, **work())
+            except Exception as e:
+                self.fail(job_id, f"Error processing file: {str(e)}")
+
+        threading.Thread(target=target, daemon=True).start()
+
+    def parse_files(self, sources, usecols=None, job_id=None):
+        """Parse every sheet of every workbook and merge the sheets of each file
+
+        sources are paths or seekable file objects (such as upload streams).
+        Sheets run concurrently on the process pool, so ingest time scales with
+        cores rather than with the number of files. A lone sheet outside a job
+        is parsed in this process, straight from a file object without a disk
+        round-trip, to skip the pool start-up cost; for the pool, file objects
+        are spooled to disk first. With a job_id, row progress is reported
+        through per-task files summed up by get().
+        Returns one (DataFrame, stats) per source, tagged by sheet but not file.
+        """
+        tasks = [(i, source, sheet) for i, source in enumerate(sources) for sheet in sheet_names(source)]
+
+        if job_id is None and len(tasks) == 1:
+            _, source, sheet = tasks[0]
+            results = [read_sheet(source, sheet, usecols)]
+        else:
+            task_ids = [f"{job_id}t{n}" if job_id else None for n in range(len(tasks))]
+            if job_id:
+                self.update(job_id, tasks=len(tasks))
+            spooled = {}
+            futures = []
+            try:
+                for i, source in enumerate(sources):
+                    if hasattr(source, 'read'):
+                        spooled[i] = self.spool_path()
+                        source.seek(0)
+                        with open(spooled[i], 'wb') as f:
+                            shutil.copyfileobj(source, f)
+                        source.seek(0)
+                futures = [
+                    self.executor.submit(parse_sheet, self.directory, task_id, spooled.get(i, source), sheet, usecols)
+                    for task_id, (i, source, sheet) in zip(task_ids, tasks)
+                ]
+                results = [future.result() for future in futures]
+            finally:
+                for future in futures:
+                    future.cancel()
+                for task_id in task_ids:
+                    if task_id:
+                        _remove(_job_path(self.directory, task_id))
+                for path in spooled.values():
+                    _remove(path)
+
+        per_file = [[] for _ in sources]
+        for (i, _, _), result in zip(tasks, results):
+            per_file[i].append(result)
+        return [merge_frames(parts) for parts in per_file]
+
+    def _prune(self):
+        """Drop state files of jobs finished more than ttl_seconds ago"""
+        cutoff = time.time() - self.ttl_seconds
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            job = _read_job(self.directory, name[:-5])
+            if job and job.get('finished_at') and job['finished_at'] < cutoff:
+                _remove(os.path.join(self.directory, name))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,144 @@
+"""
+Content negotiation for Traffic Analytics API responses
+Picks the body encoding (JSON, MessagePack, Arrow IPC, NDJSON) from the
+Accept header and compresses bodies with brotli or gzip per Accept-Encoding
+"""
+
+import gzip
+import io
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:  # optional, for application/msgpack bodies
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is used without it
+    brotli = None
+
+from serialization import ARROW_MIMETYPE, NDJSON_MIMETYPE, pa
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+# Response format -> mimetypes a client may list in Accept for it
+FORMAT_MIMETYPES = {
+    'json': (JSON_MIMETYPE,),
+    'msgpack': (MSGPACK_MIMETYPE, 'application/x-msgpack'),
+    'arrow': (ARROW_MIMETYPE,),
+    'ndjson': (NDJSON_MIMETYPE,),
+}
+
+# Data bodies worth compressing (HTML, errors and tiny bodies are sent as-is)
+COMPRESSIBLE_MIMETYPES = {JSON_MIMETYPE, MSGPACK_MIMETYPE, ARROW_MIMETYPE, NDJSON_MIMETYPE}
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def available_formats(formats):
+    """The formats whose optional libraries are installed, in preference order"""
+    return [
+        fmt for fmt in formats
+        if not (fmt == 'msgpack' and msgpack is None) and not (fmt == 'arrow' and pa is None)
+    ]
+
+
+def negotiate_format(accept_mimetypes, formats=('json', 'msgpack', 'arrow')):
+    """Best response format for a werkzeug Accept header among formats
+
+    JSON must come first in formats: it is the answer for */* and for
+    clients that do not send Accept, and the fallback when nothing matches.
+    """
+    offered = []
+    for fmt in available_formats(formats):
+        offered.extend((mimetype, fmt) for mimetype in FORMAT_MIMETYPES[fmt])
+    best = accept_mimetypes.best_match([mimetype for mimetype, _ in offered])
+    return dict(offered).get(best, formats[0])
+
+
+def encode_payload(payload, fmt, table_key=None):
+    """Encode a JSON-serializable dict as (body bytes, mimetype)
+
+    For 'arrow', payload[table_key] (a list of row objects) becomes the
+    record batch and the other keys go under the schema's 'meta' key.
+    Raises ValueError when the format's optional library is not installed.
+    """
+    if fmt == 'msgpack':
+        if msgpack is None:
+            raise ValueError("MessagePack output requires msgpack. Run: pip install -r requirements-optional.txt")
+        return msgpack.packb(payload, use_bin_type=True), MSGPACK_MIMETYPE
+
+    if fmt == 'arrow':
+        if pa is None:
+            raise ValueError("Arrow output requires pyarrow. Run: pip install -r requirements-optional.txt")
+        meta = {key: value for key, value in payload.items() if key != table_key}
+        table = pa.Table.from_pylist(payload[table_key])
+        table = table.replace_schema_metadata({b'meta': json.dumps(meta).encode('utf-8')})
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue(), ARROW_MIMETYPE
+
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8'), JSON_MIMETYPE
+
+
+def negotiate_encoding(accept_encodings):
+    """'br', 'gzip' or None for a werkzeug Accept-Encoding header"""
+    offered = (['br'] if brotli is not None else []) + ['gzip']
+    return accept_encodings.best_match(offered)
+
+
+def _gzip_stream(chunks):
+    """Gzip a chunked body, flushing after each chunk so clients can decode as it arrives"""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _brotli_stream(chunks):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compress_response(response, accept_encodings):
+    """Compress a Flask response in place when the client accepts it
+
+    Small, error, already-encoded and non-data responses are left alone.
+    Streamed responses are compressed chunk by chunk.
+    """
+    if not 200 <= response.status_code < 300 or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        chunks = response.response
+        response.response = _brotli_stream(chunks) if encoding == 'br' else _gzip_stream(chunks)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        if encoding == 'br':
+            response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        else:
+            response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+
+    response.headers['Content-Encoding'] = encoding
+    return response
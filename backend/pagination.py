@@ -0,0 +1,117 @@
+"""
+Paged, filtered and sorted access to a stored dataset's rows
+Filters are evaluated as NumPy masks and sort orders are computed once per
+dataset, so each page costs a slice rather than a pass over the frame
+"""
+
+import base64
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 10000
+
+
+def query_signature(**params):
+    """Short hash of the filter/sort parameters a cursor belongs to"""
+    blob = json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(blob).hexdigest()[:16]
+
+
+def encode_cursor(offset, signature):
+    blob = json.dumps({"offset": int(offset), "query": signature}).encode('utf-8')
+    return base64.urlsafe_b64encode(blob).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, signature):
+    """Row offset stored in a cursor; ValueError if it is malformed or was
+    issued for different filters"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        offset = int(state["offset"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if state.get("query") != signature or offset < 0:
+        raise ValueError("Cursor does not match the requested filters")
+    return offset
+
+
+def _epoch_days(df, cache):
+    """Epoch day of every row from the Date column (cached, -1 where missing)"""
+    if "epoch_days" not in cache:
+        dates = df['Date']
+        # Categorical dates are parsed once per category, then expanded by code (-1 stays missing)
+        categorical = isinstance(dates.dtype, pd.CategoricalDtype)
+        values = pd.Series(dates.cat.categories) if categorical else dates
+        parsed = pd.to_datetime(values.astype(str), errors='coerce')
+        days = np.where(parsed.notna().to_numpy(), parsed.to_numpy().astype('datetime64[D]').astype(np.int64), -1)
+        cache["epoch_days"] = np.append(days, -1)[dates.cat.codes.to_numpy()] if categorical else days
+    return cache["epoch_days"]
+
+
+def _hours(df, cache):
+    if "hours" not in cache:
+        cache["hours"] = pd.to_numeric(df['Hour'], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+    return cache["hours"]
+
+
+def row_mask(df, cache, dates=None, date_from=None, date_to=None, hour_from=None, hour_to=None):
+    """Boolean mask of rows matching the date list, inclusive date range and
+    hour range (hour_to exclusive). Dates are 'YYYY-MM-DD' strings."""
+    mask = np.ones(len(df), dtype=bool)
+    if dates or date_from or date_to:
+        days = _epoch_days(df, cache)
+        if dates:
+            mask &= np.isin(days, [np.datetime64(date, 'D').astype(np.int64) for date in dates])
+        if date_from:
+            mask &= days >= np.datetime64(date_from, 'D').astype(np.int64)
+        if date_to:
+            mask &= (days >= 0) & (days <= np.datetime64(date_to, 'D').astype(np.int64))
+    if hour_from is not None or hour_to is not None:
+        hours = _hours(df, cache)
+        if hour_from is not None:
+            mask &= hours >= hour_from
+        if hour_to is not None:
+            mask &= (hours >= 0) & (hours < hour_to)
+    return mask
+
+
+def sort_order(df, column, descending, cache):
+    """Row positions in sorted order for a column (cached, stable, nulls last)"""
+    key = ("order", column, descending)
+    if key not in cache:
+        values = df[column].reset_index(drop=True)
+        if values.dtype == object:
+            # Mixed Python objects (dates, times) sort by their string form
+            values = values.where(values.isna(), values.astype(str))
+        cache[key] = values.sort_values(
+            ascending=not descending, kind='stable', na_position='last'
+        ).index.to_numpy()
+    return cache[key]
+
+
+def select_positions(df, cache, sort=None, descending=False, **filters):
+    """Positions of the rows matching filters, in sort order if sort is given
+
+    cache is a per-dataset dict holding derived arrays between requests.
+    filters are passed to row_mask.
+    """
+    mask = row_mask(df, cache, **filters)
+    if sort is not None:
+        order = sort_order(df, sort, descending, cache)
+        return order[mask[order]]
+    return np.flatnonzero(mask)
+
+
+def select_rows(df, cache, offset=0, limit=DEFAULT_PAGE_SIZE, columns=None, sort=None,
+                descending=False, **filters):
+    """One page of rows plus the number of rows matching the filters"""
+    positions = select_positions(df, cache, sort, descending, **filters)
+    page = df.iloc[positions[offset:offset + limit]]
+    if columns:
+        page = page[columns]
+    return page, len(positions)
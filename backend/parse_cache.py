@@ -0,0 +1,128 @@
+"""
+On-disk parse cache for uploaded workbooks
+Parsed frames are stored under the SHA-256 of the uploaded bytes so a
+re-upload of the same export skips xlsx parsing, even after a restart
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+
+CHUNK_SIZE = 1024 * 1024
+
+# Part of every key; bump it whenever ingest or schema changes what a parse
+# returns, so frames cached by an older version are parsed again
+PARSE_VERSION = 2
+
+
+def file_digest(stream):
+    """SHA-256 hex digest of a seekable stream, read in chunks and rewound"""
+    sha = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        sha.update(chunk)
+    stream.seek(0)
+    return sha.hexdigest()
+
+
+class ParseCache:
+    """Size-bounded directory of pickled (DataFrame, stats) entries with LRU eviction
+
+    Entries are only ever written by this process, so unpickling them is safe.
+    Recency is tracked through file modification times, which survive restarts.
+    """
+
+    def __init__(self, directory, max_bytes=2048 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(digest, usecols=None):
+        """Cache key for a workbook digest, the column projection used to parse
+        it and the parser version"""
+        key = f"{digest}-v{PARSE_VERSION}"
+        if usecols is None:
+            return key
+        options = hashlib.sha256(repr(usecols).encode('utf-8')).hexdigest()[:12]
+        return f"{key}-{options}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key):
+        """Return the cached (DataFrame, stats) for a key, or None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                frame, stats = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Truncated or written by an incompatible pandas version
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return frame, stats
+
+    def put(self, key, frame, stats):
+        """Store a parsed frame, then evict least recently used entries over budget"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((frame, stats), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._evict(keep=key)
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "total_bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+    def _entries(self):
+        """(path, size, mtime) for every cache file"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def _evict(self, keep):
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            total = sum(size for _, size, _ in entries)
+            keep_path = self._path(keep)
+            for path, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep_path:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
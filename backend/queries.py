@@ -0,0 +1,255 @@
+"""
+Constrained ad-hoc aggregations over the columnar store
+Queries group stored rows by calendar and site keys and aggregate Customer
+In/Out chunk by chunk from the memory-mapped columns, so a year of data
+never has to be loaded into one DataFrame
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from baselines import WEEKDAYS, weekday
+from columnar_store import epoch_day
+from time_buckets import MINUTES_PER_DAY, TimeBuckets
+
+GROUP_KEYS = ('date', 'week', 'month', 'weekday', 'hour', 'slot', 'site', 'sensor')
+AGGREGATES = ('sum', 'mean', 'min', 'max', 'count')
+METRICS = ('customer_in', 'customer_out')
+
+# Rows read from the memory maps per chunk (whole days are never split)
+CHUNK_ROWS = 1_000_000
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+
+class TrafficQuery:
+    """A validated aggregation request: group keys, aggregate, filters and top-N"""
+
+    def __init__(self, group_by=(), aggregate='sum', date_from=None, date_to=None,
+                 hour_from=None, hour_to=None, weekdays=None, sites=None, sensors=None,
+                 business_hours=False, order_by=None, descending=True, limit=DEFAULT_LIMIT,
+                 top_per=None, buckets=None):
+        group_by = list(group_by or [])
+        unknown = [key for key in group_by if key not in GROUP_KEYS]
+        if unknown or len(set(group_by)) != len(group_by):
+            raise ValueError(f"group_by must be distinct keys from: {', '.join(GROUP_KEYS)}")
+        if aggregate not in AGGREGATES:
+            raise ValueError(f"Invalid aggregate. Use one of: {', '.join(AGGREGATES)}")
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+        if order_by is not None and order_by not in group_by + list(METRICS) + ['rows']:
+            raise ValueError("order_by must be a group_by key, a metric or 'rows'")
+        top_per = list(top_per or [])
+        if any(key not in group_by for key in top_per):
+            raise ValueError("top_per keys must also be in group_by")
+        if top_per and order_by is None:
+            raise ValueError("top_per needs an order_by metric")
+        if weekdays is not None and any(day not in WEEKDAYS for day in weekdays):
+            raise ValueError(f"weekdays must be names from: {', '.join(WEEKDAYS)}")
+
+        try:
+            # The date range is inclusive
+            self.date_from = epoch_day(date_from) if date_from else None
+            self.date_to = epoch_day(date_to) if date_to else None
+        except ValueError:
+            raise ValueError("Dates must be in YYYY-MM-DD format")
+
+        self.group_by = group_by
+        self.aggregate = aggregate
+        self.hour_from = hour_from
+        self.hour_to = hour_to
+        self.weekdays = None if weekdays is None else [WEEKDAYS.index(day) for day in weekdays]
+        self.sites = sites
+        self.sensors = sensors
+        self.business_hours = business_hours
+        self.order_by = order_by
+        self.descending = descending
+        self.limit = limit
+        self.top_per = top_per
+        self.buckets = buckets or TimeBuckets()
+
+    @classmethod
+    def from_params(cls, params):
+        """Build from a JSON request body. Raises ValueError."""
+        def integer(name, default=None):
+            value = params.get(name)
+            if value is None or value == '':
+                return default
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} must be an integer")
+
+        def names(name):
+            value = params.get(name)
+            if value is None:
+                return None
+            if not isinstance(value, list):
+                raise ValueError(f"{name} must be a list")
+            return [str(item) for item in value]
+
+        group_by = params.get('group_by') or []
+        if isinstance(group_by, str):
+            group_by = [group_by]
+
+        return cls(
+            group_by=group_by,
+            aggregate=params.get('aggregate', 'sum'),
+            date_from=params.get('date_from'),
+            date_to=params.get('date_to', params.get('date_from')),
+            hour_from=integer('hour_from'),
+            hour_to=integer('hour_to'),
+            weekdays=names('weekdays'),
+            sites=names('sites'),
+            sensors=names('sensors'),
+            business_hours=bool(params.get('business_hours', False)),
+            order_by=params.get('order_by'),
+            descending=str(params.get('order', 'desc')).lower() != 'asc',
+            limit=integer('limit', DEFAULT_LIMIT),
+            top_per=names('top_per'),
+            buckets=TimeBuckets.from_params(params),
+        )
+
+    def chunks(self, stored):
+        """Row ranges of whole stored days covering the date filter, at most
+        CHUNK_ROWS rows each (a larger single day is its own chunk)"""
+        days = stored.days
+        # With a timezone rows can move a day either way, so read one extra day on each side
+        margin = 1 if self.buckets.timezone else 0
+        first = 0 if self.date_from is None else np.searchsorted(days, self.date_from - margin)
+        last = len(days) if self.date_to is None else np.searchsorted(days, self.date_to + margin, side='right')
+
+        offsets = stored.day_offsets
+        start = first
+        while start < last:
+            # Last day that still fits in the chunk, but always at least one day
+            stop = np.searchsorted(offsets, offsets[start] + CHUNK_ROWS, side='right') - 1
+            stop = min(max(stop, start + 1), last)
+            yield slice(int(offsets[start]), int(offsets[stop]))
+            start = stop
+
+    def partial(self, stored, rows):
+        """Per-group sum/count/min/max of one chunk as a DataFrame (None if no rows match)"""
+        local = self.buckets.local_minutes(stored.ts[rows])
+        day = local // MINUTES_PER_DAY
+        minute = local % MINUTES_PER_DAY
+        hour = minute // 60
+
+        mask = np.ones(len(local), dtype=bool)
+        if self.date_from is not None:
+            mask &= day >= self.date_from
+        if self.date_to is not None:
+            mask &= day <= self.date_to
+        if self.hour_from is not None:
+            mask &= hour >= self.hour_from
+        if self.hour_to is not None:
+            mask &= hour < self.hour_to
+        if self.weekdays is not None:
+            mask &= np.isin(weekday(day), self.weekdays)
+        slot = self.buckets.slot_index(minute)
+        if self.business_hours or 'slot' in self.group_by:
+            mask &= slot >= 0
+        for role, labels_key, wanted in (('site', 'sites', self.sites), ('sensor', 'sensors', self.sensors)):
+            if wanted is not None:
+                codes = [i for i, label in enumerate(stored.meta.get(labels_key, [])) if label in wanted]
+                mask &= np.isin(getattr(stored, role)[rows], codes)
+        if not mask.any():
+            return None
+
+        keys = {
+            'date': lambda: day,
+            'week': lambda: day - weekday(day),
+            'month': lambda: day.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64),
+            'weekday': lambda: weekday(day),
+            'hour': lambda: hour,
+            'slot': lambda: slot,
+            'site': lambda: np.asarray(stored.site[rows]),
+            'sensor': lambda: np.asarray(stored.sensor[rows]),
+        }
+        chunk = pd.DataFrame({key: keys[key]()[mask] for key in self.group_by})
+        for metric in METRICS:
+            chunk[metric] = np.asarray(getattr(stored, metric)[rows], dtype=np.int64)[mask]
+
+        aggregations = {f"{metric}_{agg}": (metric, agg) for metric in METRICS for agg in ('sum', 'min', 'max')}
+        aggregations['rows'] = (METRICS[0], 'count')
+        if not self.group_by:
+            return pd.DataFrame({name: [getattr(chunk[column], agg)()] for name, (column, agg) in aggregations.items()})
+        return chunk.groupby(self.group_by, sort=False).agg(**aggregations).reset_index()
+
+    def run(self, stored):
+        """Execute against a TrafficColumns view; returns the response payload"""
+        start = time.perf_counter()
+        partials = []
+        rows_scanned = 0
+        for rows in self.chunks(stored):
+            rows_scanned += rows.stop - rows.start
+            part = self.partial(stored, rows)
+            if part is not None:
+                partials.append(part)
+
+        if partials:
+            # Combine the chunks' partial aggregates
+            merged = pd.concat(partials, ignore_index=True)
+            combine = {column: ('sum' if column.endswith('_sum') or column == 'rows' else column.rsplit('_', 1)[1])
+                       for column in merged.columns if column not in self.group_by}
+            if self.group_by:
+                merged = merged.groupby(self.group_by, sort=True).agg(combine).reset_index()
+            else:
+                merged = merged.agg(combine).to_frame().T
+        else:
+            merged = pd.DataFrame(columns=self.group_by + [f"{m}_{a}" for m in METRICS for a in ('sum', 'min', 'max')] + ['rows'])
+
+        result = merged[self.group_by].copy()
+        for metric in METRICS:
+            if self.aggregate == 'mean':
+                result[metric] = (merged[f"{metric}_sum"] / merged['rows']).round(2)
+            elif self.aggregate == 'count':
+                result[metric] = merged['rows']
+            else:
+                result[metric] = merged[f"{metric}_{self.aggregate}"]
+        result['rows'] = merged['rows']
+
+        if self.order_by is not None:
+            result = result.sort_values(self.order_by, ascending=not self.descending, kind='stable')
+        total_groups = len(result)
+        if self.top_per:
+            # Top-N within each partition, e.g. the peak hour of every site
+            result = result.groupby(self.top_per, sort=False).head(self.limit)
+        else:
+            result = result.head(self.limit)
+
+        return {
+            "group_by": self.group_by,
+            "aggregate": self.aggregate,
+            "columns": self.group_by + list(METRICS) + ['rows'],
+            "rows": self.labelled(stored, result).to_dict(orient='records'),
+            "total_groups": total_groups,
+            "rows_scanned": int(rows_scanned),
+            "seconds": round(time.perf_counter() - start, 4),
+        }
+
+    def labelled(self, stored, result):
+        """Group keys as display values: dates, week starts, months, names and slot labels"""
+        result = result.reset_index(drop=True)
+        labels = self.buckets.labels()
+        for key in self.group_by:
+            values = result[key].to_numpy(dtype=np.int64)
+            if key in ('date', 'week'):
+                result[key] = values.astype('datetime64[D]').astype(str)
+            elif key == 'month':
+                result[key] = values.astype('datetime64[M]').astype(str)
+            elif key == 'weekday':
+                result[key] = [WEEKDAYS[value] for value in values]
+            elif key == 'slot':
+                result[key] = [labels[value] for value in values]
+            elif key in ('site', 'sensor'):
+                names = stored.meta.get(f"{key}s", [])
+                result[key] = [names[value] if value < len(names) else None for value in values]
+            else:
+                result[key] = values
+        for column in METRICS + ('rows',):
+            if self.aggregate != 'mean' or column == 'rows':
+                result[column] = result[column].astype(np.int64)
+        return result
@@ -0,0 +1,94 @@
+"""
+Per-day rollups of Customer In/Out counts
+Built once at ingest so comparisons, summaries and dashboards become
+array lookups instead of re-aggregating raw rows on every request
+"""
+
+import os
+
+import numpy as np
+
+from baselines import STATS
+from time_buckets import DEFAULT_BUCKETS, MINUTES_PER_DAY
+
+# Arrays saved with a rollup; each has one row per stored day
+ROLLUP_ARRAYS = (
+    "days",                        # epoch day of each row
+    "slots_in", "slots_out",       # (days, n_slots) slot sums on the DEFAULT_BUCKETS grid
+    "hourly_in", "hourly_out",     # (days, 24) sums per hour of day
+    "daily_in", "daily_out",       # (days,) whole-day totals
+    "business_in", "business_out", # (days,) totals inside the DEFAULT_BUCKETS window
+    "business_rows",               # (days,) rows inside the business-hours window
+)
+
+# Each day's anomaly baseline (baselines.window_stats), saved with rollups
+# that have one; memory-mapped on load since only scanned days are read
+BASELINE_ARRAYS = tuple(f"baseline_{stat}" for stat in STATS)
+
+
+def build_rollup(ts_minutes, customer_in, customer_out):
+    """Aggregate epoch-minute timestamps and counts into per-day arrays"""
+    ts_minutes = np.asarray(ts_minutes, dtype=np.int64)
+    day_of_row = ts_minutes // MINUTES_PER_DAY
+    minute = ts_minutes % MINUTES_PER_DAY
+
+    days, day_idx = np.unique(day_of_row, return_inverse=True)
+    n_days = len(days)
+
+    buckets = DEFAULT_BUCKETS
+    n_slots = buckets.n_slots
+    slot_idx = buckets.slot_index(minute)
+    business = slot_idx >= 0  # the slots cover the window exactly
+    hour = minute // 60
+
+    def per_day(values, mask=None, bins=1, index=None):
+        flat = day_idx * bins + (0 if index is None else index)
+        weights = np.asarray(values, dtype=np.float64)
+        if mask is not None:
+            flat, weights = flat[mask], weights[mask]
+        sums = np.bincount(flat, weights=weights, minlength=n_days * bins).astype(np.int64)
+        return sums.reshape(n_days, bins) if bins > 1 else sums
+
+    rollup = {"days": days.astype(np.int64)}
+    for name, values in (("in", customer_in), ("out", customer_out)):
+        rollup[f"slots_{name}"] = per_day(values, business, n_slots, slot_idx)
+        rollup[f"hourly_{name}"] = per_day(values, None, 24, hour)
+        rollup[f"daily_{name}"] = per_day(values)
+        rollup[f"business_{name}"] = per_day(values, business)
+    rollup["business_rows"] = np.bincount(day_idx[business], minlength=n_days).astype(np.int64)
+    return rollup
+
+
+def day_positions(rollup, epoch_days):
+    """Row of each requested epoch day in a rollup, -1 where the day is absent"""
+    days = rollup["days"]
+    epoch_days = np.asarray(epoch_days, dtype=np.int64)
+    if len(days) == 0:
+        return np.full(len(epoch_days), -1)
+    pos = np.minimum(np.searchsorted(days, epoch_days), len(days) - 1)
+    return np.where(days[pos] == epoch_days, pos, -1)
+
+
+def merge_rollup(rollup, update):
+    """Rollup with the days of update added, replacing days present in both"""
+    keep = ~np.isin(rollup["days"], update["days"])
+    order = np.argsort(np.concatenate([rollup["days"][keep], update["days"]]), kind='stable')
+    return {name: np.concatenate([rollup[name][keep], update[name]])[order] for name in ROLLUP_ARRAYS}
+
+
+def save_rollup(directory, rollup):
+    for name in ROLLUP_ARRAYS + tuple(name for name in BASELINE_ARRAYS if name in rollup):
+        np.save(os.path.join(directory, f"rollup_{name}.npy"), rollup[name])
+
+
+def load_rollup(directory):
+    """Load a saved rollup, or None for datasets written before rollups existed
+    (baseline arrays are left out when it was saved without them)"""
+    if not os.path.exists(os.path.join(directory, "rollup_days.npy")):
+        return None
+    rollup = {name: np.load(os.path.join(directory, f"rollup_{name}.npy")) for name in ROLLUP_ARRAYS}
+    for name in BASELINE_ARRAYS:
+        path = os.path.join(directory, f"rollup_{name}.npy")
+        if os.path.exists(path):
+            rollup[name] = np.load(path, mmap_mode='r')
+    return rollup
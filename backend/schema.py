@@ -0,0 +1,226 @@
+"""
+Column schema inference for uploaded traffic data
+Resolves the timestamp (or separate date and time), Customer In/Out and
+site/sensor columns of a frame once per upload, with an explicit datetime
+format per column, so later requests read typed columns directly instead
+of re-scanning header names and re-parsing strings
+"""
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from ingest import TIMESTAMP_INDEX, detect_traffic_columns
+
+# Candidate formats for text columns, tried on a sample; a format must parse
+# every sampled value, and when several do the one parsing most of the column
+# wins. Month-first comes before day-first on ties, as in pandas' inference.
+TIMESTAMP_FORMATS = (
+    'ISO8601',
+    '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M',
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M',
+    '%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M',
+)
+DATE_FORMATS = ('ISO8601', '%m/%d/%Y', '%d/%m/%Y', '%d.%m.%Y')
+TIME_FORMATS = ('%H:%M:%S', '%H:%M', '%H:%M:%S.%f', '%I:%M:%S %p', '%I:%M %p')
+
+# Format recorded for columns that already hold datetimes (no text parsing)
+NATIVE = 'native'
+
+# Non-empty values checked when choosing a format
+SAMPLE_SIZE = 200
+
+# Header names tried for separate date and time columns
+DATE_NAMES = ('date', 'day')
+TIME_NAMES = ('time', 'hour')
+
+COUNT_ROLES = ('customer_in', 'customer_out')
+
+# Object and string columns holding these kinds of values can become categoricals...
+CATEGORY_KINDS = ('string', 'date', 'time')
+# ...when they have at most this many distinct values per row (site/sensor always do)
+CATEGORY_MAX_RATIO = 0.5
+
+
+def _sample(series):
+    values = series.dropna()
+    if values.dtype == object:
+        values = values[values.astype(str).str.strip() != '']
+    return values.head(SAMPLE_SIZE)
+
+
+def detect_format(series, formats):
+    """Format that parses every sampled value of a column, NATIVE for columns
+    of datetimes, or None when the column does not hold dates"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return NATIVE
+    sample = _sample(series)
+    if sample.empty or pd.api.types.is_numeric_dtype(sample):
+        return None
+    if pd.api.types.infer_dtype(sample, skipna=True) in ('datetime', 'datetime64', 'date'):
+        return NATIVE
+    text = sample.astype(str).str.strip()
+    matches = []
+    for fmt in formats:
+        try:
+            pd.to_datetime(text, format=fmt)
+        except (ValueError, TypeError):
+            continue
+        matches.append(fmt)
+    if len(matches) > 1:
+        # Ambiguous sample (e.g. only days 1-12): keep the format that parses most of the column
+        column = series.astype(str).str.strip()
+        parsed = [pd.to_datetime(column, format=fmt, errors='coerce').notna().sum() for fmt in matches]
+        return matches[int(np.argmax(parsed))]
+    return matches[0] if matches else None
+
+
+def parse_datetimes(series, fmt):
+    """A column as datetime64 using its detected format; unparseable values become NaT"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    if fmt == NATIVE:
+        return pd.to_datetime(series, errors='coerce')
+    return pd.to_datetime(series.astype(str).str.strip(), format=fmt, errors='coerce')
+
+
+def parse_times(series, fmt):
+    """A time-of-day column (time objects or text) as timedeltas since midnight"""
+    if fmt == NATIVE and isinstance(next(iter(_sample(series)), None), datetime.time):
+        # datetime.time objects print as HH:MM:SS[.ffffff]
+        return pd.to_timedelta(series.astype(str), errors='coerce')
+    parsed = parse_datetimes(series, fmt)
+    return parsed - parsed.dt.normalize()
+
+
+def _has_times(series, fmt):
+    """Whether any value carries a time of day (date-only columns are all
+    midnight); the whole column is checked, since time-sorted exports can
+    start with a midnight row for every sensor"""
+    parsed = parse_datetimes(series, fmt)
+    return bool((parsed.notna() & (parsed != parsed.dt.normalize())).any())
+
+
+def _time_format(series):
+    """Like detect_format for time-of-day columns (time objects count as NATIVE)"""
+    sample = _sample(series)
+    if not sample.empty and pd.api.types.infer_dtype(sample, skipna=True) == 'time':
+        return NATIVE
+    return detect_format(series, TIME_FORMATS)
+
+
+def infer_schema(df, traffic_columns=None):
+    """Resolve the columns the analysis needs, once per upload
+
+    traffic_columns are the roles found at ingest and win over header
+    matching. The timestamp is the ingest timestamp if it parses, else column
+    C, else the first datetime column, provided it parses and is not
+    date-only; without one, separate date and time columns are looked up by
+    name. Returns the role -> column mapping
+    (timestamp, date, time, customer_in, customer_out, site, sensor; None when
+    absent) with the datetime format of each date column under "formats".
+    """
+    columns = list(df.columns)
+    schema = detect_traffic_columns(columns)
+    schema.update({role: name for role, name in (traffic_columns or {}).items() if name in df.columns})
+    for role in COUNT_ROLES:
+        if schema[role] not in df.columns:
+            schema[role] = None
+
+    formats = {}
+    candidates = [schema["timestamp"]]
+    if len(columns) > TIMESTAMP_INDEX:
+        candidates.append(columns[TIMESTAMP_INDEX])
+    candidates += [name for name in columns if pd.api.types.is_datetime64_any_dtype(df[name])]
+
+    ingest_timestamp = (traffic_columns or {}).get("timestamp")
+    schema["timestamp"] = None
+    for name in candidates:
+        if name in df.columns:
+            fmt = detect_format(df[name], TIMESTAMP_FORMATS)
+            if fmt is not None and (name == ingest_timestamp or _has_times(df[name], fmt)):
+                schema["timestamp"], formats["timestamp"] = name, fmt
+                break
+
+    schema["date"] = schema["time"] = None
+    if schema["timestamp"] is None:
+        for role, names, detect in (("date", DATE_NAMES, lambda s: detect_format(s, DATE_FORMATS)),
+                                    ("time", TIME_NAMES, _time_format)):
+            for name in columns:
+                if any(part in str(name).lower() for part in names):
+                    fmt = detect(df[name])
+                    if fmt is not None:
+                        schema[role], formats[role] = name, fmt
+                        break
+
+    schema["formats"] = formats
+    return schema
+
+
+def schema_timestamps(df, schema):
+    """Parsed timestamps of every row (a datetime64 Series), from the timestamp
+    column or the date and time columns; None when the schema has neither"""
+    formats = schema.get("formats", {})
+    if schema.get("timestamp") in df.columns:
+        return parse_datetimes(df[schema["timestamp"]], formats.get("timestamp"))
+    if schema.get("date") in df.columns and schema.get("time") in df.columns:
+        dates = parse_datetimes(df[schema["date"]], formats.get("date")).dt.normalize()
+        return dates + parse_times(df[schema["time"]], formats.get("time"))
+    return None
+
+
+def parse_counts(df, schema):
+    """Convert the Customer In/Out columns to numbers in place (int64 when
+    nothing is missing), leaving numeric columns untouched"""
+    for role in COUNT_ROLES:
+        name = schema.get(role)
+        if name in df.columns and not pd.api.types.is_numeric_dtype(df[name]):
+            counts = pd.to_numeric(df[name], errors='coerce')
+            df[name] = counts.astype(np.int64) if counts.notna().all() else counts
+    return df
+
+
+def columnar_roles(schema):
+    """Role -> column mapping for the columnar store, or None when the schema
+    lacks a timestamp column or either count column"""
+    if any(schema.get(role) is None for role in ("timestamp",) + COUNT_ROLES):
+        return None
+    return {role: schema[role] for role in ("timestamp", "customer_in", "customer_out", "site", "sensor")
+            if schema.get(role) is not None}
+
+
+def _narrow_ints(series, minimum=None):
+    """Smallest integer dtype holding every value (at least minimum)"""
+    narrowed = pd.to_numeric(series, downcast='integer')
+    if minimum is not None and narrowed.dtype.itemsize < np.dtype(minimum).itemsize:
+        return series.astype(minimum)
+    return narrowed
+
+
+def compact_frame(df, schema=None):
+    """Frame of an in-memory dataset with compact dtypes
+
+    Count columns become int32 (other whole-number columns, including floats
+    without NaNs, the narrowest integer type) and dates, times, site/sensor labels and other repetitive
+    text become categoricals with sorted categories, so each row holds a
+    small code rather than a boxed Python object. Timestamps stay datetime64
+    (int64 epoch values). Encoded rows and sort orders are unchanged.
+    """
+    schema = schema or {}
+    counts = {schema.get(role) for role in COUNT_ROLES} - {None}
+    labels = {schema.get('site'), schema.get('sensor')} - {None}
+
+    compact = df.copy(deep=False)
+    for name in df.columns:
+        series = df[name]
+        if pd.api.types.is_integer_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            compact[name] = _narrow_ints(series, np.int32 if name in counts else None)
+        elif pd.api.types.is_float_dtype(series) and series.notna().all() and (series % 1 == 0).all():
+            # Whole numbers widened to float by since-dropped NaNs (encoded as ints either way)
+            compact[name] = _narrow_ints(series.astype(np.int64), np.int32 if name in counts else None)
+        elif ((series.dtype == object or isinstance(series.dtype, pd.StringDtype))
+              and pd.api.types.infer_dtype(series, skipna=True) in CATEGORY_KINDS):
+            if name in labels or series.nunique() <= len(series) * CATEGORY_MAX_RATIO:
+                compact[name] = series.astype('category')
+    return compact
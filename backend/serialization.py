@@ -0,0 +1,155 @@
+"""
+Columnar JSON encoder for DataFrames returned by the Traffic Analytics API
+Converts whole columns at once instead of walking rows with iterrows(), and
+streams large frames as NDJSON or Arrow IPC in bounded batches
+"""
+
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional, only needed for Arrow IPC output
+    pa = None
+
+LAYOUTS = ('records', 'columns')
+
+# Response formats: one JSON document, or chunked NDJSON / Arrow IPC streams
+FORMATS = ('json', 'ndjson', 'arrow')
+NDJSON_MIMETYPE = 'application/x-ndjson'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+# Rows encoded per streamed chunk
+STREAM_BATCH_ROWS = 5000
+
+
+def _with_nulls(values, null_mask):
+    """Python list with None wherever null_mask is set"""
+    values = values.tolist() if hasattr(values, 'tolist') else list(values)
+    if null_mask.any():
+        for i in np.flatnonzero(null_mask):
+            values[i] = None
+    return values
+
+
+def encode_column(series):
+    """Convert a Series into a list of JSON-serializable values
+
+    Timestamps become 'YYYY-MM-DD HH:MM:SS', dates and times their ISO
+    strings, numerics int/float with NaN as null, anything else str().
+    Categoricals are encoded like their categories.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Encode each category once and expand by code (code -1 is null)
+        categories = encode_column(pd.Series(series.cat.categories)) + [None]
+        return np.array(categories, dtype=object)[series.cat.codes.to_numpy()].tolist()
+
+    null_mask = series.isna().to_numpy()
+
+    if pd.api.types.is_bool_dtype(series):
+        return _with_nulls(series.to_numpy(dtype=object), null_mask)
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return _with_nulls(series.dt.strftime('%Y-%m-%d %H:%M:%S').to_numpy(dtype=object), null_mask)
+
+    if pd.api.types.is_numeric_dtype(series):
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        finite = np.isfinite(values)
+        null_mask = ~finite
+        # Whole-number columns (including ints widened to float by NaNs) stay ints
+        if pd.api.types.is_integer_dtype(series) or np.array_equal(values[finite], np.trunc(values[finite])):
+            values = np.where(finite, values, 0).astype(np.int64)
+        return _with_nulls(values, null_mask)
+
+    kind = pd.api.types.infer_dtype(series, skipna=True)
+    if kind == 'datetime':
+        converted = pd.to_datetime(series, errors='coerce')
+        return _with_nulls(converted.dt.strftime('%Y-%m-%d %H:%M:%S').to_numpy(dtype=object), converted.isna().to_numpy())
+    if kind in ('integer', 'floating', 'mixed-integer-float'):
+        return encode_column(pd.to_numeric(series, errors='coerce'))
+    if kind == 'string':
+        return _with_nulls(series.to_numpy(dtype=object), null_mask)
+
+    return _with_nulls(series.astype(str).to_numpy(dtype=object), null_mask)
+
+
+def encode_frame(df, layout='records'):
+    """Encode a DataFrame as records (list of dicts) or columns ({"columns", "data"})"""
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout '{layout}', expected one of {', '.join(LAYOUTS)}")
+
+    names = [str(col) for col in df.columns]
+    columns = [encode_column(df.iloc[:, i]) for i in range(df.shape[1])]
+
+    if layout == 'columns':
+        return {"columns": names, "data": dict(zip(names, columns))}
+
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def head(encoded, n):
+    """First n rows of an encoded frame, in either layout"""
+    if isinstance(encoded, dict):
+        return {
+            "columns": encoded["columns"],
+            "data": {name: values[:n] for name, values in encoded["data"].items()},
+        }
+    return encoded[:n]
+
+
+def _batches(df, rows, columns, batch_rows):
+    """Frames of at most batch_rows rows, taken at positions rows (default: all)
+    and limited to columns (default: all)"""
+    total = len(df) if rows is None else len(rows)
+    for start in range(0, total, batch_rows):
+        if rows is None:
+            batch = df.iloc[start:start + batch_rows]
+        else:
+            batch = df.iloc[rows[start:start + batch_rows]]
+        yield batch[columns] if columns else batch
+
+
+def iter_ndjson(df, header=None, rows=None, columns=None, batch_rows=STREAM_BATCH_ROWS):
+    """Yield NDJSON bytes: the header object (if any) on the first line, then
+    one object per row, encoding batch_rows rows at a time"""
+    if header is not None:
+        yield (json.dumps(header, separators=(',', ':')) + '\n').encode('utf-8')
+    for batch in _batches(df, rows, columns, batch_rows):
+        lines = (json.dumps(record, separators=(',', ':')) for record in encode_frame(batch))
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def iter_arrow_ipc(df, header=None, rows=None, columns=None, batch_rows=STREAM_BATCH_ROWS):
+    """Arrow IPC stream of the frame, one record batch per batch_rows rows
+
+    The header is stored as JSON under the 'meta' key of the schema metadata.
+    The schema is resolved before the first chunk is produced, so type errors
+    raise here instead of half way through a response.
+    """
+    if pa is None:
+        raise ValueError("Arrow output requires pyarrow. Run: pip install -r requirements-optional.txt")
+
+    # Infer types from the first batch; columns it leaves untyped (all null) become strings
+    sample = next(_batches(df, rows, columns, batch_rows), None)
+    if sample is None:
+        sample = df.iloc[:0][columns] if columns else df.iloc[:0]
+    schema = pa.Schema.from_pandas(sample, preserve_index=False)
+    schema = pa.schema([
+        field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in schema
+    ])
+    schema = schema.with_metadata({b'meta': json.dumps(header or {}).encode('utf-8')})
+
+    def generate():
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, schema) as writer:
+            for batch in _batches(df, rows, columns, batch_rows):
+                writer.write_batch(pa.RecordBatch.from_pandas(batch, schema=schema, preserve_index=False))
+                yield sink.getvalue()
+                sink.seek(0)
+                sink.truncate()
+        yield sink.getvalue()  # end-of-stream marker
+
+    return generate()
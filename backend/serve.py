@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Production server for the Traffic Analytics API
+Runs the Flask app under gunicorn (multi-process, threaded workers) or,
+where gunicorn is unavailable (Windows), under waitress
+
+Usage: python serve.py --workers 4 --threads 4 --timeout 300
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+
+from api import create_app
+
+
+def default_workers():
+    return int(os.environ.get('API_WORKERS', min(multiprocessing.cpu_count(), 4)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Traffic Analytics API in production mode")
+    parser.add_argument('--host', default=os.environ.get('API_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('API_PORT', 5000)))
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'waitress'], default='auto',
+                        help="WSGI server to use (auto: gunicorn if installed, else waitress)")
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help="worker processes (gunicorn only)")
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('API_THREADS', 4)),
+                        help="request threads per worker")
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('API_TIMEOUT', 300)),
+                        help="seconds before a stuck request/worker is aborted")
+    parser.add_argument('--keepalive', type=int, default=int(os.environ.get('API_KEEPALIVE', 5)),
+                        help="seconds to hold idle keep-alive connections open")
+    return parser.parse_args(argv)
+
+
+def run_gunicorn(app, args):
+    from gunicorn.app.base import BaseApplication
+
+    class StandaloneApplication(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    options = {
+        'bind': f"{args.host}:{args.port}",
+        'workers': args.workers,
+        # Threaded workers keep health checks and comparisons responsive while
+        # another thread in the same worker parses a large upload
+        'worker_class': 'gthread',
+        'threads': args.threads,
+        'timeout': args.timeout,
+        'graceful_timeout': 30,
+        'keepalive': args.keepalive,
+    }
+    StandaloneApplication(app, options).run()
+
+
+def run_waitress(app, args):
+    from waitress import serve
+
+    serve(
+        app,
+        host=args.host,
+        port=args.port,
+        threads=args.threads,
+        channel_timeout=args.timeout,
+    )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    app = create_app()
+
+    server = args.server
+    if server == 'auto':
+        try:
+            import gunicorn  # noqa: F401
+            server = 'gunicorn'
+        except ImportError:
+            server = 'waitress'
+
+    print(f"Serving Traffic Analytics API on http://{args.host}:{args.port} with {server} "
+          f"({args.workers if server == 'gunicorn' else 1} worker(s) x {args.threads} threads, "
+          f"timeout {args.timeout}s)")
+
+    try:
+        if server == 'gunicorn':
+            run_gunicorn(app, args)
+        else:
+            run_waitress(app, args)
+    except ImportError:
+        print(f"{server} is not installed. Run: pip install -r requirements.txt")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Shared time bucketing for the Traffic Analytics API and Streamlit app
+Maps epoch-minute timestamps onto a grid of fixed-width slots between an
+opening and closing hour using integer arithmetic, optionally in a timezone
+"""
+
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+import pandas as pd
+
+MINUTES_PER_DAY = 24 * 60
+
+# Default slot width and business-hours window
+SLOT_MINUTES = 15
+DAY_START_HOUR = 8
+DAY_END_HOUR = 20
+
+# Slot widths offered by the dashboards (any divisor of the window works)
+SLOT_WIDTHS = (5, 15, 30, 60)
+
+
+def format_slot_label(start_minute, slot_minutes=SLOT_MINUTES):
+    """Display label for a slot, e.g. '08:00-08:15am' (am/pm from the end time)"""
+    hour, minute = divmod(int(start_minute), 60)
+    end_hour, end_minute = divmod(int(start_minute) + slot_minutes, 60)
+    ampm = "pm" if end_hour >= 12 else "am"
+    return f"{hour:02d}:{minute:02d}-{end_hour:02d}:{end_minute:02d}{ampm}"
+
+
+class TimeBuckets:
+    """Slot grid definition: slot width, open/close hours and timezone
+
+    Timestamps are wall-clock minutes as stored. With a timezone they are
+    taken as UTC and converted to that zone's wall clock before bucketing.
+    """
+
+    def __init__(self, slot_minutes=SLOT_MINUTES, open_hour=DAY_START_HOUR,
+                 close_hour=DAY_END_HOUR, timezone=None):
+        if not 0 <= open_hour < close_hour <= 24:
+            raise ValueError("Opening hour must be before closing hour, both within 0-24")
+        if slot_minutes <= 0 or ((close_hour - open_hour) * 60) % slot_minutes:
+            raise ValueError(f"Slot width must divide the {open_hour}:00-{close_hour}:00 window into whole slots")
+        if timezone:
+            try:
+                ZoneInfo(timezone)
+            except (ZoneInfoNotFoundError, ValueError):
+                raise ValueError(f"Unknown timezone '{timezone}'")
+
+        self.slot_minutes = int(slot_minutes)
+        self.open_hour = int(open_hour)
+        self.close_hour = int(close_hour)
+        self.timezone = timezone or None
+        self.starts = np.arange(self.open_hour * 60, self.close_hour * 60, self.slot_minutes)
+
+    @classmethod
+    def from_params(cls, params):
+        """Build from request parameters (slot_minutes, open_hour, close_hour,
+        timezone), using the defaults for missing ones. Raises ValueError."""
+        def integer(name, default):
+            value = params.get(name)
+            if value is None or value == '':
+                return default
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} must be an integer")
+
+        return cls(
+            integer('slot_minutes', SLOT_MINUTES),
+            integer('open_hour', DAY_START_HOUR),
+            integer('close_hour', DAY_END_HOUR),
+            params.get('timezone') or None,
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, TimeBuckets) and self.params() == other.params()
+
+    def __hash__(self):
+        return hash(tuple(self.params().values()))
+
+    def __repr__(self):
+        return (f"TimeBuckets({self.slot_minutes}, {self.open_hour}, {self.close_hour}, "
+                f"{self.timezone!r})")
+
+    def params(self):
+        return {
+            "slot_minutes": self.slot_minutes,
+            "open_hour": self.open_hour,
+            "close_hour": self.close_hour,
+            "timezone": self.timezone,
+        }
+
+    @property
+    def n_slots(self):
+        return len(self.starts)
+
+    def labels(self):
+        return [format_slot_label(start, self.slot_minutes) for start in self.starts]
+
+    def local_minutes(self, ts_minutes):
+        """Epoch minutes on this grid's wall clock (unchanged without a timezone)"""
+        ts_minutes = np.asarray(ts_minutes, dtype=np.int64)
+        if self.timezone is None:
+            return ts_minutes
+        utc = pd.DatetimeIndex(ts_minutes.astype('datetime64[m]')).tz_localize('UTC')
+        wall = utc.tz_convert(self.timezone).tz_localize(None)
+        return wall.to_numpy().astype('datetime64[m]').astype(np.int64)
+
+    def in_window(self, minutes):
+        """Mask of minute-of-day values between the opening and closing hour"""
+        minutes = np.asarray(minutes)
+        return (minutes >= self.open_hour * 60) & (minutes < self.close_hour * 60)
+
+    def in_hours(self, hours):
+        """Mask of hour-of-day values inside the window (for Hour columns)"""
+        hours = np.asarray(hours)
+        return (hours >= self.open_hour) & (hours < self.close_hour)
+
+    def slot_index(self, minutes):
+        """Slot of each minute-of-day value, -1 outside the window"""
+        minutes = np.asarray(minutes, dtype=np.int64)
+        return np.where(self.in_window(minutes), (minutes - self.open_hour * 60) // self.slot_minutes, -1)
+
+    def day_grid(self, minutes, values):
+        """Sum one day's values into the slot grid; one n_slots array per value column"""
+        slot_idx = self.slot_index(minutes)
+        inside = slot_idx >= 0
+        return [
+            np.bincount(slot_idx[inside], weights=np.asarray(column, dtype=np.float64)[inside],
+                        minlength=self.n_slots).astype(np.int64)
+            for column in values
+        ]
+
+    def grid(self, day_idx, minutes, values, n_days):
+        """Sum values into (n_days, n_slots) grids; rows with day_idx < 0 are ignored
+
+        Returns the grids and the number of rows inside the window per day.
+        """
+        day_idx = np.asarray(day_idx, dtype=np.int64)
+        slot_idx = self.slot_index(minutes)
+        inside = (day_idx >= 0) & (slot_idx >= 0)
+        flat = day_idx[inside] * self.n_slots + slot_idx[inside]
+
+        grids = []
+        for column in values:
+            column = np.nan_to_num(np.asarray(column, dtype=np.float64)[inside])
+            sums = np.bincount(flat, weights=column, minlength=n_days * self.n_slots)
+            grids.append(sums.reshape(n_days, self.n_slots).astype(np.int64))
+        return grids, np.bincount(day_idx[inside], minlength=n_days)
+
+    def can_rebucket(self, source):
+        """Whether grids built with source can be summed up into this grid"""
+        return (
+            self.timezone == source.timezone
+            and self.open_hour == source.open_hour
+            and self.close_hour == source.close_hour
+            and self.slot_minutes % source.slot_minutes == 0
+        )
+
+    def rebucket(self, grid, source):
+        """Sum a (..., source.n_slots) grid into this grid's coarser slots"""
+        if not self.can_rebucket(source):
+            raise ValueError(f"Cannot rebucket {source!r} into {self!r}")
+        factor = self.slot_minutes // source.slot_minutes
+        grid = np.asarray(grid)
+        return grid.reshape(grid.shape[:-1] + (self.n_slots, factor)).sum(axis=-1)
+
+
+# Grid used by the rollups written at ingest and by requests that do not ask for another
+DEFAULT_BUCKETS = TimeBuckets()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ingestion, processing and comparison hot paths
+Times pd.read_excel, the upload ingest path, process_excel_data, /api/compare
+through the Flask test client and the Streamlit app's comparison logic on a
+synthetic workbook, with throughput and peak memory per stage, and flags
+regressions against benchmarks/baseline.json
+Usage: python benchmarks/bench_hot_paths.py [--rows N | --days N | --workbook PATH] [--sites N] [--save-baseline]
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from generate_workbook import days_for_rows, make_traffic_frame, write_workbook
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# A stage regresses when it is this much slower (or hungrier) than the baseline;
+# timings on shared CI machines easily vary by a third
+DEFAULT_TOLERANCE = 0.5
+# Timings under this are too noisy to flag
+MIN_FLAGGED_SECONDS = 0.02
+
+
+def best_of(repeat, setup, func):
+    """Fastest of repeat runs of func(*setup()), setup excluded from the timing"""
+    best = None
+    for _ in range(repeat):
+        args = setup()
+        # Like timeit: collect first and keep the collector out of the measurement
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            func(*args)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def peak_memory_mb(setup, func):
+    """Peak traced allocation of one run of func(*setup()) in MB (NumPy buffers included)"""
+    args = setup()
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def run(args, workdir):
+    # Stores go to the scratch directory; api reads these when imported
+    for name in ('COLUMNAR_STORE_DIR', 'PARSE_CACHE_DIR', 'JOBS_DIR'):
+        os.environ[name] = os.path.join(workdir, name.lower())
+    import api
+    from comparison import UploadSlots, compare_days
+    from highlight_rules import default_rules
+    from time_buckets import TimeBuckets
+
+    if args.workbook:
+        # Reuse a workbook from generate_workbook.py (writing millions of rows takes minutes)
+        path = args.workbook
+    else:
+        days = days_for_rows(args.rows, args.sites, 1, args.slot_minutes) if args.rows else args.days
+        frame = make_traffic_frame(days, args.sites, slot_minutes=args.slot_minutes)
+        path = os.path.join(workdir, 'bench.xlsx')
+        start = time.perf_counter()
+        write_workbook(frame, path)
+        print(f"Generated {len(frame):,} rows ({days} days, {args.sites} site(s), "
+              f"{args.slot_minutes}-minute slots) in {time.perf_counter() - start:.1f}s")
+
+    df, stats = api.jobs.parse_files([path], None)[0]
+    traffic_columns = stats['traffic_columns']
+    rows = len(df)
+    sites = df[traffic_columns['site']].nunique() if traffic_columns.get('site') else 1
+    date1, date2 = (str(day) for day in df[traffic_columns['timestamp']].dt.date.unique()[:2])
+    dataset_id = api.process_excel_data(df.copy(), 'records', traffic_columns)['dataset_id']
+    client = api.create_app().test_client()
+    buckets = TimeBuckets()
+
+    def compare():
+        response = client.post('/api/compare', json={"dataset_id": dataset_id, "date1": date1, "date2": date2})
+        if response.status_code != 200:
+            raise RuntimeError(f"/api/compare returned {response.status_code}: {response.get_json()}")
+
+    def process(frame):
+        result = api.process_excel_data(frame, 'records', traffic_columns)
+        api.dataset_store.delete(result['dataset_id'])
+        api.columnar_store.delete(result['dataset_id'])
+
+    def app_compare(frame):
+        # The Streamlit app's path: slot source over the parsed rows, then one date pair
+        compare_days(UploadSlots(frame, traffic_columns, buckets), date1, date2, default_rules(), buckets)
+
+    # name -> (setup, func, rows processed)
+    stages = {
+        'read_excel': (lambda: (path,), lambda p: pd.read_excel(p, sheet_name=None), rows),
+        'ingest': (lambda: ([path],), lambda paths: api.jobs.parse_files(paths, None), rows),
+        'process': (lambda: (df.copy(),), process, rows),
+        'compare': (lambda: (), compare, None),
+        'app_compare': (lambda: (df,), app_compare, rows),
+    }
+    if args.stages:
+        stages = {name: stage for name, stage in stages.items() if name in args.stages}
+
+    results = {}
+    for name, (setup, func, stage_rows) in stages.items():
+        seconds = best_of(args.repeat, setup, func)
+        results[name] = {
+            "seconds": round(seconds, 5),
+            "rows_per_sec": round(stage_rows / seconds, 1) if stage_rows else None,
+            "peak_mb": round(peak_memory_mb(setup, func), 2),
+        }
+    return f"rows={rows},sites={sites},slot_minutes={args.slot_minutes}", results
+
+
+def check(results, baseline, tolerance):
+    """Stage name -> list of regression messages against a baseline entry"""
+    regressions = {}
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        messages = []
+        if result["seconds"] > MIN_FLAGGED_SECONDS and result["seconds"] > base["seconds"] * (1 + tolerance):
+            messages.append(f"{result['seconds'] / base['seconds']:.2f}x slower")
+        if result["peak_mb"] > base["peak_mb"] * (1 + tolerance) + 1:
+            messages.append(f"peak memory {result['peak_mb']:.1f} MB vs {base['peak_mb']:.1f} MB")
+        if messages:
+            regressions[name] = messages
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=28)
+    parser.add_argument('--rows', type=int, help="total rows (overrides --days), up to millions")
+    parser.add_argument('--sites', type=int, default=2)
+    parser.add_argument('--slot-minutes', type=int, default=15)
+    parser.add_argument('--workbook', help="benchmark this workbook instead of generating one")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stages', nargs='+', help="run only these stages")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="record these results as the baseline")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='traffic-bench-')
+    try:
+        config, results = run(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baselines = json.load(f)
+    baseline = baselines.get(config, {}).get("stages", {})
+    regressions = check(results, baseline, args.tolerance)
+
+    print(f"\n{'stage':<12} {'seconds':>9} {'rows/sec':>12} {'peak MB':>9} {'baseline':>9}  status")
+    for name, result in results.items():
+        base = baseline.get(name, {}).get("seconds")
+        rate = f"{result['rows_per_sec']:,.0f}" if result['rows_per_sec'] else '-'
+        status = '; '.join(regressions.get(name, [])) or ('ok' if base else 'no baseline')
+        print(f"{name:<12} {result['seconds']:>9.4f} {rate:>12} {result['peak_mb']:>9.1f} "
+              f"{base if base is not None else '-':>9}  {status}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"config": config, "stages": results, "regressions": regressions}, f, indent=2)
+
+    if args.save_baseline:
+        baselines[config] = {
+            "machine": f"{platform.machine()} {platform.system()}, {os.cpu_count()} CPUs, Python {platform.python_version()}",
+            "stages": results,
+        }
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"\nSaved baseline for {config} to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} stage(s) regressed by more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
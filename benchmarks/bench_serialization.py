@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark: iterrows-based row serialization vs the columnar encoder
+Usage: python benchmarks/bench_serialization.py [rows]
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from serialization import encode_frame
+
+
+def make_frame(rows):
+    """Synthetic frame shaped like a processed traffic export"""
+    ts = pd.date_range('2024-01-01 08:00', periods=rows, freq='15min')
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'Site': 'Main Entrance',
+        'Sensor': 'S1',
+        'Traffic Start TS': ts,
+        'Traffic End TS': ts + pd.Timedelta(minutes=15),
+        'Customer In': rng.integers(0, 200, rows),
+        'Customer Out': rng.integers(0, 200, rows),
+    })
+    df['Date'] = df['Traffic Start TS'].dt.date
+    df['Time'] = df['Traffic Start TS'].dt.time
+    df['Hour'] = df['Traffic Start TS'].dt.hour
+    return df
+
+
+def iterrows_encode(df):
+    """The per-row loop previously used in process_excel_data"""
+    processed_data = []
+    for _, row in df.iterrows():
+        processed_row = {}
+        for col in df.columns:
+            value = row[col]
+            if isinstance(value, pd.Timestamp):
+                processed_row[col] = value.strftime('%Y-%m-%d %H:%M:%S')
+            elif isinstance(value, datetime):
+                processed_row[col] = value.strftime('%Y-%m-%d')
+            elif isinstance(value, (np.integer, np.floating)):
+                processed_row[col] = int(float(value)) if np.isfinite(value) else None
+            elif pd.isna(value):
+                processed_row[col] = None
+            else:
+                processed_row[col] = str(value)
+        processed_data.append(processed_row)
+    return processed_data
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    df = make_frame(rows)
+
+    print(f"Serializing {rows:,} rows x {df.shape[1]} columns")
+    baseline = timed(iterrows_encode, df)
+    records = timed(encode_frame, df, 'records')
+    columns = timed(encode_frame, df, 'columns')
+
+    print(f"  iterrows loop      : {baseline:8.3f}s")
+    print(f"  columnar (records) : {records:8.3f}s  ({baseline / records:5.1f}x faster)")
+    print(f"  columnar (columns) : {columns:8.3f}s  ({baseline / columns:5.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
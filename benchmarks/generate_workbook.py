@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Synthetic traffic workbook generator for the benchmarks
+Writes exports shaped like the real ones (Site, Sensor, Traffic Start TS,
+Traffic End TS, Customer In, Customer Out) covering whole days per sensor
+Usage: python benchmarks/generate_workbook.py out.xlsx [--days N | --rows N] [--sites N] [--slot-minutes N]
+"""
+
+import argparse
+import math
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+# Data rows per sheet (Excel's limit is 1,048,576 including the header)
+MAX_SHEET_ROWS = 1_000_000
+
+HEADER = ['Site', 'Sensor', 'Traffic Start TS', 'Traffic End TS', 'Customer In', 'Customer Out']
+
+
+def rows_per_day(sites=1, sensors=1, slot_minutes=15):
+    return sites * sensors * (24 * 60 // slot_minutes)
+
+
+def days_for_rows(rows, sites=1, sensors=1, slot_minutes=15):
+    """Whole days needed for at least rows rows"""
+    return max(1, math.ceil(rows / rows_per_day(sites, sensors, slot_minutes)))
+
+
+def make_traffic_frame(days=28, sites=2, sensors=1, slot_minutes=15, start='2024-01-01', seed=0):
+    """Counts follow a midday peak per site with Poisson noise and quieter weekends"""
+    if (24 * 60) % slot_minutes:
+        raise ValueError("slot_minutes must divide a day")
+    rng = np.random.default_rng(seed)
+    starts = pd.date_range(start, periods=days * 24 * 60 // slot_minutes, freq=f'{slot_minutes}min')
+
+    hours = starts.hour.to_numpy() + starts.minute.to_numpy() / 60
+    profile = np.clip(np.sin((hours - 6) / 16 * np.pi), 0, None) ** 2
+    profile *= np.where(starts.dayofweek.to_numpy() >= 5, 0.6, 1.0) * slot_minutes / 15
+
+    frames = []
+    for site in range(sites):
+        for sensor in range(sensors):
+            scale = 40 * (1 + site % 5)
+            frames.append(pd.DataFrame({
+                'Site': f'Site {site + 1}',
+                'Sensor': f'S{sensor + 1}',
+                'Traffic Start TS': starts,
+                'Traffic End TS': starts + pd.Timedelta(minutes=slot_minutes),
+                'Customer In': rng.poisson(scale * profile),
+                'Customer Out': rng.poisson(scale * profile),
+            }))
+    return pd.concat(frames, ignore_index=True)[HEADER]
+
+
+def write_workbook(df, path, max_sheet_rows=MAX_SHEET_ROWS):
+    """Write df with a streaming openpyxl writer, starting a new sheet every max_sheet_rows rows"""
+    workbook = Workbook(write_only=True)
+    columns = [df[name].to_numpy(dtype=object) if name in ('Site', 'Sensor') else df[name].tolist()
+               for name in HEADER]
+    for sheet, offset in enumerate(range(0, max(len(df), 1), max_sheet_rows)):
+        worksheet = workbook.create_sheet(f'Sheet{sheet + 1}')
+        worksheet.append(HEADER)
+        for row in zip(*(column[offset:offset + max_sheet_rows] for column in columns)):
+            worksheet.append(row)
+    workbook.save(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--days', type=int, default=28)
+    parser.add_argument('--rows', type=int, help="total rows (overrides --days)")
+    parser.add_argument('--sites', type=int, default=2)
+    parser.add_argument('--sensors', type=int, default=1, help="sensors per site")
+    parser.add_argument('--slot-minutes', type=int, default=15)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    days = days_for_rows(args.rows, args.sites, args.sensors, args.slot_minutes) if args.rows else args.days
+    df = make_traffic_frame(days, args.sites, args.sensors, args.slot_minutes, seed=args.seed)
+    write_workbook(df, args.path)
+    print(f"Wrote {len(df):,} rows ({days} days, {args.sites} site(s)) to {args.path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Load test: concurrent analysts uploading exports and comparing dates
+Each virtual user is a thread with its own client that picks /api/upload or
+/api/compare by the request mix, against a running API (--url), a server
+started for the run (--start-server) or the app in this process
+(--in-process). Reports p50/p95/p99 latency, throughput and error rates per
+operation and concurrency level
+Usage: python benchmarks/load_test.py [--start-server --workers N] [--users 1 4 16] [--mix compare=9,upload=1] [--days 7 28]
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from generate_workbook import make_traffic_frame, write_workbook
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+DEFAULT_URL = "http://localhost:5000/api"
+OPERATIONS = ('upload', 'compare')
+XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Seconds to wait for a started server to answer /api/health
+SERVER_START_TIMEOUT = 60
+# Error messages kept per operation for the report
+MAX_ERROR_SAMPLES = 3
+
+
+def parse_mix(text):
+    """'compare=9,upload=1' -> {'compare': 0.9, 'upload': 0.1}"""
+    weights = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}'. Use: {', '.join(OPERATIONS)}")
+        try:
+            weights[name] = float(weight) if weight else 1.0
+        except ValueError:
+            raise ValueError(f"Weight of '{name}' must be a number")
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("The request mix needs a positive weight")
+    return {name: weight / total for name, weight in weights.items() if weight > 0}
+
+
+def parse_server_timing(header):
+    """'parse;dur=12.5, total;dur=20.1' -> {'parse': 12.5, 'total': 20.1} (milliseconds)"""
+    stages = {}
+    for entry in (header or '').split(','):
+        name, _, params = entry.strip().partition(';')
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'dur':
+                try:
+                    stages[name] = stages.get(name, 0.0) + float(value)
+                except ValueError:
+                    pass
+    return stages
+
+
+class HttpClient:
+    """One analyst's HTTP session (connections are kept alive between requests)"""
+
+    def __init__(self, base_url, timeout):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def request(self, method, path, json_body=None, upload=None):
+        """(status, JSON body or None, Server-Timing header); upload is (name, bytes)"""
+        files = {'file': (upload[0], upload[1], XLSX_MIME)} if upload else None
+        response = self.session.request(method, self.base_url + path, json=json_body, files=files,
+                                        timeout=self.timeout)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return response.status_code, body, response.headers.get('Server-Timing')
+
+    def close(self):
+        self.session.close()
+
+
+class InProcessClient:
+    """Flask test client against the app in this process: no network or server
+    in the way, but the load generator shares the app's interpreter (and GIL)"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json_body=None, upload=None):
+        data = {'file': (io.BytesIO(upload[1]), upload[0])} if upload else None
+        response = self.client.open('/api' + path, method=method, json=json_body, data=data,
+                                    content_type='multipart/form-data' if upload else None)
+        return response.status_code, response.get_json(silent=True), response.headers.get('Server-Timing')
+
+    def close(self):
+        pass
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, workdir):
+    """Start backend/serve.py on a free local port with its stores in workdir; returns (process, url)"""
+    port = free_port()
+    env = dict(os.environ)
+    for name in ('COLUMNAR_STORE_DIR', 'PARSE_CACHE_DIR', 'JOBS_DIR'):
+        env[name] = os.path.join(workdir, name.lower())
+    command = [sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(port),
+               '--workers', str(args.workers), '--threads', str(args.threads)]
+    if args.server != 'auto':
+        command += ['--server', args.server]
+
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}/api"
+
+    client = HttpClient(url, timeout=5)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            if client.request('GET', '/health')[0] == 200:
+                client.close()
+                print(f"Started {' '.join(command[1:])} (log: {log.name})")
+                return process, url
+        except Exception:
+            pass
+        time.sleep(0.25)
+    client.close()
+    stop_server(process)
+    log.close()
+    with open(log.name, 'r') as f:
+        print(f.read()[-2000:])
+    raise RuntimeError("The API server did not become healthy")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def make_workbooks(days_list, sites, variants, workdir):
+    """Workbook bytes per dataset size; variants differ in their counts so
+    repeated uploads are not all answered from the parse cache"""
+    workbooks = {}
+    for days in days_list:
+        label = f"{days}d"
+        workbooks[label] = []
+        for seed in range(variants):
+            path = os.path.join(workdir, f"load-{label}-{seed}.xlsx")
+            write_workbook(make_traffic_frame(days, sites, seed=seed), path)
+            with open(path, 'rb') as f:
+                workbooks[label].append((os.path.basename(path), f.read()))
+    return workbooks
+
+
+def prepare_datasets(client, workbooks):
+    """Upload one workbook per size for the compare requests to use"""
+    datasets = {}
+    for label, variants in workbooks.items():
+        status, body, _ = client.request('POST', '/upload', upload=variants[0])
+        if status != 200 or not body or not body.get('dataset_id'):
+            raise RuntimeError(f"Preparing the {label} dataset failed ({status}): {body}")
+        if len(body['available_dates']) < 2:
+            raise RuntimeError(f"The {label} dataset needs at least two dates to compare")
+        datasets[label] = (body['dataset_id'], body['available_dates'])
+    return datasets
+
+
+def virtual_user(user, make_client, mix, workbooks, datasets, args, deadline, records):
+    """One analyst's request loop; appends (operation, size, seconds, status, error, stages,
+    parse cache hit) to records"""
+    rng = np.random.default_rng(args.seed + user)
+    operations = list(mix)
+    weights = [mix[name] for name in operations]
+    labels = sorted(workbooks)
+    client = make_client()
+    try:
+        sent = 0
+        while time.perf_counter() < deadline and (args.requests is None or sent < args.requests):
+            operation = operations[rng.choice(len(operations), p=weights)]
+            label = labels[rng.integers(len(labels))]
+            if operation == 'upload':
+                variants = workbooks[label]
+                call = ('POST', '/upload', None, variants[rng.integers(len(variants))])
+            else:
+                dataset_id, dates = datasets[label]
+                date1, date2 = rng.choice(dates, size=2, replace=False)
+                call = ('POST', '/compare', {"dataset_id": dataset_id, "date1": str(date1), "date2": str(date2)}, None)
+
+            request_start = time.perf_counter()
+            status, error, stages, body = None, None, {}, None
+            try:
+                status, body, timing = client.request(*call)
+                stages = parse_server_timing(timing)
+                if status != 200:
+                    error = f"{status}: {(body or {}).get('error', 'no JSON body')}"
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            cached = operation == 'upload' and (body or {}).get('ingest', {}).get('cache') == 'hit'
+            records.append((operation, label, time.perf_counter() - request_start, status, error, stages, cached))
+            sent += 1
+
+            if operation == 'upload' and status == 200 and body and body.get('dataset_id') and not args.keep_uploads:
+                # Release right away (untimed) so a long run does not pile up datasets
+                try:
+                    client.request('DELETE', f"/datasets/{body['dataset_id']}")
+                except Exception:
+                    pass
+            if args.think_time:
+                time.sleep(rng.exponential(args.think_time))
+    finally:
+        client.close()
+
+
+def run_level(users, make_client, mix, workbooks, datasets, args):
+    """Run users concurrent analysts; returns (records, wall seconds)"""
+    records = [[] for _ in range(users)]
+    start = time.perf_counter()
+    deadline = start + args.duration
+    threads = [
+        threading.Thread(target=virtual_user, args=(user, make_client, mix, workbooks, datasets, args,
+                                                    deadline, records[user]), daemon=True)
+        for user in range(users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [record for user_records in records for record in user_records], time.perf_counter() - start
+
+
+def summarize(records, wall_seconds):
+    """Latency percentiles, throughput and errors per operation (and 'all')"""
+    groups = {'all': records}
+    for record in records:
+        groups.setdefault(record[0], []).append(record)
+
+    summary = {}
+    for name, group in groups.items():
+        if not group:
+            continue
+        seconds = np.array([record[2] for record in group])
+        errors = [record[4] for record in group if record[4]]
+        p50, p95, p99 = np.percentile(seconds, [50, 95, 99]) * 1000
+        entry = {
+            "requests": len(group),
+            "errors": len(errors),
+            "error_rate": round(len(errors) / len(group), 4),
+            "throughput": round(len(group) / wall_seconds, 2),
+            "p50_ms": round(p50, 1),
+            "p95_ms": round(p95, 1),
+            "p99_ms": round(p99, 1),
+            "max_ms": round(seconds.max() * 1000, 1),
+            "error_samples": sorted(set(errors))[:MAX_ERROR_SAMPLES],
+        }
+        if name != 'all':
+            # Mean server-side stage times from the Server-Timing headers
+            stage_names = sorted({stage for record in group for stage in record[5]})
+            if name == 'upload':
+                entry["parse_cache_hits"] = sum(record[6] for record in group)
+            entry["stages_ms"] = {
+                stage: round(float(np.mean([record[5][stage] for record in group if stage in record[5]])), 1)
+                for stage in stage_names
+            }
+        summary[name] = entry
+    return summary
+
+
+def print_level(users, summary):
+    print(f"\n{users} user(s)")
+    print(f"  {'operation':<10} {'requests':>8} {'req/s':>8} {'errors':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'max ms':>9}")
+    for name, entry in summary.items():
+        print(f"  {name:<10} {entry['requests']:>8} {entry['throughput']:>8.2f} {entry['error_rate']:>8.1%} "
+              f"{entry['p50_ms']:>9.1f} {entry['p95_ms']:>9.1f} {entry['p99_ms']:>9.1f} {entry['max_ms']:>9.1f}")
+    for name, entry in summary.items():
+        if entry.get("stages_ms"):
+            stages = ', '.join(f"{stage} {ms:.1f}" for stage, ms in entry["stages_ms"].items())
+            print(f"  {name} server stages (mean ms): {stages}")
+        if entry.get("parse_cache_hits"):
+            print(f"  {name}: {entry['parse_cache_hits']} of {entry['requests']} answered from the parse cache")
+        for message in entry["error_samples"]:
+            print(f"  {name} error: {message}")
+
+
+def check(results, max_error_rate, max_p95_ms):
+    """Messages for concurrency levels over the error-rate or p95 limits"""
+    failures = []
+    for users, summary in results.items():
+        overall = summary.get('all')
+        if not overall:
+            continue
+        if overall["error_rate"] > max_error_rate:
+            failures.append(f"{users} user(s): error rate {overall['error_rate']:.1%} > {max_error_rate:.1%}")
+        if max_p95_ms is not None:
+            failures.extend(
+                f"{users} user(s): {name} p95 {entry['p95_ms']:.0f} ms > {max_p95_ms:.0f} ms"
+                for name, entry in summary.items() if name != 'all' and entry["p95_ms"] > max_p95_ms
+            )
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default=DEFAULT_URL, help="API base URL of a running server")
+    parser.add_argument('--start-server', action='store_true', help="start backend/serve.py for the run")
+    parser.add_argument('--in-process', action='store_true', help="call the app through the Flask test client")
+    parser.add_argument('--workers', type=int, default=2, help="server worker processes (--start-server)")
+    parser.add_argument('--threads', type=int, default=4, help="threads per server worker (--start-server)")
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'waitress'], default='auto')
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 4, 8], help="concurrency levels to run")
+    parser.add_argument('--duration', type=float, default=30, help="seconds per concurrency level")
+    parser.add_argument('--requests', type=int, help="stop each user after this many requests")
+    parser.add_argument('--mix', default='compare=9,upload=1', help="operation weights")
+    parser.add_argument('--days', type=int, nargs='+', default=[7], help="dataset sizes in days")
+    parser.add_argument('--sites', type=int, default=2)
+    parser.add_argument('--variants', type=int, default=3, help="distinct workbooks per dataset size")
+    parser.add_argument('--think-time', type=float, default=0, help="mean seconds between a user's requests")
+    parser.add_argument('--keep-uploads', action='store_true', help="do not release uploaded datasets")
+    parser.add_argument('--timeout', type=float, default=300, help="seconds per HTTP request")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--max-p95-ms', type=float, help="fail when an operation's p95 exceeds this")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args(argv)
+    if args.start_server and args.in_process:
+        parser.error("--start-server and --in-process are exclusive")
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    workdir = tempfile.mkdtemp(prefix='traffic-load-')
+    server = None
+    try:
+        if args.in_process:
+            for name in ('COLUMNAR_STORE_DIR', 'PARSE_CACHE_DIR', 'JOBS_DIR'):
+                os.environ[name] = os.path.join(workdir, name.lower())
+            # Per-request upload logs would drown the report
+            os.environ.setdefault('LOG_LEVEL', 'WARNING')
+            sys.path.insert(0, BACKEND_DIR)
+            import api
+            app = api.create_app()
+            make_client = lambda: InProcessClient(app)
+            target = "in-process app"
+        else:
+            try:
+                import requests  # noqa: F401
+            except ImportError:
+                print("❌ Error: 'requests' module not found")
+                print("Install it with: pip install requests")
+                return 1
+            url = args.url
+            if args.start_server:
+                server, url = start_server(args, workdir)
+            make_client = lambda: HttpClient(url, args.timeout)
+            target = url
+
+        start = time.perf_counter()
+        workbooks = make_workbooks(args.days, args.sites, args.variants, workdir)
+        print(f"Generated {sum(len(v) for v in workbooks.values())} workbook(s) "
+              f"({', '.join(workbooks)}, {args.sites} site(s)) in {time.perf_counter() - start:.1f}s")
+        client = make_client()
+        try:
+            datasets = prepare_datasets(client, workbooks)
+        finally:
+            client.close()
+
+        print(f"Load testing {target}: mix {args.mix}, {args.duration:g}s per level")
+        results = {}
+        for users in args.users:
+            records, wall_seconds = run_level(users, make_client, mix, workbooks, datasets, args)
+            results[users] = summarize(records, wall_seconds)
+            print_level(users, results[users])
+    finally:
+        if server is not None:
+            stop_server(server)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                "target": target, "mix": mix, "days": args.days, "sites": args.sites,
+                "workers": args.workers if args.start_server else None,
+                "threads": args.threads if args.start_server else None,
+                "levels": {str(users): summary for users, summary in results.items()},
+            }, f, indent=2)
+
+    failures = check(results, args.max_error_rate, args.max_p95_ms)
+    if failures:
+        print()
+        for message in failures:
+            print(f"❌ {message}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,12 +10,13 @@ import os
 import threading
 import time
 
-def start_backend():
-    """Start the Flask backend server"""
+def start_backend(production=False):
+    """Start the Flask backend server (serve.py worker pool in production mode)"""
     print("🚀 Starting Flask backend server...")
     try:
         os.chdir('backend')
-        result = subprocess.run([sys.executable, 'api.py'], capture_output=True, text=True)
+        script = 'serve.py' if production else 'api.py'
+        result = subprocess.run([sys.executable, script], capture_output=True, text=True)
         if result.returncode != 0:
             print(f"❌ Backend error: {result.stderr}")
         else:
@@ -69,6 +70,8 @@ def check_dependencies():
 
 def main():
     """Main function"""
+    production = '--production' in sys.argv
+    
     print("🏢 Traffic Analytics Dashboard - Development Setup")
     print("=" * 50)
     
@@ -88,8 +91,12 @@ def main():
     print("   - POST /api/upload - Upload Excel file")
     print("   - POST /api/compare - Compare dates")
     
+    if production:
+        print("\n🏭 Production mode: backend runs under serve.py (gunicorn/waitress worker pool)")
+        print("   Tune with API_WORKERS, API_THREADS, API_TIMEOUT and API_KEEPALIVE")
+    
     print("\n⏳ Starting backend server...")
-    start_backend()
+    start_backend(production)
 
 if __name__ == "__main__":
     main()
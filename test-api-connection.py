@@ -2,6 +2,10 @@
 """
 API Connection Test Script
 Tests all API endpoints to verify backend is running and accessible
+
+With --load, runs the load test in benchmarks/load_test.py instead
+(concurrent uploads and comparisons), e.g.:
+    python test-api-connection.py --load --start-server --workers 4 --users 1 8 32
 """
 import requests
 import sys
@@ -133,6 +137,15 @@ def check_frontend_config():
         print(f"   ℹ️  Run: python setup-frontend-env.py")
         return False
 
+def run_load_test(argv):
+    """Run benchmarks/load_test.py against API_BASE_URL unless --url/--start-server/--in-process is given"""
+    sys.path.insert(0, str(Path(__file__).parent / "benchmarks"))
+    import load_test
+    
+    if not any(arg in argv for arg in ('--url', '--start-server', '--in-process')):
+        argv = ['--url', API_BASE_URL] + argv
+    return load_test.main(argv)
+
 def main():
     """Main test runner"""
     print("=" * 70)
@@ -183,5 +196,7 @@ if __name__ == '__main__':
         print("Install it with: pip install requests")
         sys.exit(1)
     
+    if '--load' in sys.argv[1:]:
+        sys.exit(run_load_test([arg for arg in sys.argv[1:] if arg != '--load']))
     main()
 
@@ -0,0 +1,62 @@
+import os
+import sys
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def traffic_frame(start='2024-01-01', days=2, sensors=("A", "B")):
+    """Quarter-hourly counts per sensor, whole days from midnight"""
+    times = pd.date_range(start, periods=days * 96, freq='15min')
+    frame = pd.DataFrame({
+        "Site": "Main",
+        "Sensor": np.tile(list(sensors), len(times)),
+        "Traffic Start TS": np.repeat(times, len(sensors)),
+    })
+    frame["Traffic End TS"] = frame["Traffic Start TS"] + pd.Timedelta(minutes=15)
+    frame["Customer In"] = np.arange(len(frame)) % 11
+    frame["Customer Out"] = np.arange(len(frame)) % 7
+    return frame
+
+
+def traffic_workbook(**frame):
+    """traffic_frame as an .xlsx export, as upload bytes"""
+    buffer = io.BytesIO()
+    traffic_frame(**frame).to_excel(buffer, index=False)
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """The api module with empty stores under tmp_path"""
+    import api
+    from columnar_store import ColumnarStore
+    from dataset_store import DatasetStore
+    from parse_cache import ParseCache
+    monkeypatch.setattr(api, 'dataset_store', DatasetStore())
+    monkeypatch.setattr(api, 'parse_cache', ParseCache(str(tmp_path / 'parse_cache')))
+    monkeypatch.setattr(api, 'columnar_store', ColumnarStore(str(tmp_path / 'traffic_store')))
+    return api
+
+
+@pytest.fixture
+def client(api):
+    return api.create_app({"TESTING": True}).test_client()
+
+
+@pytest.fixture
+def upload(client):
+    """Upload a generated workbook (keyword arguments of traffic_workbook);
+    returns the JSON response"""
+    def upload(name='traffic.xlsx', query='', **workbook):
+        response = client.post(f'/api/upload{query}', data={"file": (traffic_workbook(**workbook), name)})
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()
+    return upload
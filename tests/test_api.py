@@ -0,0 +1,229 @@
+import json
+
+from conftest import traffic_frame
+
+
+def business_totals(frame, date):
+    """Customer In/Out of one date inside the default 8am-8pm window"""
+    ts = frame["Traffic Start TS"]
+    day = frame[(ts.dt.date.astype(str) == date) & (ts.dt.hour >= 8) & (ts.dt.hour < 20)]
+    return int(day["Customer In"].sum()), int(day["Customer Out"].sum())
+
+
+def rows(client, dataset_id, query=''):
+    response = client.get(f'/api/datasets/{dataset_id}/rows{query}')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_rebuilt_dataset_has_every_uploaded_column(api, client, upload):
+    # Another worker: no in-memory copy, only the shared columnar store
+    dataset_id = upload()["dataset_id"]
+    queries = ['?limit=40&offset=3', '?limit=25&sort=Source%20File&order=desc',
+               '?limit=25&columns=Source%20File,Traffic%20End%20TS,Customer%20In']
+    before = [rows(client, dataset_id, query) for query in queries]
+
+    api.dataset_store.delete(dataset_id)
+    after = [rows(client, dataset_id, query) for query in queries]
+    assert after == before
+    assert "Traffic End TS" in after[0]["columns"] and "Source Sheet" in after[0]["columns"]
+
+
+def test_negotiation_falls_back_to_json(monkeypatch, client, upload):
+    import negotiation
+    monkeypatch.setattr(negotiation, 'msgpack', None)
+    monkeypatch.setattr(negotiation, 'pa', None)
+    dataset_id = upload()["dataset_id"]
+    for accept in ('application/msgpack', 'application/vnd.apache.arrow.stream', '*/*'):
+        response = client.get(f'/api/datasets/{dataset_id}/rows?limit=5', headers={"Accept": accept})
+        assert response.status_code == 200
+        assert response.mimetype == 'application/json'
+        assert len(response.get_json()["rows"]) == 5
+
+
+def test_explicit_arrow_format_needs_pyarrow(monkeypatch, client, upload):
+    import serialization
+    monkeypatch.setattr(serialization, 'pa', None)
+    dataset_id = upload()["dataset_id"]
+    response = client.get(f'/api/datasets/{dataset_id}/rows?format=arrow')
+    assert response.status_code == 400
+    assert "requirements-optional.txt" in response.get_json()["error"]
+
+
+def test_ndjson_rows(client, upload):
+    dataset_id = upload()["dataset_id"]
+    response = client.get(f'/api/datasets/{dataset_id}/rows', headers={"Accept": 'application/x-ndjson'})
+    assert response.mimetype == 'application/x-ndjson'
+    header, *lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == json.loads(header)["total"] > 0
+
+
+def test_compare_rejects_malformed_rules(client, upload):
+    dataset_id = upload()["dataset_id"]
+    body = {"dataset_id": dataset_id, "date1": "2024-01-01", "date2": "2024-01-02"}
+    for rules in ([1], [["zscore"]], "zscore"):
+        response = client.post('/api/compare', json=dict(body, rules=rules))
+        assert response.status_code == 400, rules
+    assert client.post('/api/compare', json=dict(body, rules=["zero", {"rule": "ratio", "threshold": 3}])).status_code == 200
+
+
+def test_anomalies_report_baseline_percentiles(client, upload):
+    dataset_id = upload(days=35)["dataset_id"]
+    response = client.post('/api/anomalies', json={"dataset_id": dataset_id, "date_from": "2024-01-29",
+                                                   "date_to": "2024-02-04", "min_weeks": 2})
+    assert response.status_code == 200, response.get_json()
+    result = response.get_json()
+    assert [day["baselineDays"] for day in result["summary"]] == [4] * 7
+    baseline = result["baseline"]["customerIn"]
+    slots, dates = len(result["time_slots"]), len(result["dates"])
+    for stat in ("median", "p10", "p90"):
+        assert len(baseline[stat]) == slots and all(len(row) == dates for row in baseline[stat])
+    assert all(low <= mid <= high for low, mid, high in zip(baseline["p10"][0], baseline["median"][0], baseline["p90"][0]))
+
+    # The first week has no earlier days: no baseline, nothing scored
+    first = client.post('/api/anomalies', json={"dataset_id": dataset_id, "dates": ["2024-01-01"]}).get_json()
+    assert first["baseline"]["customerIn"]["p90"][0] == [None]
+    assert first["summary"][0]["scored"] is False
+
+
+def test_append_in_memory_matches_rebuild(api, client, upload):
+    dataset_id = upload(days=3)["dataset_id"]
+    # Overlapping days replace stored rows; an earlier day is placed before them
+    upload(query=f'?append={dataset_id}', start='2024-01-02', days=3)
+    result = upload(query=f'?append={dataset_id}', start='2023-12-31', days=1, sensors=("A", "C"))
+    assert result["available_dates"][0] == '2023-12-31' and result["available_dates"][-1] == '2024-01-04'
+
+    queries = ['?limit=60&offset=40', '?limit=30&sort=Sensor', '?limit=30&sort=Customer%20In&order=desc',
+               '?limit=30&date=2024-01-02&columns=Sensor,Traffic%20Start%20TS,Customer%20In,Source%20File']
+    merged = [rows(client, dataset_id, query) for query in queries]
+    assert merged[0]["total"] == 5 * 48 * 2
+    assert merged[0]["columns"] == result["columns"]
+    assert api.dataset_store.get(dataset_id).meta["store_version"] == 3
+
+    api.dataset_store.delete(dataset_id)
+    assert [rows(client, dataset_id, query) for query in queries] == merged
+
+
+def test_append_drops_a_stale_copy(api, client, upload):
+    dataset_id = upload()["dataset_id"]
+    # Another worker appended since this copy was made
+    api.dataset_store.get(dataset_id).meta["store_version"] = 0
+    result = upload(query=f'?append={dataset_id}', start='2024-01-03')
+    assert api.dataset_store.get(dataset_id) is None
+    page = rows(client, dataset_id, '?limit=1')
+    assert page["total"] == 4 * 48 * 2
+    assert page["columns"] == result["columns"]
+
+
+def test_upload_returns_metadata_and_rows_url(client, upload):
+    result = upload(days=3)
+    assert result["success"] is True
+    assert result["rows_url"] == f'/api/datasets/{result["dataset_id"]}/rows'
+    assert result["available_dates"] == ['2024-01-01', '2024-01-02', '2024-01-03']
+    assert result["original_records"] == 3 * 96 * 2
+    assert result["total_records"] == result["filtered_records"] == 3 * 48 * 2
+    assert len(result["preview_data"]) == 10 and "data" not in result
+    assert result["schema"]["timestamp"] == "Traffic Start TS"
+    assert rows(client, result["dataset_id"], '?limit=1')["total"] == result["filtered_records"]
+
+
+def test_compare_by_dataset_id(api, client, upload):
+    dataset_id = upload(days=3)["dataset_id"]
+    response = client.post('/api/compare', json={"dataset_id": dataset_id, "date1": "2024-01-01", "date2": "2024-01-03"})
+    assert response.status_code == 200, response.get_json()
+    result = response.get_json()
+    assert result["total_slots"] == len(result["comparison_data"]) == 48
+
+    frame = traffic_frame(days=3)
+    expected = {date: business_totals(frame, date) for date in ("2024-01-01", "2024-01-03")}
+    summary = result["summary"]
+    assert (summary["date1"]["customerIn"], summary["date1"]["customerOut"]) == expected["2024-01-01"]
+    assert (summary["date2"]["customerIn"], summary["date2"]["customerOut"]) == expected["2024-01-03"]
+    assert summary["differences"]["customerIn"] == expected["2024-01-03"][0] - expected["2024-01-01"][0]
+
+    # A worker without the in-memory copy answers the same from the columnar store
+    api.dataset_store.delete(dataset_id)
+    assert client.post('/api/compare', json={"dataset_id": dataset_id, "date1": "2024-01-01",
+                                             "date2": "2024-01-03"}).get_json() == result
+
+    missing = client.post('/api/compare', json={"dataset_id": "unknown", "date1": "2024-01-01", "date2": "2024-01-03"})
+    assert missing.status_code == 404
+    no_data = client.post('/api/compare', json={"dataset_id": dataset_id, "date1": "2024-01-01", "date2": "2024-02-01"})
+    assert no_data.status_code == 400
+
+
+def test_rows_pages_with_cursors(client, upload):
+    dataset_id = upload(days=2)["dataset_id"]
+    query = '?limit=40&sort=Customer%20In&order=desc&columns=Sensor,Customer%20In'
+    page = rows(client, dataset_id, query)
+    assert page["columns"] == ["Sensor", "Customer In"] and set(page["rows"][0]) == {"Sensor", "Customer In"}
+
+    seen = page["rows"]
+    while page["next_cursor"]:
+        page = rows(client, dataset_id, f'{query}&cursor={page["next_cursor"]}')
+        seen += page["rows"]
+    assert len(seen) == page["total"] == 2 * 48 * 2
+    values = [row["Customer In"] for row in seen]
+    assert values == sorted(values, reverse=True)
+
+    # A cursor only fits the query it was issued for
+    first = rows(client, dataset_id, query)
+    response = client.get(f'/api/datasets/{dataset_id}/rows?limit=40&cursor={first["next_cursor"]}')
+    assert response.status_code == 400
+
+
+def test_rows_filters_and_rejects_unknown_columns(client, upload):
+    dataset_id = upload(days=3)["dataset_id"]
+    page = rows(client, dataset_id, '?date=2024-01-02&hour_from=9&hour_to=11&limit=500')
+    assert page["total"] == 2 * 4 * 2
+    assert {row["Date"] for row in page["rows"]} == {"2024-01-02"}
+    for query in ('?columns=Nope', '?sort=Nope', '?limit=0', '?offset=-1', '?layout=nope'):
+        assert client.get(f'/api/datasets/{dataset_id}/rows{query}').status_code == 400, query
+    assert client.get('/api/datasets/unknown/rows').status_code == 404
+
+
+def test_batch_matches_pairwise_compares(client, upload):
+    dataset_id = upload(days=4)["dataset_id"]
+    response = client.post('/api/compare/batch', json={"dataset_id": dataset_id, "baseline": "2024-01-01",
+                                                        "date_from": "2024-01-01", "date_to": "2024-01-04"})
+    assert response.status_code == 200, response.get_json()
+    batch = response.get_json()
+    assert batch["dates"] == ["2024-01-02", "2024-01-03", "2024-01-04"]
+
+    for column, date in enumerate(batch["dates"]):
+        pair = client.post('/api/compare', json={"dataset_id": dataset_id, "date1": "2024-01-01",
+                                                 "date2": date}).get_json()["comparison_data"]
+        assert [row["date1Value"] for row in pair] == batch["baseline_values"]["customerIn"]
+        assert [row["date2Value"] for row in pair] == [slot[column] for slot in batch["values"]["customerIn"]]
+        assert [row["date2OutValue"] for row in pair] == [slot[column] for slot in batch["values"]["customerOut"]]
+        assert [row["should_highlight"] for row in pair] == [slot[column] for slot in batch["should_highlight"]]
+
+    assert client.post('/api/compare/batch', json={"dataset_id": dataset_id, "baseline": "2024-01-01",
+                                                   "dates": ["2024-03-01"]}).status_code == 400
+
+
+def test_query_groups_match_pandas(client, upload):
+    dataset_id = upload(days=3)["dataset_id"]
+    frame = traffic_frame(days=3)
+    ts = frame["Traffic Start TS"]
+
+    def query(**body):
+        response = client.post('/api/query', json=dict(body, dataset_id=dataset_id))
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()
+
+    daily = query(group_by=["date"], order_by="date", order="asc")
+    expected = frame.groupby(ts.dt.date.astype(str))[["Customer In", "Customer Out"]].sum()
+    assert [(row["date"], row["customer_in"], row["customer_out"]) for row in daily["rows"]] == [
+        (date, int(values["Customer In"]), int(values["Customer Out"])) for date, values in expected.iterrows()]
+    assert daily["rows_scanned"] == len(frame)
+
+    # Each sensor's busiest business hour
+    peaks = query(group_by=["sensor", "hour"], order_by="customer_in", top_per=["sensor"], limit=1,
+                  business_hours=True)
+    business = frame[(ts.dt.hour >= 8) & (ts.dt.hour < 20)]
+    hourly = business.groupby([business["Sensor"], business["Traffic Start TS"].dt.hour])["Customer In"].sum()
+    assert {row["sensor"]: row["customer_in"] for row in peaks["rows"]} == hourly.groupby(level=0).max().to_dict()
+
+    assert client.post('/api/query', json={"dataset_id": dataset_id, "group_by": ["nope"]}).status_code == 400
+    assert client.post('/api/query', json={"dataset_id": "unknown"}).status_code == 404
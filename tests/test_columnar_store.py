@@ -0,0 +1,171 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import columnar_store
+from baselines import BASELINE_WEEKS, affected_days, window_stats
+from columnar_store import COLUMNS, ColumnarStore, epoch_day
+from rollups import ROLLUP_ARRAYS, build_rollup
+
+ROLES = {"timestamp": "TS", "customer_in": "In", "customer_out": "Out", "site": "Site", "sensor": "Sensor"}
+
+
+def traffic(start, days, sensors=("A", "B"), offset=0):
+    """Quarter-hourly rows from 06:00 to 22:00 for each sensor"""
+    times = [ts for day in pd.date_range(start, periods=days, freq='D')
+             for ts in pd.date_range(day + pd.Timedelta(hours=6), periods=64, freq='15min')]
+    frame = pd.DataFrame([(ts, sensor) for ts in times for sensor in sensors], columns=["TS", "Sensor"])
+    frame["Site"] = "Main"
+    frame["In"] = np.arange(len(frame)) % 17 + offset
+    frame["Out"] = np.arange(len(frame)) % 13 + offset
+    return frame
+
+
+def assert_same(stored, expected):
+    for name in COLUMNS:
+        np.testing.assert_array_equal(np.asarray(getattr(stored, name)), np.asarray(getattr(expected, name)))
+    np.testing.assert_array_equal(stored.days, expected.days)
+    np.testing.assert_array_equal(stored.day_offsets, expected.day_offsets)
+    for name, values in expected.rollup.items():
+        np.testing.assert_array_equal(stored.rollup[name], values)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ColumnarStore(str(tmp_path / "store"))
+
+
+def test_append_matches_single_write(store):
+    first, second = traffic('2024-01-01', 10), traffic('2024-01-08', 10, offset=100)
+    store.write('appended', first, ROLES)
+    assert store.append('appended', second, ROLES) == [str(day.date()) for day in pd.date_range('2024-01-08', periods=10)]
+
+    # Appended rows replace stored rows with the same sensor and timestamp
+    union = pd.concat([first, second]).drop_duplicates(["Sensor", "TS"], keep='last')
+    store.write('union', union, ROLES)
+    stored = store.open('appended')
+    assert_same(stored, store.open('union'))
+    assert len(stored.segment_names) == 2
+    assert stored.version == 2
+    assert store.version('appended') == 2
+
+
+def test_append_writes_only_affected_days(store):
+    store.write('ds', traffic('2024-01-01', 30), ROLES)
+    store.append('ds', traffic('2024-02-05', 2), ROLES)
+    stored = store.open('ds')
+    new_segment = np.load(f"{store.directory}/ds/{stored.segment_names[-1]}/ts.npy")
+    assert len(new_segment) == 2 * 64 * 2
+    assert len(stored) == 32 * 64 * 2
+
+
+def test_slices_across_segments(store):
+    store.write('ds', traffic('2024-01-01', 4), ROLES)
+    store.append('ds', traffic('2024-01-03', 4, offset=50), ROLES)
+    stored = store.open('ds')
+    values = np.asarray(stored.customer_in)
+    for rows in (slice(0, len(stored)), slice(100, 700), slice(255, 257), slice(300, 300)):
+        np.testing.assert_array_equal(stored.customer_in[rows], values[rows])
+    day = stored.day('2024-01-04')
+    assert len(day["ts"]) == 128 and day["customer_in"].min() >= 50
+    assert len(stored.frame()) == len(stored)
+
+
+def test_compaction(store, monkeypatch):
+    monkeypatch.setattr(columnar_store, 'MAX_SEGMENTS', 3)
+    store.write('ds', traffic('2024-01-01', 2), ROLES)
+    frames = [traffic('2024-01-01', 2)]
+    for i in range(1, 5):
+        frames.append(traffic(f'2024-01-0{i + 2}', 1, offset=i))
+        store.append('ds', frames[-1], ROLES)
+    stored = store.open('ds')
+    assert len(stored.segment_names) < 3
+    store.write('union', pd.concat(frames), ROLES)
+    assert_same(stored, store.open('union'))
+
+
+def test_superseded_rows_trigger_compaction(store):
+    store.write('ds', traffic('2024-01-01', 1), ROLES)
+    store.append('ds', traffic('2024-01-01', 1, offset=5), ROLES)
+    assert len(store.open('ds').segment_names) == 2
+    # Rewriting the only stored day again leaves more superseded rows than live ones
+    store.append('ds', traffic('2024-01-01', 1, offset=9), ROLES)
+    stored = store.open('ds')
+    assert len(stored.segment_names) == 1
+    assert stored.customer_in.min() == 9
+    assert sorted(os.listdir(os.path.join(store.directory, 'ds'))) == ['meta.json'] + stored.segment_names
+    assert stored.stored_rows == len(stored)
+    rollup = build_rollup(np.asarray(stored.ts), np.asarray(stored.customer_in), np.asarray(stored.customer_out))
+    np.testing.assert_array_equal(stored.rollup["daily_in"], rollup["daily_in"])
+
+
+def test_concurrent_appends(store):
+    store.write('ds', traffic('2024-01-01', 1), ROLES)
+    threads = [threading.Thread(target=store.append, args=('ds', traffic(f'2024-01-{day:02d}', 1), ROLES))
+               for day in range(2, 10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stored = store.open('ds')
+    assert stored.dates == [f'2024-01-{day:02d}' for day in range(1, 10)]
+    assert stored.version == 9
+
+
+def test_append_to_missing_dataset(store):
+    assert store.append('missing', traffic('2024-01-01', 1), ROLES) is None
+
+
+def test_missing_counts_stay_missing(store):
+    first = traffic('2024-01-01', 2).astype({"In": float})
+    first.loc[[3, 70], "In"] = np.nan
+    store.write('ds', first, ROLES)
+    frame = store.open('ds').frame()
+    assert frame["In"].isna().sum() == 2
+    assert frame["Out"].notna().all()
+    assert store.open('ds').rollup["daily_in"].sum() == first["In"].sum()
+
+    # Masks survive appends that span segments and compaction
+    store.append('ds', traffic('2024-01-03', 1), ROLES)
+    assert store.open('ds').frame()["In"].isna().sum() == 2
+    store.append('ds', traffic('2024-01-01', 2), ROLES)
+    assert store.open('ds').frame()["In"].notna().all()
+
+
+def test_extra_columns_survive_appends(store):
+    first = traffic('2024-01-01', 2).assign(File="a.xlsx", End=lambda f: f["TS"] + pd.Timedelta(minutes=15))
+    store.write('ds', first, ROLES, extra_columns=["File", "End"])
+    frame = store.open('ds').frame()
+    assert list(frame.columns) == list(first.columns)
+    assert (frame["File"] == "a.xlsx").all()
+    pd.testing.assert_series_equal(frame["End"], first["End"], check_dtype=False)
+
+    # A new column is empty for the stored rows; compaction keeps the values
+    second = traffic('2024-01-02', 2, offset=100).assign(File="b.xlsx", Sheet="Sheet1")
+    store.append('ds', second, ROLES, extra_columns=["File", "Sheet"])
+    frame = store.open('ds').frame()
+    assert frame["File"].value_counts().to_dict() == {"b.xlsx": len(second), "a.xlsx": len(first) // 2}
+    assert frame["Sheet"].isna().sum() == len(first) // 2
+    assert frame["End"].isna().sum() == len(second)
+    for _ in range(2):
+        store.append('ds', second, ROLES, extra_columns=["File", "Sheet"])
+    assert len(store.open('ds').segment_names) == 1
+    pd.testing.assert_frame_equal(store.open('ds').frame(), frame)
+
+
+def test_baselines_follow_appends(store):
+    store.write('ds', traffic('2024-01-01', 28), ROLES)
+    store.append('ds', traffic('2024-01-29', 35, offset=5), ROLES)
+    # A backfilled day changes the windows of the same weekday's later days
+    store.append('ds', traffic('2024-01-10', 1, offset=50), ROLES)
+    rollup = store.open('ds').rollup
+    for name, values in window_stats({name: rollup[name] for name in ROLLUP_ARRAYS}).items():
+        np.testing.assert_array_equal(rollup[name], values, err_msg=name)
+
+    # The day itself and the next BASELINE_WEEKS stored days on its weekday
+    affected = rollup["days"][affected_days(rollup, [epoch_day('2024-01-03')])]
+    assert list(affected.astype('datetime64[D]').astype(str)) == [
+        str(day.date()) for day in pd.date_range('2024-01-03', periods=BASELINE_WEEKS + 1, freq='7D')]
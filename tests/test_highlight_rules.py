@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from baselines import trailing_windows
+from columnar_store import ColumnarStore, epoch_day
+from highlight_rules import build_rules, trailing_history
+from time_buckets import DEFAULT_BUCKETS
+
+ROLES = {"timestamp": "TS", "customer_in": "In", "customer_out": "Out"}
+
+
+def test_zscore_history_is_the_anomaly_baseline_window(tmp_path):
+    # Six weeks of days with two Mondays missing, so calendar weeks and stored days differ
+    days = [day for day in pd.date_range('2024-01-01', '2024-02-12')
+            if day not in (pd.Timestamp('2024-01-15'), pd.Timestamp('2024-01-29'))]
+    times = [day + pd.Timedelta(minutes=minute) for day in days for minute in range(8 * 60, 20 * 60, 15)]
+    frame = pd.DataFrame({"TS": times, "In": np.arange(len(times)) % 23, "Out": np.arange(len(times)) % 19})
+    store = ColumnarStore(str(tmp_path / "store"))
+    store.write('ds', frame, ROLES)
+    stored = store.open('ds')
+
+    history_in, history_out = trailing_history(stored, ['2024-02-12'], 4, DEFAULT_BUCKETS)
+    window = trailing_windows(stored.rollup, [epoch_day('2024-02-12')], 4)[0]
+    assert list(stored.rollup["days"][window[window >= 0]].astype('datetime64[D]').astype(str)) == [
+        '2024-01-01', '2024-01-08', '2024-01-22', '2024-02-05']
+    np.testing.assert_array_equal(history_in[0], stored.rollup["slots_in"][window])
+    np.testing.assert_array_equal(history_out[0], stored.rollup["slots_out"][window])
+
+    # Fewer earlier days than weeks: the oldest entries are NaN
+    history_in, _ = trailing_history(stored, ['2024-01-08'], 4, DEFAULT_BUCKETS)
+    assert np.isnan(history_in[0, :3]).all() and not np.isnan(history_in[0, 3]).any()
+
+
+@pytest.mark.parametrize("spec", [1, None, ["zscore"], 2.5])
+def test_build_rules_rejects_malformed_specs(spec):
+    with pytest.raises(ValueError):
+        build_rules([spec])
@@ -0,0 +1,65 @@
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from ingest import read_xlsx
+from schema import SAMPLE_SIZE, infer_schema, schema_timestamps
+
+SENSORS = 250
+
+
+def sensor_export(days=2):
+    """Time-sorted quarter-hourly rows for SENSORS sensors from midnight, so
+    the first SENSORS rows all fall on 00:00"""
+    times = pd.date_range('2024-01-12', periods=days * 96, freq='15min')
+    frame = pd.DataFrame({
+        "Site": "Main",
+        "Sensor": np.tile([f"S{i:03d}" for i in range(SENSORS)], len(times)),
+        "Traffic Start TS": np.repeat(times, SENSORS),
+    })
+    frame["Customer In"] = np.arange(len(frame)) % 11
+    frame["Customer Out"] = np.arange(len(frame)) % 7
+    return frame
+
+
+def test_midnight_rows_beyond_the_sample():
+    frame = sensor_export()
+    assert SENSORS > SAMPLE_SIZE
+    assert infer_schema(frame)["timestamp"] == "Traffic Start TS"
+
+
+def test_day_first_text_timestamps():
+    frame = sensor_export()
+    frame["Traffic Start TS"] = frame["Traffic Start TS"].dt.strftime('%d/%m/%Y %H:%M')
+    schema = infer_schema(frame)
+    assert schema["timestamp"] == "Traffic Start TS"
+    assert schema["formats"]["timestamp"] == '%d/%m/%Y %H:%M'
+    assert schema_timestamps(frame, schema).notna().all()
+
+
+def test_ingest_timestamp_is_kept():
+    # A daily export: every timestamp is midnight, but ingest found the column
+    frame = pd.DataFrame({
+        "Reading": pd.date_range('2024-01-01', periods=30, freq='D'),
+        "Customer In": 1,
+        "Customer Out": 1,
+    })
+    assert infer_schema(frame)["timestamp"] is None
+    assert infer_schema(frame, {"timestamp": "Reading"})["timestamp"] == "Reading"
+
+
+def test_read_xlsx_leaves_text_timestamps_to_the_schema(tmp_path):
+    path = tmp_path / "day_first.xlsx"
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["Site", "Sensor", "Traffic Start TS", "Traffic End TS", "Customer In", "Customer Out"])
+    times = pd.date_range('2024-01-05 08:00', periods=20, freq='D')
+    for ts in times:
+        sheet.append(["Main", "A", ts.strftime('%d/%m/%Y %H:%M'), "", 3, 4])
+    workbook.save(path)
+
+    df, stats = read_xlsx(str(path))
+    timestamp = stats["traffic_columns"]["timestamp"]
+    assert not pd.api.types.is_datetime64_any_dtype(df[timestamp])
+    parsed = schema_timestamps(df, infer_schema(df, stats["traffic_columns"]))
+    assert list(parsed) == list(times)